@@ -0,0 +1,161 @@
+"""
+Benchmarks the fact table builders of the process lambda on synthetic
+ingested tables.
+
+Usage, from the root of the repository:
+
+    python -m benchmark.facts --rows 1000000
+
+The tables have the columns and value formats of the ToteSys source tables as
+ingested, so no database or S3 is needed. Each builder runs '--repeat' times on
+a fresh copy of its table, and the fastest run is reported in rows per second;
+run it on two commits to compare them builder by builder.
+"""
+
+import argparse
+import sys
+import time
+import numpy as np
+import pandas as pd
+from src.process import (
+    get_fact_payment,
+    get_fact_purchase_order,
+    get_fact_sales_order,
+)
+
+
+def get_timestamps(rows, seconds=0):
+    return (
+        pd.Series(
+            pd.date_range("2022-11-03 14:20:49.962", periods=rows, freq="s")
+            + pd.Timedelta(seconds=seconds)
+        )
+        .dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+        .astype(object)
+    )
+
+
+def get_dates(rows, start):
+    days = pd.to_timedelta(np.arange(rows) % 1000, unit="D")
+    return (pd.Timestamp(start) + days).strftime("%Y-%m-%d").astype(object)
+
+
+def get_tables(rows):
+    """
+    Generates the ingested fact source tables.
+
+    Parameters:
+    - rows (int): The number of rows of each table.
+
+    Returns:
+    - dict: The dataframes, keyed by builder name.
+    """
+    ids = np.arange(1, rows + 1)
+    common = {
+        "created_at": get_timestamps(rows),
+        "last_updated": get_timestamps(rows, 3600),
+        "counterparty_id": 1 + ids % 20,
+        "currency_id": 1 + ids % 3,
+    }
+    return {
+        "get_fact_sales_order": pd.DataFrame(
+            {
+                "sales_order_id": ids,
+                **common,
+                "design_id": 1 + ids % 500,
+                "staff_id": 1 + ids % 20,
+                "units_sold": 1000 + ids % 99000,
+                "unit_price": 2 + (ids % 300) / 100,
+                "agreed_delivery_date": get_dates(rows, "2022-11-05"),
+                "agreed_payment_date": get_dates(rows, "2022-11-08"),
+                "agreed_delivery_location_id": 1 + ids % 30,
+            }
+        ),
+        "get_fact_purchase_order": pd.DataFrame(
+            {
+                "purchase_order_id": ids,
+                **common,
+                "staff_id": 1 + ids % 20,
+                "item_code": "ITEM" + pd.Series(ids % 10000).astype(str),
+                "item_quantity": 1 + ids % 1000,
+                "item_unit_price": 100 + (ids % 90000) / 100,
+                "agreed_delivery_date": get_dates(rows, "2022-11-05"),
+                "agreed_payment_date": get_dates(rows, "2022-11-08"),
+                "agreed_delivery_location_id": 1 + ids % 30,
+            }
+        ),
+        "get_fact_payment": pd.DataFrame(
+            {
+                "payment_id": ids,
+                **common,
+                "transaction_id": ids,
+                "payment_amount": (ids % 1000000) / 100,
+                "payment_type_id": 1 + ids % 4,
+                "paid": ids % 3 == 0,
+                "payment_date": get_dates(rows, "2022-11-08"),
+                "company_ac_number": 10000000 + ids % 89999999,
+                "counterparty_ac_number": 10000000 + (ids * 7) % 89999999,
+            }
+        ),
+    }
+
+
+BUILDERS = {
+    "get_fact_sales_order": get_fact_sales_order,
+    "get_fact_purchase_order": get_fact_purchase_order,
+    "get_fact_payment": get_fact_payment,
+}
+
+
+def measure(builder_name, df, repeat):
+    """
+    Times a builder on fresh copies of its table.
+
+    Parameters:
+    - builder_name (str): The name of the builder, see BUILDERS.
+    - df (pandas.DataFrame): The ingested table.
+    - repeat (int): The number of runs.
+
+    Returns:
+    - dict: The measurements of the fastest run.
+    """
+    best = None
+    for _ in range(repeat):
+        table = df.copy()
+        started = time.perf_counter()
+        BUILDERS[builder_name](table)
+        seconds = time.perf_counter() - started
+        best = seconds if best is None else min(best, seconds)
+    return {
+        "case": builder_name,
+        "rows": len(df),
+        "seconds": round(best, 3),
+        "rows_per_second": round(len(df) / best) if best else None,
+    }
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark.facts",
+        description="Benchmark the fact table builders of the process lambda.",
+    )
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=3)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    tables = get_tables(args.rows)
+    for builder_name, df in tables.items():
+        result = measure(builder_name, df, args.repeat)
+        print(
+            f"{result['case']:<34} {result['rows']:>10} rows "
+            f"{result['seconds']:>9.3f} s {result['rows_per_second'] or 0:>10} rows/s",
+            flush=True,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+"""
+Benchmarks the ingest path against a seeded local Postgres and a moto server
+standing in for S3 and Secrets Manager.
+
+Usage, from the root of the repository:
+
+    python -m benchmark.run --rows 100000
+
+The database is reached through the 'db_*' secrets, like the deployed lambda,
+so Postgres must listen on port 5432 of '--db-host'. The moto server needs
+'moto[server]', see 'make benchmark-setup'. Each case runs in a fresh process,
+so its peak RSS is its own; it reports the rows it handled per second, its peak
+RSS and the S3 requests it made, by operation. The lambda handler runs with the
+extraction settings of the environment, and 'RUN_METRICS=manifest' to count the
+rows it fetched, e.g.
+
+    INGEST_FORMAT=ndjson.gz EXTRACT_CONCURRENCY=4 python -m benchmark.run
+
+so two settings, or two commits, can be compared case by case. '--output'
+also writes the results as JSON.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import resource
+import sys
+import time
+from collections import Counter
+import boto3
+import pg8000.native
+from benchmark.totesys import FACT_TABLES, seed, add_changes
+
+
+HANDLER_BUCKET = "benchmark-handler"
+UPDATE_BUCKET = "benchmark-update"
+UPDATE_DATE = "2024-01-01 00:00"
+
+
+def get_peak_rss_mib():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def count_s3_requests():
+    """
+    Counts the requests made by the shared S3 client of the ingest lambda.
+
+    Returns:
+    - Counter: The number of requests by operation name, updated as they are
+    made.
+    """
+    from src.aws_clients import get_s3_client
+
+    requests = Counter()
+    get_s3_client().meta.events.register(
+        "before-call.s3", lambda model, **kwargs: requests.update([model.name])
+    )
+    return requests
+
+
+def case_get_dict_table(table_name):
+    from src.extract import db_connection, get_dict_table
+
+    conn = db_connection.get()
+    dict_table = get_dict_table(conn, table_name)
+    return len(next(iter(dict_table.values()), []))
+
+
+def setup_update_dict_table(table_name):
+    from src.extract import db_connection, get_dict_table, store_table_in_bucket
+
+    dict_table = get_dict_table(db_connection.get(), table_name)
+    store_table_in_bucket(UPDATE_BUCKET, dict_table, table_name, UPDATE_DATE)
+    return 0
+
+
+def case_update_dict_table(table_name):
+    from src.extract import db_connection, update_dict_table
+
+    _, dict_table = update_dict_table(
+        UPDATE_BUCKET, table_name, UPDATE_DATE, db_connection.get()
+    )
+    return len(next(iter(dict_table.values()), []))
+
+
+def case_lambda_handler():
+    from src.extract import lambda_handler
+
+    os.environ["S3_INGEST_BUCKET"] = HANDLER_BUCKET
+    os.environ["RUN_METRICS"] = "manifest"
+    response = lambda_handler({}, None)
+    if "err" in response:
+        raise RuntimeError(response["err"])
+    return sum(table["rows"] for table in response["run"]["tables"].values())
+
+
+CASES = {
+    "get_dict_table": case_get_dict_table,
+    "setup_update_dict_table": setup_update_dict_table,
+    "update_dict_table": case_update_dict_table,
+    "lambda_handler": case_lambda_handler,
+}
+
+
+def run_case(results, case_name, args):
+    """
+    Runs one case and reports its measurements. Called in a fresh process.
+
+    Parameters:
+    - results (multiprocessing.Queue): The queue to put the measurements on.
+    - case_name (str): The name of the case, see CASES.
+    - args (tuple): The arguments of the case.
+    """
+    try:
+        requests = count_s3_requests()
+        baseline_rss = get_peak_rss_mib()
+        started = time.perf_counter()
+        rows = CASES[case_name](*args)
+        seconds = time.perf_counter() - started
+        results.put(
+            {
+                "rows": rows,
+                "seconds": round(seconds, 3),
+                "rows_per_second": round(rows / seconds) if seconds else None,
+                "peak_rss_mib": round(get_peak_rss_mib(), 1),
+                "baseline_rss_mib": round(baseline_rss, 1),
+                "s3_requests": dict(sorted(requests.items())),
+            }
+        )
+    except Exception as e:
+        results.put({"error": f"{type(e).__name__}: {e}"})
+
+
+def measure(label, case_name, *args):
+    """
+    Runs a case in a fresh process and prints its measurements.
+
+    Parameters:
+    - label (str): The label of the result.
+    - case_name (str): The name of the case, see CASES.
+    - args: The arguments of the case.
+
+    Returns:
+    - dict: The measurements, under 'case'.
+    """
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=run_case, args=(results, case_name, args))
+    process.start()
+    while True:
+        try:
+            outcome = results.get(timeout=1)
+            break
+        except queue.Empty:
+            if not process.is_alive():
+                outcome = {"error": f"process exited with code {process.exitcode}"}
+                break
+    process.join()
+    result = {"case": label, **outcome}
+    print_result(result)
+    return result
+
+
+def print_result(result):
+    if "error" in result:
+        print(f"{result['case']:<34} failed: {result['error']}")
+        return
+    requests = sum(result["s3_requests"].values())
+    print(
+        f"{result['case']:<34} {result['rows']:>10} rows "
+        f"{result['seconds']:>9.3f} s {result['rows_per_second'] or 0:>10} rows/s "
+        f"{result['peak_rss_mib']:>8.1f} MiB {requests:>6} S3 requests",
+        flush=True,
+    )
+
+
+def start_moto_server(port):
+    """
+    Starts a moto server and points every AWS client of this process and its
+    children at it.
+
+    Parameters:
+    - port (int): The port to listen on.
+
+    Returns:
+    - ThreadedMotoServer: The running server.
+    """
+    from moto.server import ThreadedMotoServer
+
+    server = ThreadedMotoServer(ip_address="127.0.0.1", port=port, verbose=False)
+    server.start()
+    os.environ["AWS_ENDPOINT_URL"] = f"http://127.0.0.1:{port}"
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY"):
+        os.environ.setdefault(name, "testing")
+    return server
+
+
+def create_resources(args):
+    s3 = boto3.client("s3", region_name="eu-west-2")
+    for bucket in (HANDLER_BUCKET, UPDATE_BUCKET):
+        s3.create_bucket(
+            Bucket=bucket,
+            CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+        )
+    sm = boto3.client("secretsmanager", region_name="eu-west-2")
+    secrets = {
+        "db_name": args.db_name,
+        "db_host": args.db_host,
+        "db_user": args.db_user,
+        "db_pass": args.db_password,
+    }
+    for name, value in secrets.items():
+        sm.create_secret(Name=name, SecretString=value)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmark.run",
+        description="Benchmark the ingest lambda against a seeded Postgres.",
+    )
+    parser.add_argument(
+        "--rows",
+        type=int,
+        default=10000,
+        help="rows per fact source table, e.g. 10000 to 10000000",
+    )
+    parser.add_argument(
+        "--changes",
+        type=int,
+        help="rows inserted and updated per fact table before the incremental "
+        "cases, 1%% of --rows by default",
+    )
+    parser.add_argument("--db-host", default="localhost")
+    parser.add_argument("--db-name", default="postgres")
+    parser.add_argument("--db-user", default="postgres")
+    parser.add_argument("--db-password", default="postgres")
+    parser.add_argument("--moto-port", type=int, default=5055)
+    parser.add_argument(
+        "--skip-seed",
+        action="store_true",
+        help="reuse the tables of an earlier run seeded with the same --rows",
+    )
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    changes = args.changes or max(1, args.rows // 100)
+    conn = pg8000.native.Connection(
+        host=args.db_host,
+        database=args.db_name,
+        user=args.db_user,
+        password=args.db_password,
+    )
+    if not args.skip_seed:
+        started = time.perf_counter()
+        seed(conn, args.rows)
+        print(
+            f"Seeded {args.rows} rows per fact table "
+            f"in {time.perf_counter() - started:.1f} s",
+            flush=True,
+        )
+    server = start_moto_server(args.moto_port)
+    try:
+        create_resources(args)
+        results = []
+        for table_name in FACT_TABLES:
+            results.append(
+                measure(f"get_dict_table {table_name}", "get_dict_table", table_name)
+            )
+        results.append(measure("lambda_handler initial", "lambda_handler"))
+        results.append(measure("lambda_handler unchanged", "lambda_handler"))
+        for table_name in FACT_TABLES:
+            measure(
+                f"setup update_dict_table {table_name}",
+                "setup_update_dict_table",
+                table_name,
+            )
+        add_changes(conn, args.rows, changes)
+        for table_name in FACT_TABLES:
+            results.append(
+                measure(
+                    f"update_dict_table {table_name}", "update_dict_table", table_name
+                )
+            )
+        results.append(measure("lambda_handler incremental", "lambda_handler"))
+    finally:
+        server.stop()
+        conn.close()
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(
+                {"rows": args.rows, "changes": changes, "results": results},
+                output,
+                indent=2,
+            )
+    return 1 if any("error" in result for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
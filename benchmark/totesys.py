@@ -0,0 +1,196 @@
+"""
+Synthetic ToteSys database for the ingest benchmarks.
+
+The tables have the names, columns and types of the ToteSys source database.
+Rows are generated on the server with generate_series, so seeding millions of
+rows costs no round trips per row.
+"""
+
+DIMENSION_ROWS = {
+    "currency": 3,
+    "payment_type": 4,
+    "department": 8,
+    "staff": 20,
+    "address": 30,
+    "counterparty": 20,
+    "design": 500,
+}
+FACT_TABLES = ("sales_order", "purchase_order", "transaction", "payment")
+
+TIMESTAMP = "TIMESTAMP '2022-11-03 14:20:49.962' + g * INTERVAL '1 second'"
+"""
+The 'created_at' of generated row g, so rows are in insertion order.
+"""
+
+TABLES = {
+    "currency": (
+        "currency_id integer PRIMARY KEY, currency_code varchar(3) NOT NULL, "
+        "created_at timestamp NOT NULL, last_updated timestamp NOT NULL",
+        "g, (ARRAY['GBP', 'USD', 'EUR'])[g], {ts}, {ts}",
+    ),
+    "payment_type": (
+        "payment_type_id integer PRIMARY KEY, payment_type_name varchar NOT NULL, "
+        "created_at timestamp NOT NULL, last_updated timestamp NOT NULL",
+        "g, (ARRAY['SALES_RECEIPT', 'SALES_REFUND', 'PURCHASE_PAYMENT', "
+        "'PURCHASE_REFUND'])[g], {ts}, {ts}",
+    ),
+    "department": (
+        "department_id integer PRIMARY KEY, department_name varchar NOT NULL, "
+        "location varchar, manager varchar, "
+        "created_at timestamp NOT NULL, last_updated timestamp NOT NULL",
+        "g, 'Department ' || g, 'Location ' || g, 'Manager ' || g, {ts}, {ts}",
+    ),
+    "staff": (
+        "staff_id integer PRIMARY KEY, first_name varchar NOT NULL, "
+        "last_name varchar NOT NULL, department_id integer NOT NULL, "
+        "email_address varchar NOT NULL, "
+        "created_at timestamp NOT NULL, last_updated timestamp NOT NULL",
+        "g, 'First' || g, 'Last' || g, 1 + g % 8, "
+        "'staff' || g || '@terrifictotes.com', {ts}, {ts}",
+    ),
+    "address": (
+        "address_id integer PRIMARY KEY, address_line_1 varchar NOT NULL, "
+        "address_line_2 varchar, district varchar, city varchar NOT NULL, "
+        "postal_code varchar NOT NULL, country varchar NOT NULL, "
+        "phone varchar NOT NULL, "
+        "created_at timestamp NOT NULL, last_updated timestamp NOT NULL",
+        "g, g || ' Tote Street', NULL, 'District ' || g, 'City ' || g, "
+        "'PC' || g, 'Country ' || g % 5, '0161 ' || lpad(g::text, 6, '0'), "
+        "{ts}, {ts}",
+    ),
+    "counterparty": (
+        "counterparty_id integer PRIMARY KEY, "
+        "counterparty_legal_name varchar NOT NULL, "
+        "legal_address_id integer NOT NULL, commercial_contact varchar, "
+        "delivery_contact varchar, "
+        "created_at timestamp NOT NULL, last_updated timestamp NOT NULL",
+        "g, 'Counterparty ' || g, 1 + g % 30, 'Contact ' || g, "
+        "'Delivery ' || g, {ts}, {ts}",
+    ),
+    "design": (
+        "design_id integer PRIMARY KEY, created_at timestamp NOT NULL, "
+        "design_name varchar NOT NULL, file_location varchar NOT NULL, "
+        "file_name varchar NOT NULL, last_updated timestamp NOT NULL",
+        "g, {ts}, 'Design ' || g, '/usr/share/designs', "
+        "'design-' || g || '.json', {ts}",
+    ),
+    "sales_order": (
+        "sales_order_id integer PRIMARY KEY, created_at timestamp NOT NULL, "
+        "last_updated timestamp NOT NULL, design_id integer NOT NULL, "
+        "staff_id integer NOT NULL, counterparty_id integer NOT NULL, "
+        "units_sold integer NOT NULL, unit_price numeric(10, 2) NOT NULL, "
+        "currency_id integer NOT NULL, agreed_delivery_date varchar NOT NULL, "
+        "agreed_payment_date varchar NOT NULL, "
+        "agreed_delivery_location_id integer NOT NULL",
+        "g, {ts}, {ts}, 1 + g % 500, 1 + g % 20, 1 + g % 20, 1000 + g % 99000, "
+        "2 + (g % 300) / 100.0, 1 + g % 3, "
+        "to_char(DATE '2022-11-05' + g % 1000, 'YYYY-MM-DD'), "
+        "to_char(DATE '2022-11-08' + g % 1000, 'YYYY-MM-DD'), 1 + g % 30",
+    ),
+    "purchase_order": (
+        "purchase_order_id integer PRIMARY KEY, created_at timestamp NOT NULL, "
+        "last_updated timestamp NOT NULL, staff_id integer NOT NULL, "
+        "counterparty_id integer NOT NULL, item_code varchar NOT NULL, "
+        "item_quantity integer NOT NULL, "
+        "item_unit_price numeric(10, 2) NOT NULL, currency_id integer NOT NULL, "
+        "agreed_delivery_date varchar NOT NULL, "
+        "agreed_payment_date varchar NOT NULL, "
+        "agreed_delivery_location_id integer NOT NULL",
+        "g, {ts}, {ts}, 1 + g % 20, 1 + g % 20, 'ITEM' || g % 10000, "
+        "1 + g % 1000, 100 + (g % 90000) / 100.0, 1 + g % 3, "
+        "to_char(DATE '2022-11-05' + g % 1000, 'YYYY-MM-DD'), "
+        "to_char(DATE '2022-11-08' + g % 1000, 'YYYY-MM-DD'), 1 + g % 30",
+    ),
+    "transaction": (
+        "transaction_id integer PRIMARY KEY, transaction_type varchar NOT NULL, "
+        "sales_order_id integer, purchase_order_id integer, "
+        "created_at timestamp NOT NULL, last_updated timestamp NOT NULL",
+        "g, CASE WHEN g % 2 = 0 THEN 'SALE' ELSE 'PURCHASE' END, "
+        "CASE WHEN g % 2 = 0 THEN g END, CASE WHEN g % 2 = 1 THEN g END, "
+        "{ts}, {ts}",
+    ),
+    "payment": (
+        "payment_id integer PRIMARY KEY, created_at timestamp NOT NULL, "
+        "last_updated timestamp NOT NULL, transaction_id integer NOT NULL, "
+        "counterparty_id integer NOT NULL, "
+        "payment_amount numeric(10, 2) NOT NULL, currency_id integer NOT NULL, "
+        "payment_type_id integer NOT NULL, paid boolean NOT NULL, "
+        "payment_date varchar NOT NULL, company_ac_number integer NOT NULL, "
+        "counterparty_ac_number integer NOT NULL",
+        "g, {ts}, {ts}, g, 1 + g % 20, (g % 1000000) / 100.0, 1 + g % 3, "
+        "1 + g % 4, g % 3 = 0, "
+        "to_char(DATE '2022-11-08' + g % 1000, 'YYYY-MM-DD'), "
+        "10000000 + g % 89999999, 10000000 + (g * 7) % 89999999",
+    ),
+}
+
+
+def insert_rows(conn, table_name, start, stop, timestamp=TIMESTAMP):
+    """
+    Generates rows start to stop, inclusive, of a table.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - table_name (str): The name of the table.
+    - start (int): The id of the first row.
+    - stop (int): The id of the last row.
+    - timestamp (str): The SQL expression of the 'created_at' and
+    'last_updated' of row g.
+    """
+    values = TABLES[table_name][1].format(ts=timestamp)
+    conn.run(
+        f"INSERT INTO {table_name} "
+        f"SELECT {values} FROM generate_series(CAST(:start AS integer), "
+        "CAST(:stop AS integer)) AS g",
+        start=start,
+        stop=stop,
+    )
+
+
+def seed(conn, fact_rows):
+    """
+    Drops and recreates the ToteSys tables, fills them and updates their
+    planner statistics.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - fact_rows (int): The number of rows of each fact source table.
+    """
+    for table_name, (columns, _) in TABLES.items():
+        conn.run(f"DROP TABLE IF EXISTS {table_name}")
+        conn.run(f"CREATE TABLE {table_name} ({columns})")
+        conn.run(f"CREATE INDEX ON {table_name} (last_updated)")
+    for table_name, rows in DIMENSION_ROWS.items():
+        insert_rows(conn, table_name, 1, rows)
+    for table_name in FACT_TABLES:
+        insert_rows(conn, table_name, 1, fact_rows)
+    conn.run("ANALYZE")
+
+
+def add_changes(conn, fact_rows, changed_rows):
+    """
+    Changes the fact source tables the way a day of trading would: inserts new
+    rows after the existing ones and updates the 'last_updated' of as many old
+    rows.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - fact_rows (int): The number of rows each fact table was seeded with.
+    - changed_rows (int): The number of rows to insert, and to update, in each
+    fact table.
+    """
+    for table_name in FACT_TABLES:
+        key_column = TABLES[table_name][0].split(" ", 1)[0]
+        insert_rows(
+            conn,
+            table_name,
+            fact_rows + 1,
+            fact_rows + changed_rows,
+            "LOCALTIMESTAMP",
+        )
+        conn.run(
+            f"UPDATE {table_name} SET last_updated = LOCALTIMESTAMP "
+            f"WHERE {key_column} <= :changed_rows",
+            changed_rows=changed_rows,
+        )
+    conn.run("ANALYZE")
@@ -0,0 +1,89 @@
+import os
+import threading
+import boto3
+from botocore.config import Config
+
+
+REGION_NAME = "eu-west-2"
+
+CLIENT_CONFIG = Config(
+    region_name=REGION_NAME,
+    max_pool_connections=int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", "32")),
+    tcp_keepalive=True,
+    retries={"mode": "standard"},
+)
+"""
+Shared configuration of every client: a connection pool large enough for the
+concurrent extraction workers, and TCP keep-alive so pooled connections survive
+between warm Lambda invocations.
+"""
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(service_name):
+    """
+    Retrieves the shared client of an AWS service, creating it on first use.
+
+    Clients are created once per Lambda execution environment and reused across
+    warm invocations, so client construction, endpoint resolution and connection
+    setup are paid once instead of on every call. Creation is guarded by a lock,
+    as boto3 sessions are not thread-safe; the clients themselves are.
+
+    Parameters:
+    - service_name (str): The name of the AWS service, e.g. 's3'.
+
+    Returns:
+    - botocore.client.BaseClient: The shared client of the service.
+    """
+    client = _clients.get(service_name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(service_name)
+            if client is None:
+                client = boto3.client(
+                    service_name, region_name=REGION_NAME, config=CLIENT_CONFIG
+                )
+                _clients[service_name] = client
+    return client
+
+
+def get_s3_client():
+    """
+    Retrieves the shared S3 client.
+
+    Returns:
+    - botocore.client.S3: The shared S3 client.
+    """
+    return get_client("s3")
+
+
+def get_secretsmanager_client():
+    """
+    Retrieves the shared Secrets Manager client.
+
+    Returns:
+    - botocore.client.SecretsManager: The shared Secrets Manager client.
+    """
+    return get_client("secretsmanager")
+
+
+def set_client(service_name, client):
+    """
+    Replaces the shared client of an AWS service, e.g. with a stub in tests.
+
+    Parameters:
+    - service_name (str): The name of the AWS service.
+    - client: The client to hand out from now on.
+    """
+    with _clients_lock:
+        _clients[service_name] = client
+
+
+def reset_clients():
+    """
+    Discards every shared client, so the next call creates new ones.
+    """
+    with _clients_lock:
+        _clients.clear()
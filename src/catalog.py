@@ -0,0 +1,156 @@
+import threading
+import weakref
+
+
+FINGERPRINT_QUERY = (
+    "SELECT md5(coalesce(string_agg("
+    "c.relname || '.' || a.attnum || '.' || a.attname || '.' || a.atttypid "
+    "|| '.' || a.atttypmod || '.' || (i.indrelid IS NOT NULL), ',' "
+    "ORDER BY c.relname, a.attnum), '')) "
+    "FROM pg_class c "
+    "JOIN pg_namespace n ON n.oid = c.relnamespace "
+    "JOIN pg_attribute a "
+    "ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped "
+    "LEFT JOIN pg_index i "
+    "ON i.indrelid = c.oid AND i.indisprimary AND a.attnum = ANY(i.indkey) "
+    "WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p')"
+)
+"""
+Hashes the tables, columns, types and primary keys of the 'public' schema on
+the server, so checking for schema changes transfers a single value.
+"""
+
+CATALOG_QUERY = (
+    "SELECT c.relname, a.attname, a.atttypid, "
+    "format_type(a.atttypid, a.atttypmod), a.attnotnull, i.indrelid IS NOT NULL "
+    "FROM pg_class c "
+    "JOIN pg_namespace n ON n.oid = c.relnamespace "
+    "JOIN pg_attribute a "
+    "ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped "
+    "LEFT JOIN pg_index i "
+    "ON i.indrelid = c.oid AND i.indisprimary AND a.attnum = ANY(i.indkey) "
+    "WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p') "
+    "ORDER BY c.relname, a.attnum"
+)
+
+_caches = weakref.WeakSet()
+
+
+def read_fingerprint(conn):
+    """
+    Computes the fingerprint of the schema of the database.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+
+    Returns:
+    - str: The fingerprint, which changes whenever a table, column, column type
+    or primary key is added, dropped or altered.
+
+    Raises:
+    - pg8000.exceptions.DatabaseError: If the query fails.
+    """
+    return conn.run(FINGERPRINT_QUERY)[0][0]
+
+
+def read_catalog(conn, fingerprint):
+    """
+    Reads the tables, columns, types and primary keys of the database in one
+    query.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - fingerprint (str): The fingerprint read before the catalog, see
+    read_fingerprint. A schema change in between makes the next check read the
+    catalog again.
+
+    Returns:
+    - dict: {'fingerprint', 'tables'}, where 'tables' maps each table name to
+    {'columns': [{'name', 'type', 'type_oid', 'nullable'}], 'primary_key': list}.
+
+    Raises:
+    - pg8000.exceptions.DatabaseError: If the query fails.
+    """
+    tables = {}
+    for table_name, name, type_oid, type_name, not_null, is_key in conn.run(
+        CATALOG_QUERY
+    ):
+        table = tables.setdefault(table_name, {"columns": [], "primary_key": []})
+        table["columns"].append(
+            {
+                "name": name,
+                "type": type_name,
+                "type_oid": type_oid,
+                "nullable": not not_null,
+            }
+        )
+        if is_key:
+            table["primary_key"].append(name)
+    return {"fingerprint": fingerprint, "tables": tables}
+
+
+class CatalogCache:
+    """
+    In-process copy of the catalog of the source database, shared across warm
+    Lambda invocations.
+
+    The cached catalog is only handed out for the fingerprint it was read
+    with, so a schema change is picked up by the first run after it.
+    """
+
+    def __init__(self):
+        self._catalog = None
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def get(self, fingerprint):
+        """
+        Retrieves the cached catalog, if it was read with a given fingerprint.
+
+        Parameters:
+        - fingerprint (str): The current fingerprint of the schema.
+
+        Returns:
+        - dict: The catalog, or None if it is missing or out of date.
+        """
+        with self._lock:
+            if self._catalog is not None:
+                if self._catalog["fingerprint"] == fingerprint:
+                    return self._catalog
+            return None
+
+    def current(self):
+        """
+        Retrieves the cached catalog without checking its fingerprint, for
+        lookups made during the run that checked it.
+
+        Returns:
+        - dict: The catalog, or None if none is cached.
+        """
+        with self._lock:
+            return self._catalog
+
+    def put(self, catalog):
+        """
+        Caches a catalog.
+
+        Parameters:
+        - catalog (dict): The catalog, see read_catalog.
+        """
+        with self._lock:
+            self._catalog = catalog
+
+    def invalidate(self):
+        """
+        Discards the cached catalog.
+        """
+        with self._lock:
+            self._catalog = None
+
+
+def reset_catalogs():
+    """
+    Discards the catalog of every cache.
+    """
+    for cache in list(_caches):
+        cache.invalidate()
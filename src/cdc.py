@@ -0,0 +1,288 @@
+import re
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+
+
+DECODING_PLUGIN = "test_decoding"
+"""
+The output plugin of the replication slot. It ships with Postgres and emits one
+text line per change, so the slot can be read over a plain SQL connection.
+"""
+OPERATION_COLUMN = "cdc_op"
+"""
+The column added to change segments, holding 'I', 'U' or 'D' for each row.
+"""
+OPERATIONS = {"INSERT": "I", "UPDATE": "U", "DELETE": "D"}
+INTEGER_TYPES = ("smallint", "integer", "bigint", "oid")
+FLOAT_TYPES = ("real", "double precision")
+UNCHANGED_TOAST = "unchanged-toast-datum"
+
+CHANGE_PATTERN = re.compile(
+    r'table (?P<schema>"(?:[^"]|"")*"|[^.]+)\.(?P<table>"(?:[^"]|"")*"|[^:]+): '
+    r"(?P<operation>INSERT|UPDATE|DELETE): (?P<tuple>.*)",
+    re.S,
+)
+TUPLE_PATTERN = re.compile(
+    r"(?P<marker>old-key|new-tuple):"
+    r'|(?P<name>"(?:[^"]|"")*"|[^\s\[]+)\[(?P<type>[^\[\]]+(?:\[\])*)\]:'
+    r"(?P<value>'(?:[^']|'')*'|\S+)",
+    re.S,
+)
+
+
+def parse_lsn(lsn):
+    """
+    Converts a Postgres log sequence number to an integer, so LSNs can be
+    compared.
+
+    Parameters:
+    - lsn (str): The LSN in its text form, e.g. '0/16B3748'.
+
+    Returns:
+    - int: The position of the LSN in the write-ahead log.
+    """
+    high, low = lsn.split("/")
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+def format_lsn(position):
+    """
+    Converts a position in the write-ahead log back to its text form.
+
+    Parameters:
+    - position (int): The position, see parse_lsn.
+
+    Returns:
+    - str: The LSN, e.g. '0/16B3748'.
+    """
+    return f"{position >> 32:X}/{position & 0xFFFFFFFF:X}"
+
+
+def unquote_identifier(identifier):
+    """
+    Removes the double quotes test_decoding puts around identifiers that need
+    them.
+
+    Parameters:
+    - identifier (str): The identifier as printed by test_decoding.
+
+    Returns:
+    - str: The identifier.
+    """
+    if identifier.startswith('"'):
+        return identifier[1:-1].replace('""', '"')
+    return identifier
+
+
+def parse_value(value, type_name):
+    """
+    Converts a column value printed by test_decoding to the Python type pg8000
+    returns for the column, so change segments serialise like full extractions.
+
+    Unchanged TOAST values are not printed by the plugin and are returned as
+    None; the ToteSys tables have no values large enough to be TOASTed.
+
+    Parameters:
+    - value (str): The value as printed, quoted unless numeric or boolean.
+    - type_name (str): The name of the column type, e.g. 'integer'.
+
+    Returns:
+    - The value, or None for SQL null.
+    """
+    if value in ("null", UNCHANGED_TOAST):
+        return None
+    if value.startswith("'"):
+        value = value[1:-1].replace("''", "'")
+    if type_name in INTEGER_TYPES:
+        return int(value)
+    if type_name in FLOAT_TYPES:
+        return float(value)
+    if type_name == "numeric" or type_name.startswith("numeric("):
+        return Decimal(value)
+    if type_name == "boolean":
+        return value == "true"
+    if type_name.startswith("timestamp"):
+        return datetime.fromisoformat(value)
+    if type_name == "date":
+        return date.fromisoformat(value)
+    return value
+
+
+def parse_change(data):
+    """
+    Parses one change line emitted by test_decoding.
+
+    Updates are read from their new tuple. Deletes only carry the replica
+    identity of the row, by default its primary key.
+
+    Parameters:
+    - data (str): The line, e.g.
+    "table public.staff: DELETE: staff_id[integer]:3".
+
+    Returns:
+    - A tuple containing:
+        - str: The name of the table.
+        - str: 'I', 'U' or 'D'.
+        - dict: The values of the row, by column name.
+    - Or None if the line is not a change, e.g. 'BEGIN' or 'COMMIT'.
+    """
+    match = CHANGE_PATTERN.fullmatch(data)
+    if match is None:
+        return None
+    row = {}
+    for column in TUPLE_PATTERN.finditer(match["tuple"]):
+        if column["marker"] == "new-tuple":
+            row = {}
+        elif column["marker"] is None:
+            row[unquote_identifier(column["name"])] = parse_value(
+                column["value"], column["type"]
+            )
+    return (
+        unquote_identifier(match["table"]),
+        OPERATIONS[match["operation"]],
+        row,
+    )
+
+
+def split_transactions(changes):
+    """
+    Splits the lines read from a replication slot into committed transactions.
+
+    Transactions are decoded whole, in commit order, so the LSN of the 'COMMIT'
+    line orders them; the LSNs of the changes inside interleave across
+    concurrent transactions and cannot be compared.
+
+    Parameters:
+    - changes (list): The (lsn, data) pairs read from the slot.
+
+    Returns:
+    - list: One (commit_lsn, lines) pair per transaction, where lines holds the
+    data of every change in it.
+    """
+    transactions = []
+    lines = []
+    for lsn, data in changes:
+        if data.startswith("BEGIN"):
+            lines = []
+        elif data.startswith("COMMIT"):
+            transactions.append((lsn, lines))
+            lines = []
+        else:
+            lines.append(data)
+    return transactions
+
+
+def group_changes(transactions, tables):
+    """
+    Batches the changes of several transactions per table, in commit order.
+
+    Parameters:
+    - transactions (list): The (commit_lsn, lines) pairs, see split_transactions.
+    - tables (list): The names of the tables to keep; changes to any other
+    table are dropped.
+
+    Returns:
+    - dict: Maps each changed table to a dictionary of columns, see
+    get_dict_table, with an extra 'cdc_op' column. Columns missing from a row,
+    e.g. the non-key columns of a delete, are None.
+    """
+    rows_by_table = {}
+    for _, lines in transactions:
+        for data in lines:
+            change = parse_change(data)
+            if change is None:
+                logging.warning(f"Skipped unknown change. {data}")
+                continue
+            table_name, operation, row = change
+            if table_name in tables:
+                row[OPERATION_COLUMN] = operation
+                rows_by_table.setdefault(table_name, []).append(row)
+    dict_tables = {}
+    for table_name, rows in rows_by_table.items():
+        columns = list(dict.fromkeys(column for row in rows for column in row))
+        dict_tables[table_name] = {
+            column: [row.get(column) for row in rows] for column in columns
+        }
+    return dict_tables
+
+
+def create_slot_if_missing(conn, slot_name):
+    """
+    Creates the logical replication slot, unless it exists already.
+
+    The server must run with 'wal_level=logical'.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - slot_name (str): The name of the slot.
+
+    Returns:
+    - bool: True if the slot was created.
+
+    Raises:
+    - pg8000.exceptions.DatabaseError: If the slot cannot be read or created.
+    """
+    slots = conn.run(
+        "SELECT 1 FROM pg_replication_slots WHERE slot_name = :slot_name",
+        slot_name=slot_name,
+    )
+    if slots:
+        return False
+    conn.run(
+        "SELECT pg_create_logical_replication_slot(:slot_name, :plugin)",
+        slot_name=slot_name,
+        plugin=DECODING_PLUGIN,
+    )
+    return True
+
+
+def peek_changes(conn, slot_name, max_changes):
+    """
+    Reads the pending changes of a replication slot without consuming them.
+
+    The slot only moves on when advance_slot is called, so changes read by a
+    run that fails before storing them are read again by the next run.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - slot_name (str): The name of the slot.
+    - max_changes (int): Stops reading at the end of the first transaction that
+    reaches this many lines.
+
+    Returns:
+    - list: The (lsn, data) pairs, in commit order.
+
+    Raises:
+    - pg8000.exceptions.DatabaseError: If the slot cannot be read.
+    """
+    rows = conn.run(
+        "SELECT lsn::text, data "
+        "FROM pg_logical_slot_peek_changes("
+        ":slot_name, NULL, :max_changes, "
+        "'include-xids', '0', 'skip-empty-xacts', '1')",
+        slot_name=slot_name,
+        max_changes=max_changes,
+    )
+    return [(lsn, data) for lsn, data in rows]
+
+
+def advance_slot(conn, slot_name, commit_lsn):
+    """
+    Consumes the changes of a replication slot up to and including the
+    transaction committed at an LSN, so the server can recycle their WAL.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - slot_name (str): The name of the slot.
+    - commit_lsn (str): The LSN of the 'COMMIT' line of the last stored
+    transaction.
+
+    Raises:
+    - pg8000.exceptions.DatabaseError: If the slot cannot be advanced.
+    """
+    conn.run(
+        "SELECT pg_replication_slot_advance(:slot_name, CAST(:lsn AS pg_lsn))",
+        slot_name=slot_name,
+        lsn=format_lsn(parse_lsn(commit_lsn) + 1),
+    )
@@ -0,0 +1,230 @@
+import copy
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+METRIC_COUNTERS = ("rows", "bytes", "query_seconds", "s3_seconds")
+
+_local = threading.local()
+
+
+class ExtractionPaused(Exception):
+    """
+    Raised by an extraction that stopped at a checkpoint because the invocation
+    is running out of time. It is not an error: the extraction carries on from
+    the checkpoint in the next invocation.
+    """
+
+    pass
+
+
+class Deadline:
+    """
+    The point in time by which an invocation should stop starting new work.
+
+    Parameters:
+    - seconds (float): The time left in the invocation.
+    - reserve (float): The time kept back to store a checkpoint and return.
+    """
+
+    def __init__(self, seconds=math.inf, reserve=0):
+        self.at = time.monotonic() + seconds - reserve
+
+    @classmethod
+    def from_context(cls, context, reserve=0):
+        """
+        Builds the deadline of a Lambda invocation from its context object.
+
+        Parameters:
+        - context: The Lambda context object. A context without
+        'get_remaining_time_in_millis', e.g. in tests, never runs out of time.
+        - reserve (float): The time kept back to store a checkpoint and return.
+
+        Returns:
+        - Deadline: The deadline.
+        """
+        get_remaining_time = getattr(context, "get_remaining_time_in_millis", None)
+        if get_remaining_time is None:
+            return cls()
+        return cls(get_remaining_time() / 1000, reserve)
+
+    def expired(self):
+        return time.monotonic() >= self.at
+
+
+class RunCheckpoint:
+    """
+    Progress of an ingestion run that may span several Lambda invocations.
+
+    The state is a JSON-serialisable dictionary: the 'run_id' and 'started_at'
+    of the run, the 'tables' it extracts, the 'due_tables' and 'probes' it was
+    planned with, whether each finished table was updated ('done'), the resume
+    state of each table stopped part way ('chunks') and the metrics counted for
+    each table so far ('metrics'). Every change that matters to a later
+    invocation is stored at once, so a run killed by its timeout resumes from
+    its last stored checkpoint. It may be updated from several threads.
+
+    Parameters:
+    - state (dict): The state stored by an earlier invocation, or None to start
+    a new run.
+    - deadline (Deadline): The deadline of the current invocation.
+    - store (callable): Called as store(state) to store the state.
+    """
+
+    def __init__(self, state=None, deadline=None, store=None):
+        self.state = state or {
+            "tables": None,
+            "done": {},
+            "chunks": {},
+            "metrics": {},
+        }
+        self.deadline = deadline or Deadline()
+        self.progressed = False
+        self._store = store
+        self._lock = threading.RLock()
+
+    @property
+    def started_at(self):
+        """
+        The time the run started, or None if it has not been planned yet.
+        """
+        started_at = self.state.get("started_at")
+        return None if started_at is None else datetime.fromisoformat(started_at)
+
+    @property
+    def tables(self):
+        return self.state["tables"]
+
+    def begin(self, run_id, started_at, tables, due_tables=None, probes=None):
+        """
+        Records the plan of a new run and stores it.
+
+        Parameters:
+        - run_id (str): The id of the run.
+        - started_at (datetime): The time the run started.
+        - tables (list): The names of the tables the run extracts.
+        - due_tables (list): The names of the tables due by their refresh
+        policy, or None.
+        - probes (dict): The change probe of each table, or None.
+        """
+        with self._lock:
+            self.state.update(
+                {
+                    "run_id": run_id,
+                    "started_at": started_at.isoformat(),
+                    "tables": list(tables),
+                    "due_tables": due_tables,
+                    "probes": probes or {},
+                }
+            )
+            self.save()
+
+    def expired(self):
+        return self.deadline.expired()
+
+    def pending(self):
+        """
+        Returns the names of the tables of the run that are not finished yet.
+        """
+        with self._lock:
+            return [t for t in self.state["tables"] if t not in self.state["done"]]
+
+    def results(self):
+        """
+        Returns, for each table of the run, whether it was updated, or None if
+        it is not finished yet.
+        """
+        with self._lock:
+            return [self.state["done"].get(t) for t in self.state["tables"]]
+
+    def get_chunk(self, table_name):
+        """
+        Retrieves the resume state of a table stopped part way.
+
+        Parameters:
+        - table_name (str): The name of the table.
+
+        Returns:
+        - dict: The state stored with put_chunk, or None.
+        """
+        with self._lock:
+            return copy.deepcopy(self.state["chunks"].get(table_name))
+
+    def put_chunk(self, table_name, chunk):
+        """
+        Stores the resume state of a table stopped part way.
+
+        Parameters:
+        - table_name (str): The name of the table.
+        - chunk (dict): The JSON-serialisable resume state.
+        """
+        with self._lock:
+            self.state["chunks"][table_name] = chunk
+            self.progressed = True
+            self.save()
+
+    def add_metrics(self, table_name, counters):
+        """
+        Adds the metrics counted for a table in the current invocation to those
+        of the run. The watermark of the first invocation is kept.
+
+        Parameters:
+        - table_name (str): The name of the table.
+        - counters (dict): The counters, see TableMetrics.as_dict.
+        """
+        with self._lock:
+            total = self.state["metrics"].get(table_name)
+            if total is None:
+                self.state["metrics"][table_name] = dict(counters)
+                return
+            for counter in METRIC_COUNTERS:
+                total[counter] += counters[counter]
+
+    def finish_table(self, table_name, needs_update):
+        """
+        Records that a table is finished and stores the checkpoint.
+
+        Parameters:
+        - table_name (str): The name of the table.
+        - needs_update (bool): Whether the table was updated.
+        """
+        with self._lock:
+            self.state["done"][table_name] = bool(needs_update)
+            self.state["chunks"].pop(table_name, None)
+            self.progressed = True
+            self.save()
+
+    def save(self):
+        with self._lock:
+            if self._store is not None:
+                self._store(self.state)
+
+
+@contextmanager
+def resuming(checkpoint):
+    """
+    Makes a RunCheckpoint available to the extraction running on the current
+    thread for the duration of a with block.
+
+    Parameters:
+    - checkpoint (RunCheckpoint): The checkpoint, or None.
+    """
+    previous = getattr(_local, "checkpoint", None)
+    _local.checkpoint = checkpoint
+    try:
+        yield
+    finally:
+        _local.checkpoint = previous
+
+
+def current_checkpoint():
+    """
+    Retrieves the checkpoint of the extraction running on the current thread.
+
+    Returns:
+    - RunCheckpoint: The checkpoint, or None if the run cannot be resumed.
+    """
+    return getattr(_local, "checkpoint", None)
@@ -0,0 +1,234 @@
+from array import array
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+ARRAY_CODES = {int: "q", float: "d", bool: "b", datetime: "q", date: "i"}
+"""
+The array typecode holding each type of value: 8 bytes per integer, float and
+timestamp (in microseconds since the epoch), 4 bytes per date (as an ordinal)
+and 1 byte per boolean, against 30 to 60 bytes for a boxed Python object and
+its list slot.
+"""
+TEXT_TYPES = (str, Decimal)
+
+
+def encode_value(kind, value):
+    if kind is datetime:
+        return (value - EPOCH) // MICROSECOND
+    if kind is date:
+        return value.toordinal()
+    return value
+
+
+def decode_value(kind, value):
+    if kind is datetime:
+        return EPOCH + value * MICROSECOND
+    if kind is date:
+        return date.fromordinal(value)
+    return kind(value)
+
+
+class ColumnBuffer:
+    """
+    Compact, typed storage for the values of one column of a table in
+    dictionary format.
+
+    The type of the first non-null value picks the storage: an array for
+    integers, floats, booleans, naive timestamps and dates, and UTF-8 bytes
+    with an array of end offsets for strings and decimals. Nulls are kept in a
+    bytearray beside the values. A value of any other type, including one that
+    does not match the type of the column, moves the column to a plain list, so
+    values always come back exactly as they were appended.
+
+    The buffer supports the list operations used on table columns: append,
+    extend, len, indexing, item assignment and iteration, and compares equal to
+    a list of the same values.
+
+    Parameters:
+    - values (iterable): The initial values of the column.
+    """
+
+    __hash__ = None
+
+    def __init__(self, values=()):
+        self._kind = None
+        self._values = None
+        self._offsets = None
+        self._nulls = bytearray()
+        self._patches = {}
+        self.extend(values)
+
+    def _start(self, value):
+        kind = type(value)
+        if kind is datetime and value.tzinfo is not None:
+            kind = object
+        if kind in ARRAY_CODES:
+            self._values = array(ARRAY_CODES[kind], [0]) * len(self._nulls)
+        elif kind in TEXT_TYPES:
+            self._values = bytearray()
+            self._offsets = array("Q", [0]) * len(self._nulls)
+        else:
+            kind = object
+            self._values = [None] * len(self._nulls)
+        self._kind = kind
+
+    def _to_list(self):
+        values = list(self)
+        self._kind = object
+        self._values = values
+        self._offsets = None
+        self._nulls = bytearray()
+        self._patches = {}
+
+    def _accepts(self, value):
+        if type(value) is not self._kind:
+            return False
+        return self._kind is not datetime or value.tzinfo is None
+
+    def append(self, value):
+        """
+        Appends a value to the column.
+
+        Parameters:
+        - value: The value, or None for SQL null.
+        """
+        if self._kind is None:
+            if value is None:
+                self._nulls.append(1)
+                return
+            self._start(value)
+        if self._kind is object:
+            self._values.append(value)
+            return
+        if value is not None and not self._accepts(value):
+            self._to_list()
+            self._values.append(value)
+            return
+        if self._offsets is not None:
+            if value is not None:
+                self._values += str(value).encode()
+            self._offsets.append(len(self._values))
+        else:
+            try:
+                self._values.append(
+                    0 if value is None else encode_value(self._kind, value)
+                )
+            except OverflowError:
+                self._to_list()
+                self._values.append(value)
+                return
+        self._nulls.append(value is None)
+
+    def extend(self, values):
+        """
+        Appends several values to the column.
+
+        Parameters:
+        - values (iterable): The values.
+        """
+        for value in values:
+            self.append(value)
+
+    def tolist(self):
+        """
+        Returns the values of the column as a list.
+        """
+        return list(self)
+
+    def __len__(self):
+        if self._kind is object:
+            return len(self._values)
+        return len(self._nulls)
+
+    def _index(self, index):
+        length = len(self)
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError("column index out of range")
+        return index
+
+    def _decode_text(self, start, end):
+        return self._kind(self._values[start:end].decode())
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        index = self._index(index)
+        if self._kind is object:
+            return self._values[index]
+        if self._nulls[index]:
+            return None
+        if index in self._patches:
+            return self._patches[index]
+        if self._offsets is not None:
+            start = self._offsets[index - 1] if index else 0
+            return self._decode_text(start, self._offsets[index])
+        return decode_value(self._kind, self._values[index])
+
+    def __setitem__(self, index, value):
+        index = self._index(index)
+        if self._kind is None and value is not None:
+            self._start(value)
+        if self._kind is not object and value is not None:
+            if not self._accepts(value):
+                self._to_list()
+        if self._kind is object:
+            self._values[index] = value
+            return
+        self._nulls[index] = value is None
+        if self._offsets is not None:
+            if value is None:
+                self._patches.pop(index, None)
+            else:
+                self._patches[index] = value
+        elif value is not None:
+            try:
+                self._values[index] = encode_value(self._kind, value)
+            except OverflowError:
+                self._to_list()
+                self._values[index] = value
+
+    def __iter__(self):
+        if self._kind is None:
+            yield from [None] * len(self._nulls)
+        elif self._kind is object:
+            yield from self._values
+        elif self._offsets is not None:
+            start = 0
+            for index, (end, null) in enumerate(zip(self._offsets, self._nulls)):
+                if null:
+                    yield None
+                elif index in self._patches:
+                    yield self._patches[index]
+                else:
+                    yield self._decode_text(start, end)
+                start = end
+        else:
+            kind = self._kind
+            for value, null in zip(self._values, self._nulls):
+                yield None if null else decode_value(kind, value)
+
+    def __eq__(self, other):
+        if isinstance(other, (list, ColumnBuffer)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"ColumnBuffer({list(self)!r})"
+
+
+def append_rows(dict_table, rows):
+    """
+    Appends rows to the columns of a table in dictionary format.
+
+    Parameters:
+    - dict_table (dict): The table, whose columns are in the order of the rows.
+    - rows (list): The rows to append.
+    """
+    for buffer, values in zip(dict_table.values(), zip(*rows)):
+        buffer.extend(values)
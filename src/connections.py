@@ -0,0 +1,172 @@
+import threading
+import weakref
+from contextlib import contextmanager
+
+
+_managers = weakref.WeakSet()
+
+
+def ping_native(conn):
+    """
+    Checks that a pg8000.native connection is still usable.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The connection to check.
+
+    Raises:
+    - Exception: Any error raised by pg8000 if the connection is unusable.
+    """
+    conn.run("SELECT 1")
+
+
+def ping_dbapi(conn):
+    """
+    Checks that a pg8000.dbapi connection is still usable.
+
+    Parameters:
+    - conn (pg8000.dbapi.Connection): The connection to check.
+
+    Raises:
+    - Exception: Any error raised by pg8000 if the connection is unusable.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1")
+    cursor.fetchall()
+
+
+def close_quietly(conn):
+    """
+    Closes a connection, ignoring errors from connections that are already broken.
+
+    Parameters:
+    - conn: The connection to close.
+    """
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class ConnectionManager:
+    """
+    Keeps one database connection alive at module scope, so warm Lambda
+    invocations skip the TCP, TLS and authentication handshake.
+
+    Before a kept connection is handed out again it is validated with a cheap
+    ping; if the ping fails the connection is closed and a new one is opened.
+
+    Parameters:
+    - connect (callable): Called with no arguments, opens a new connection.
+    - ping (callable): Called with a connection, raises if it is unusable.
+    """
+
+    def __init__(self, connect, ping):
+        self.connect = connect
+        self.ping = ping
+        self._conn = None
+        self._lock = threading.Lock()
+        _managers.add(self)
+
+    def get(self):
+        """
+        Retrieves the kept connection, reconnecting if it is missing or broken.
+
+        Returns:
+        - The connection.
+        """
+        with self._lock:
+            if self._conn is not None:
+                try:
+                    self.ping(self._conn)
+                    return self._conn
+                except Exception:
+                    close_quietly(self._conn)
+                    self._conn = None
+            self._conn = self.connect()
+            return self._conn
+
+    def close(self):
+        """
+        Closes the kept connection, if any.
+        """
+        with self._lock:
+            if self._conn is not None:
+                close_quietly(self._conn)
+                self._conn = None
+
+
+class ConnectionPool:
+    """
+    Small pool of persistent database connections for callers that work in
+    parallel, e.g. one connection per extraction worker.
+
+    At most 'max_size' connections are open at once; callers beyond that wait for
+    a connection to be returned. Idle connections are kept between warm
+    invocations and pinged before reuse. A connection whose caller raised is
+    closed instead of returned, as it may be left inside a failed transaction.
+
+    Parameters:
+    - connect (callable): Called with no arguments, opens a new connection.
+    - ping (callable): Called with a connection, raises if it is unusable.
+    - max_size (int): The maximum number of open connections.
+    """
+
+    def __init__(self, connect, ping, max_size):
+        self.connect = connect
+        self.ping = ping
+        self.max_size = max_size
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        _managers.add(self)
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                conn = self._idle.pop()
+            try:
+                self.ping(conn)
+                return conn
+            except Exception:
+                close_quietly(conn)
+        return self.connect()
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a connection from the pool for the duration of a with block.
+
+        Yields:
+        - The connection.
+        """
+        self._slots.acquire()
+        try:
+            conn = self._acquire()
+            try:
+                yield conn
+            except BaseException:
+                close_quietly(conn)
+                raise
+            with self._lock:
+                self._idle.append(conn)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """
+        Closes every idle connection.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            close_quietly(conn)
+
+
+def reset_connections():
+    """
+    Closes the connections kept by every manager and pool.
+    """
+    for manager in list(_managers):
+        manager.close()
@@ -0,0 +1,112 @@
+import threading
+import time
+import weakref
+from botocore.exceptions import ClientError
+
+
+DEFAULT_TTL_SECONDS = 900
+AUTH_ERROR_CODES = ("28P01", "28000")
+"""
+Postgres SQLSTATE codes for 'invalid_password' and
+'invalid_authorization_specification', raised when cached credentials have been
+rotated.
+"""
+
+_providers = weakref.WeakSet()
+
+
+def fetch_secrets(sm, secret_ids):
+    """
+    Retrieves several secrets from AWS Secrets Manager with a single
+    BatchGetSecretValue call.
+
+    Parameters:
+    - sm (boto3.client): The Secrets Manager client.
+    - secret_ids (dict): Maps each field name to the id of the secret holding it,
+    e.g. {'host': 'db_host'}.
+
+    Returns:
+    - dict: Maps each field name to the value of its secret.
+
+    Raises:
+    - botocore.exceptions.ClientError: If the call fails or any secret cannot be
+    retrieved.
+    """
+    response = sm.batch_get_secret_value(SecretIdList=list(secret_ids.values()))
+    for error in response.get("Errors", []):
+        raise ClientError(
+            {"Error": {"Code": error["ErrorCode"], "Message": error["Message"]}},
+            "BatchGetSecretValue",
+        )
+    values = {}
+    for secret in response["SecretValues"]:
+        values[secret["Name"]] = secret["SecretString"]
+        values[secret["ARN"]] = secret["SecretString"]
+    return {field: values[secret_id] for field, secret_id in secret_ids.items()}
+
+
+class SecretsProvider:
+    """
+    In-process cache of a set of secrets, shared across warm Lambda invocations.
+
+    The secrets are fetched on first use and kept for 'ttl' seconds, after which
+    the next call fetches them again. Callers that find the cached values
+    rejected, e.g. after a password rotation, call invalidate() and retry.
+
+    Parameters:
+    - fetch (callable): Called with no arguments, returns the secrets as a dict.
+    - ttl (float): The number of seconds the secrets are cached for.
+    - clock (callable): Returns the current time in seconds.
+    """
+
+    def __init__(self, fetch, ttl=DEFAULT_TTL_SECONDS, clock=time.monotonic):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.clock = clock
+        self._secrets = None
+        self._expires_at = 0
+        self._lock = threading.Lock()
+        _providers.add(self)
+
+    def get(self):
+        """
+        Retrieves the secrets, fetching them if the cache is empty or expired.
+
+        Returns:
+        - dict: A copy of the cached secrets.
+        """
+        with self._lock:
+            if self._secrets is None or self.clock() >= self._expires_at:
+                self._secrets = self.fetch()
+                self._expires_at = self.clock() + self.ttl
+            return dict(self._secrets)
+
+    def invalidate(self):
+        """
+        Discards the cached secrets, so the next call to get() fetches them again.
+        """
+        with self._lock:
+            self._secrets = None
+
+
+def is_authentication_error(error):
+    """
+    Checks whether a pg8000 error was raised because the credentials were
+    rejected.
+
+    Parameters:
+    - error (Exception): The error raised by pg8000.
+
+    Returns:
+    - bool: True if the server rejected the credentials.
+    """
+    details = error.args[0] if error.args else None
+    return isinstance(details, dict) and details.get("C") in AUTH_ERROR_CODES
+
+
+def reset_secrets():
+    """
+    Discards the cached secrets of every provider.
+    """
+    for provider in list(_providers):
+        provider.invalidate()
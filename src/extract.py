@@ -1,11 +1,47 @@
 import pg8000.native
 from pg8000.exceptions import DatabaseError
-import boto3
+from src.aws_clients import get_s3_client, get_secretsmanager_client
+from src.credentials import SecretsProvider, fetch_secrets, is_authentication_error
+from src.connections import ConnectionManager, ConnectionPool, ping_native
+from src.catalog import CatalogCache, read_fingerprint, read_catalog
+from src.columns import ColumnBuffer, append_rows
+from src.metrics import (
+    TableMetrics,
+    MeteredConnection,
+    measuring,
+    current_metrics,
+    timing,
+)
+from src.checkpoints import (
+    Deadline,
+    ExtractionPaused,
+    RunCheckpoint,
+    resuming,
+    current_checkpoint,
+)
+from src.cdc import (
+    OPERATION_COLUMN,
+    create_slot_if_missing,
+    peek_changes,
+    split_transactions,
+    group_changes,
+    parse_lsn,
+    advance_slot,
+)
 from botocore.exceptions import ClientError
 import os
+import io
+import csv
 import json
+import gzip
+import zlib
 from datetime import datetime
+from decimal import Decimal
 import logging
+import math
+import weakref
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 
 logging.basicConfig(level=50)
@@ -14,6 +50,60 @@ Configures the logging module to log only critical messages.
 """
 
 
+EXTRACT_MODES = ("rowcount", "watermark")
+INGEST_LAYOUTS = ("snapshot", "segments")
+CHANGE_PROBES = ("none", "stats", "aggregate")
+EXTRACT_CONSISTENCIES = ("none", "snapshot")
+INGEST_ENGINES = ("poll", "cdc")
+SCHEMA_CATALOGS = ("query", "cached")
+RUN_METRICS = ("none", "manifest")
+EXTRACT_CHECKPOINTS = ("none", "resume")
+EXTRACT_TIME_RESERVE = 10
+REFRESH_POLICY_FIELDS = ("interval_minutes", "priority", "max_age_minutes")
+CDC_SLOT_NAME = "totesys_ingest"
+CDC_BATCH_SIZE = 100000
+INGEST_FORMATS = ("json", "ndjson", "ndjson.gz", "parquet", "csv.gz")
+STREAMING_FORMATS = ("ndjson", "ndjson.gz")
+COPY_FORMATS = ("csv.gz",)
+RANGE_FORMATS = ("ndjson", "ndjson.gz", "csv.gz")
+MAX_KEY_RANGES = 64
+CSV_NULL = "\\N"
+WATERMARK_COLUMN = "last_updated"
+STREAM_BATCH_SIZE = 10000
+MAX_POOL_SIZE = 8
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+PG_TYPE_NAMES = {
+    16: "boolean",
+    20: "integer",
+    21: "integer",
+    23: "integer",
+    700: "float",
+    701: "float",
+    1700: "numeric",
+    1082: "date",
+    1083: "time",
+    1114: "timestamp",
+    1184: "timestamp",
+}
+PYTHON_TYPE_NAMES = {
+    "bool": "boolean",
+    "int": "integer",
+    "float": "float",
+    "Decimal": "numeric",
+    "date": "date",
+    "time": "time",
+    "datetime": "timestamp",
+}
+
+
+DB_SECRET_IDS = {
+    "database": "db_name",
+    "host": "db_host",
+    "user": "db_user",
+    "password": "db_pass",
+}
+
+
 class IngestError(Exception):
     """
     Catch-all Error to make our lambda_handler function shorter and more functional
@@ -29,17 +119,71 @@ def lambda_handler(event, context):
     This function is designed to be used as an AWS Lambda handler. It performs the
     following tasks:
     - Establishes a connection to a database.
-    - Checks if the specified S3 bucket is empty.
+    - Reads the manifest of the tables in the S3 bucket.
     - Retrieves the tables from the database.
     - Manages data updates, archiving, and storage in the S3 bucket.
 
     Workflow:
-    - Retrieves the S3 bucket name and checks if it is empty.
-    - If the bucket is not empty, it copies existing data to an archive location,
-    checks if any tables need updating, and updates them accordingly.
-    - If the bucket is empty, it stores the current date and ingests the latest
-    data from the database tables into the S3 bucket.
-    - Stores the ingestion date in the bucket for reference.
+    - Retrieves the S3 bucket name and the manifest of the current tables.
+    - Reads the extraction mode from the 'EXTRACT_MODE' environment variable:
+    'rowcount' (default) compares row counts, 'watermark' fetches only the rows
+    changed since the stored per-table high-water mark.
+    - Reads the storage format from the 'INGEST_FORMAT' environment variable:
+    'json' (default) stores each table as a dictionary of columns, 'ndjson'
+    stores one JSON object per row, 'ndjson.gz' stores gzip-compressed JSON rows
+    behind a schema line, 'csv.gz' stores gzip-compressed CSV behind a schema
+    line and 'parquet' stores a Parquet file. The NDJSON formats stream
+    full-table extractions straight into S3 with bounded memory; 'csv.gz'
+    exports them with 'COPY ... TO STDOUT', without decoding any value.
+    - Reads the layout of the bucket from the 'INGEST_LAYOUT' environment
+    variable: 'snapshot' (default) rewrites each changed table in the 'latest'
+    folder, 'segments' only writes the new and changed rows of each table as an
+    immutable delta segment listed in 'segments/{table}/manifest.json'.
+    - Reads the change probe from the 'CHANGE_PROBE' environment variable:
+    'none' (default), 'stats' or 'aggregate'. Tables whose probe matches the one
+    stored by the last run in 'probes.json' are skipped without any S3 reads or
+    writes.
+    - Reads the consistency of the run from the 'EXTRACT_CONSISTENCY'
+    environment variable: 'none' (default) or 'snapshot', which reads every
+    table from one snapshot exported with 'pg_export_snapshot', so fact and
+    dimension tables are a consistent cut however many workers read them.
+    - Reads how tables and primary keys are discovered from the
+    'SCHEMA_CATALOG' environment variable: 'query' (default) or 'cached', which
+    keeps them in 'catalog.json' and only reads them again when the schema
+    fingerprint changes.
+    - Reads the ingest engine from the 'INGEST_ENGINE' environment variable:
+    'poll' (default) or 'cdc', which needs the 'segments' layout and stores the
+    inserts, updates and deletes recorded in the logical replication slot named
+    by 'CDC_SLOT' as change segments, checkpointed by LSN in
+    'cdc/checkpoint.json'.
+    - Reads whether the work done per table is recorded from the 'RUN_METRICS'
+    environment variable: 'none' (default) or 'manifest', which stores the
+    rows fetched, bytes written, query and S3 time and starting watermark of
+    each table in 'runs/{run_id}.json' and returns it under 'run'.
+    - Reads the refresh policy of each table from the 'REFRESH_POLICIES'
+    environment variable, see get_refresh_policies. Only the tables due by
+    their policy are extracted, hot tables first, at most 'REFRESH_MAX_TABLES'
+    per run; their refresh times are kept in 'refresh.json'.
+    - Reads whether a run may span several invocations from the
+    'EXTRACT_CHECKPOINT' environment variable: 'none' (default) or 'resume',
+    which checkpoints the run in 'checkpoints/run.json' after every table and
+    stops starting work 'EXTRACT_TIME_RESERVE' seconds before the invocation
+    times out. Tables extracted in key ranges are suspended after the last
+    range written. An unfinished run returns 'status' 'continue' and the next
+    invocation carries it on from the checkpoint, as of its original start
+    time; the state machine invokes the lambda again until the run finishes.
+    - Reads the number of tables extracted in parallel from the
+    'EXTRACT_CONCURRENCY' environment variable (default 1, serial). Each worker
+    uses its own database connection.
+    - Reads the number of rows per key range of large tables from the
+    'EXTRACT_RANGE_ROWS' environment variable (default 0, no ranges), and the
+    number of ranges of one table fetched in parallel from
+    'EXTRACT_RANGE_CONCURRENCY' (default 'EXTRACT_CONCURRENCY').
+    - Tables missing from the manifest are ingested in full; the others are
+    checked for new rows and, if any, stored under the current date.
+    - If any table changed, stores a new version of the manifest pointing at the
+    current key of every table. Unchanged tables cost no S3 writes, and the
+    previous versions of the manifest, kept under 'manifests/', are the archive.
 
     Returns:
     - A message indicating the success or failure of the ingestion process.
@@ -47,8 +191,8 @@ def lambda_handler(event, context):
     Error Handling:
     - If an `IngestError` occurs, it logs the error as a critical issue and returns
     a failure message.
-    - Ensures that the database connection is closed, even if an error occurs during
-    execution.
+    - The database connection is kept open between warm invocations and
+    validated before it is reused.
 
     Example Usage:
     - This function is intended to be deployed in an AWS Lambda environment and
@@ -56,53 +200,235 @@ def lambda_handler(event, context):
     """
     try:
         S3_INGEST_BUCKET = get_bucket_name("S3_INGEST_BUCKET")
-        conn = get_connection()
-        is_empty = is_bucket_empty(S3_INGEST_BUCKET)
-        tables = get_table_names(conn)
-        date = format_date(datetime.now())
-        update_tables_names = []
-        if not is_empty:
-            latest_date = get_date(S3_INGEST_BUCKET)
-            for table_name in tables:
-                copy_table(
-                    S3_INGEST_BUCKET,
-                    f"latest/{latest_date}/{table_name}.json",
-                    f"archive/{latest_date}/{table_name}.json",
-                )
-                needs_update, updated_dict_table = update_dict_table(
-                    S3_INGEST_BUCKET, table_name, latest_date, conn
-                )
-                if needs_update:
-                    update_tables_names.append(table_name)
-                    store_table_in_bucket(
-                        S3_INGEST_BUCKET, updated_dict_table, table_name, date
-                    )
-                else:
-                    copy_table(
-                        S3_INGEST_BUCKET,
-                        f"latest/{latest_date}/{table_name}.json",
-                        f"latest/{date}/{table_name}.json",
-                    )
-                delete_table(
-                    S3_INGEST_BUCKET, f"latest/{latest_date}/{table_name}.json"
-                )
-            store_date_in_bucket(S3_INGEST_BUCKET, date)
+        conn = db_connection.get()
+        checkpoint = None
+        if get_ingest_engine() == "poll" and get_extract_checkpoint() == "resume":
+            checkpoint = RunCheckpoint(
+                get_run_checkpoint(S3_INGEST_BUCKET),
+                Deadline.from_context(context, get_extract_time_reserve()),
+                lambda state: store_run_checkpoint(S3_INGEST_BUCKET, state),
+            )
+        now = datetime.now()
+        if checkpoint is not None and checkpoint.started_at is not None:
+            now = checkpoint.started_at
+        run_id = format_run_id(now)
+        metrics = None
+        if get_run_metrics() == "manifest":
+            metrics = {}
+        catalog = None
+        if get_schema_catalog() == "cached":
+            catalog = get_catalog(conn, S3_INGEST_BUCKET)
+        if get_ingest_engine() == "cdc":
+            if get_ingest_layout() != "segments":
+                raise IngestError("Failed to ingest changes. Needs segments layout.")
+            tables = get_table_names(conn, catalog)
+            updated = ingest_changes(
+                S3_INGEST_BUCKET, conn, tables, run_id, get_ingest_format(), metrics
+            )
+            needs_updates = [table_name in updated for table_name in tables]
         else:
-            store_date_in_bucket(S3_INGEST_BUCKET, date)
-            for table_name in tables:
-                update_tables_names.append(table_name)
-                dict_table = get_dict_table(conn, table_name)
-                store_table_in_bucket(S3_INGEST_BUCKET, dict_table, table_name, date)
-        return {"msg": "Ingestion successful", "tables": update_tables_names}
+            tables, needs_updates = extract_run(
+                S3_INGEST_BUCKET,
+                conn,
+                catalog,
+                now,
+                get_extract_consistency() == "snapshot",
+                metrics,
+                checkpoint,
+            )
+        update_tables_names = [
+            table_name
+            for table_name, needs_update in zip(tables, needs_updates)
+            if needs_update
+        ]
+        if None in needs_updates:
+            if not checkpoint.progressed:
+                raise IngestError("Failed to extract tables. No progress was made.")
+            return {
+                "msg": "Ingestion paused",
+                "status": "continue",
+                "tables": update_tables_names,
+            }
+        if checkpoint is not None:
+            delete_run_checkpoint(S3_INGEST_BUCKET)
+            if metrics is not None:
+                metrics = {
+                    table_name: TableMetrics.from_dict(counters)
+                    for table_name, counters in checkpoint.state["metrics"].items()
+                }
+        response = {"msg": "Ingestion successful", "tables": update_tables_names}
+        if metrics is not None:
+            run_manifest = get_run_manifest(run_id, now, tables, needs_updates, metrics)
+            store_run_manifest(S3_INGEST_BUCKET, run_manifest)
+            response["run"] = run_manifest
+        return response
     except IngestError as e:
         response = {"msg": "Failed to ingest data", "err": str(e)}
         logging.critical(response)
         return response
-    finally:
+
+
+def extract_run(
+    bucket, conn, catalog, now, snapshot=False, metrics=None, checkpoint=None
+):
+    """
+    Extracts the changed tables of an ingestion run with the 'poll' ingest
+    engine, in the layout, mode and format set by the environment, see
+    lambda_handler.
+
+    Given a checkpoint, the run may span several invocations: the first one
+    plans the tables of the run and records the plan in the checkpoint, and
+    every invocation extracts the tables still pending until it runs out of
+    time, see extract_resumable_table. The manifest stored by each invocation
+    lists every table the checkpoint records as stored, so a table finished by
+    an invocation killed before storing the manifest is listed by the next.
+
+    The tables are probed before the snapshot is exported: the probes are not
+    transactional, so a probe read inside the snapshot could count a commit the
+    snapshot does not see, and the next run would skip that change.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - conn (pg8000.native.Connection): The database connection object.
+    - catalog (dict): The catalog of the database, or None, see get_catalog.
+    - now (datetime): The time the run started.
+    - snapshot (bool): If True, the tables are read from a snapshot exported by
+    'conn', see exported_snapshot.
+    - metrics (dict): If given, the work done for each table is recorded in a
+    TableMetrics stored under its name.
+    - checkpoint (RunCheckpoint): The checkpoint of a resumable run, or None.
+
+    Returns:
+    - A tuple containing:
+        - list: The names of the tables extracted.
+        - list: Whether each table was updated, or None for the tables left to
+        a later invocation.
+
+    Raises:
+    - IngestError: If there is an issue extracting or storing any table.
+    """
+    ingest_layout = get_ingest_layout()
+    date = format_date(now)
+    run_id = format_run_id(now)
+    extract_mode = get_extract_mode()
+    ingest_format = get_ingest_format()
+    concurrency = get_extract_concurrency()
+    change_probe = get_change_probe()
+    policies = get_refresh_policies()
+    refresh_times = {}
+    if policies:
+        refresh_times = get_refresh_times(bucket)
+    stored_probes = {}
+    if change_probe != "none":
+        stored_probes = get_stored_probes(bucket)
+    manifest = None
+    if ingest_layout != "segments":
+        manifest = get_manifest(bucket)
+    if checkpoint is not None and checkpoint.tables is not None:
+        tables = checkpoint.tables
+        due_tables = checkpoint.state["due_tables"]
+        probes = checkpoint.state["probes"]
+    else:
+        tables = get_table_names(conn, catalog)
+        if policies:
+            tables = get_due_tables(
+                tables, policies, refresh_times, now, get_refresh_limit()
+            )
+        due_tables = tables
+        probes = get_table_probes(conn, tables, change_probe)
+        if ingest_layout == "segments":
+            tables = get_changed_tables(tables, probes, stored_probes)
+        else:
+            listed = (manifest or {"tables": {}})["tables"]
+            tables = get_changed_tables(
+                tables,
+                probes,
+                {t: p for t, p in stored_probes.items() if t in listed},
+            )
+        if checkpoint is not None:
+            checkpoint.begin(run_id, now, tables, due_tables, probes)
+    if ingest_layout == "segments":
+
+        def extract_table(table_name, table_conn):
+            return append_table_segment(
+                bucket,
+                table_name,
+                run_id,
+                table_conn,
+                extract_mode,
+                ingest_format,
+            )
+
+    else:
+
+        def extract_table(table_name, table_conn):
+            return update_table_from_manifest(
+                bucket,
+                table_name,
+                manifest,
+                date,
+                table_conn,
+                extract_mode,
+                ingest_format,
+            )
+
+    pending = tables
+    if checkpoint is not None:
+        pending = checkpoint.pending()
+        extract_table = extract_resumable_table(extract_table, checkpoint)
+    with exported_snapshot(conn, snapshot) as snapshot_id:
+        results = extract_tables(
+            pending, extract_table, conn, concurrency, snapshot_id, metrics
+        )
+    needs_updates = results
+    if checkpoint is not None:
+        needs_updates = checkpoint.results()
+    if ingest_layout != "segments" and (manifest is None or any(needs_updates)):
+        store_manifest(
+            bucket,
+            get_next_manifest(manifest, tables, needs_updates, date, ingest_format),
+        )
+    paused = {t for t, n in zip(tables, needs_updates) if n is None}
+    probes = {t: p for t, p in probes.items() if t not in paused}
+    if any(probes[t] != stored_probes.get(t) for t in probes):
+        store_probes(bucket, {**stored_probes, **probes})
+    refreshed = {t: now.isoformat() for t in due_tables if t not in paused}
+    if policies and refreshed:
+        store_refresh_times(bucket, {**refresh_times, **refreshed})
+    return tables, needs_updates
+
+
+def extract_resumable_table(extract_table, checkpoint):
+    """
+    Wraps the extraction function of a resumable run so every table finished is
+    recorded in the run checkpoint, and no table is started once the
+    invocation is running out of time.
+
+    Parameters:
+    - extract_table (callable): Called as extract_table(table_name, conn).
+    - checkpoint (RunCheckpoint): The checkpoint of the run.
+
+    Returns:
+    - callable: The wrapped function. It returns None for a table left to a
+    later invocation, either not started or suspended part way.
+    """
+
+    def extract(table_name, conn):
+        if checkpoint.expired():
+            return None
         try:
-            conn.close()
-        except UnboundLocalError:
-            pass
+            with resuming(checkpoint):
+                needs_update = extract_table(table_name, conn)
+        except ExtractionPaused:
+            needs_update = None
+        checkpoint.add_metrics(table_name, current_metrics().as_dict())
+        if needs_update is None:
+            checkpoint.save()
+        else:
+            checkpoint.finish_table(table_name, needs_update)
+        return needs_update
+
+    return extract
 
 
 def format_date(current_time):
@@ -126,271 +452,3024 @@ def get_bucket_name(bucket_name):
         raise IngestError(f"Failed to get env bucket name. {e}")
 
 
-def get_secrets(sm):
+def get_extract_mode():
     """
-    Retrieves database connection details from AWS Secrets Manager.
-
-    Parameters:
-    - sm (boto3.client): The Secrets Manager client.
+    Retrieves the extraction mode used to detect new and changed rows.
 
     Returns:
-    - A dictionary containing database credentials including:
-        - 'database','host','user','password'
+    - str: 'rowcount' (default) or 'watermark'.
+
+    Raises:
+    - IngestError: If the environment variable 'EXTRACT_MODE' holds an unknown mode.
     """
-    db = sm.get_secret_value(SecretId="db_name")["SecretString"]
-    host = sm.get_secret_value(SecretId="db_host")["SecretString"]
-    user = sm.get_secret_value(SecretId="db_user")["SecretString"]
-    password = sm.get_secret_value(SecretId="db_pass")["SecretString"]
-    return {"database": db, "host": host, "user": user, "password": password}
+    mode = os.environ.get("EXTRACT_MODE", "rowcount")
+    if mode not in EXTRACT_MODES:
+        raise IngestError(f"Unknown extract mode. {mode}")
+    return mode
 
 
-def get_connection():
+def get_ingest_format():
     """
-    Establishes a connection to the ToteSys database using credentials from
-    AWS Secrets Manager.
+    Retrieves the storage format of the tables in the ingest bucket.
 
     Returns:
-    - pg8000.native.Connection: A connection object to the database.
+    - str: 'json' (default), 'ndjson', 'ndjson.gz', 'parquet' or 'csv.gz'.
 
     Raises:
-    - IngestError: If there is an issue retrieving secrets or connecting to the
-    database.
+    - IngestError: If the environment variable 'INGEST_FORMAT' holds an unknown
+    format.
     """
-    try:
-        sm = boto3.client("secretsmanager", region_name="eu-west-2")
-        return pg8000.native.Connection(**get_secrets(sm))
-    except ClientError as e:
-        raise IngestError(f"Failed to retrieve secrets. {e}")
-    except Exception as e:
-        raise IngestError(f"Failed to connect to database. {e}")
+    ingest_format = os.environ.get("INGEST_FORMAT", "json")
+    if ingest_format not in INGEST_FORMATS:
+        raise IngestError(f"Unknown ingest format. {ingest_format}")
+    return ingest_format
 
 
-def get_table_names(conn):
+def get_table_key(date, table_name, ingest_format="json"):
     """
-    Retrieves the names of all tables in the ToteSys database.
+    Builds the key of a table in the 'latest' folder of the S3 bucket.
 
     Parameters:
-    - conn (pg8000.native.Connection): The database connection object.
+    - date (str): The ingestion date of the table.
+    - table_name (str): The name of the table.
+    - ingest_format (str): The storage format of the table.
 
     Returns:
-    - A list of table names that are not prefixed with an underscore.
+    - str: The key of the table.
+    """
+    return f"latest/{date}/{table_name}.{ingest_format}"
+
+
+def get_ingest_layout():
+    """
+    Retrieves the layout of the tables in the ingest bucket.
+
+    Returns:
+    - str: 'snapshot' (default) rewrites each table in the 'latest' folder on every
+    update, 'segments' appends the new and changed rows as delta segments.
 
     Raises:
-    - IngestError: If there is an issue executing the query to retrieve table names.
+    - IngestError: If the environment variable 'INGEST_LAYOUT' holds an unknown
+    layout.
     """
-    try:
-        tables = conn.run(
-            "SELECT table_name "
-            "FROM information_schema.tables "
-            "WHERE table_schema='public' "
-            "AND table_type='BASE TABLE';"
-        )
-        return [table[0] for table in tables if table[0][0] != "_"]
-    except DatabaseError as e:
-        raise IngestError(f"Failed to get table names. {e}")
+    layout = os.environ.get("INGEST_LAYOUT", "snapshot")
+    if layout not in INGEST_LAYOUTS:
+        raise IngestError(f"Unknown ingest layout. {layout}")
+    return layout
 
 
-def get_dict_table(conn, table):
+def get_change_probe():
     """
-    Retrieves all rows from a specified table and converts them into a dictionary
-    format.
+    Retrieves the probe used to skip tables that have not changed since the last
+    run.
 
-    Parameters:
-    - conn (pg8000.native.Connection): The database connection object.
-    - table (str): The name of the ToteSys Database table to retrieve data from.
+    Returns:
+    - str: 'none' (default) extracts every table, 'stats' compares the insert,
+    update and delete counters of 'pg_stat_user_tables', 'aggregate' compares
+    the row count and greatest 'last_updated' of each table.
+
+    Raises:
+    - IngestError: If the environment variable 'CHANGE_PROBE' holds an unknown
+    probe.
+    """
+    change_probe = os.environ.get("CHANGE_PROBE", "none")
+    if change_probe not in CHANGE_PROBES:
+        raise IngestError(f"Unknown change probe. {change_probe}")
+    return change_probe
+
+
+def get_ingest_engine():
+    """
+    Retrieves the engine that finds the changes of the tables.
 
     Returns:
-    - dict: A dictionary where the keys are column names and the values are lists of
-    column data.
+    - str: 'poll' (default) queries the tables for new rows, 'cdc' consumes the
+    changes recorded in a logical replication slot.
 
     Raises:
-    - IngestError: If there is an issue executing the query to retrieve table data.
+    - IngestError: If the environment variable 'INGEST_ENGINE' holds an unknown
+    engine.
     """
-    try:
-        values = conn.run(f"SELECT * FROM {table}")
-        columns = [c["name"] for c in conn.columns]
-        return dict(
-            zip(
-                columns,
-                [[row[i] for row in values] for i in range(len(columns))],
-            )
-        )
-    except DatabaseError as e:
-        raise IngestError(f"Failed to get table values, {e}")
+    ingest_engine = os.environ.get("INGEST_ENGINE", "poll")
+    if ingest_engine not in INGEST_ENGINES:
+        raise IngestError(f"Unknown ingest engine. {ingest_engine}")
+    return ingest_engine
 
 
-def is_bucket_empty(bucket):
+def get_cdc_slot_name():
     """
-    Checks whether the S3 bucket is empty.
+    Retrieves the name of the logical replication slot consumed by the 'cdc'
+    ingest engine from the 'CDC_SLOT' environment variable.
 
-    Parameters:
-    - bucket (str): The name of the S3 bucket.
+    Returns:
+    - str: The name of the slot, 'totesys_ingest' by default.
+    """
+    return os.environ.get("CDC_SLOT", CDC_SLOT_NAME)
+
+
+def get_schema_catalog():
+    """
+    Retrieves how the tables and primary keys of the database are discovered.
 
     Returns:
-    - True if the bucket is empty, False if bucket is not empty.
+    - str: 'query' (default) queries them on every run, 'cached' reads them
+    from a catalog that is only read again when the schema fingerprint changes.
 
     Raises:
-    - IngestError: If there is an issue accessing the S3 bucket.
+    - IngestError: If the environment variable 'SCHEMA_CATALOG' holds an unknown
+    value.
     """
-    try:
-        s3 = boto3.client("s3", region_name="eu-west-2")
-        objects = s3.list_objects_v2(Bucket=bucket, Prefix="latest/")
-        if "Contents" not in objects:
-            return True
-        return False
-    except ClientError as e:
-        raise IngestError(f"Failed to check if bucket is empty. {e}")
+    schema_catalog = os.environ.get("SCHEMA_CATALOG", "query")
+    if schema_catalog not in SCHEMA_CATALOGS:
+        raise IngestError(f"Unknown schema catalog. {schema_catalog}")
+    return schema_catalog
 
 
-def delete_table(bucket, key):
+def get_run_metrics():
     """
-    Deletes a specified table from the S3 bucket.
+    Retrieves whether the work done for each table is recorded.
 
-    Parameters:
-    - bucket (str): The name of the S3 bucket.
-    - key (str): The key of the table to delete.
+    Returns:
+    - str: 'none' (default) records nothing, 'manifest' stores the rows, bytes,
+    timings and watermark of each table in a run manifest.
 
     Raises:
-    - IngestError: If there is an issue deleting the object from the S3 bucket.
+    - IngestError: If the environment variable 'RUN_METRICS' holds an unknown
+    value.
     """
-    try:
-        s3 = boto3.client("s3", region_name="eu-west-2")
-        s3.delete_object(Bucket=bucket, Key=f"{key}")
-    except ClientError as e:
-        raise IngestError(f"Failed to delete table. {e}")
+    run_metrics = os.environ.get("RUN_METRICS", "none")
+    if run_metrics not in RUN_METRICS:
+        raise IngestError(f"Unknown run metrics. {run_metrics}")
+    return run_metrics
 
 
-def copy_table(bucket, source_key, destination_key):
+def get_refresh_policies():
     """
-    Copies a table from latest folder to archive folder within the S3 bucket.
+    Retrieves the refresh policy of each table from the 'REFRESH_POLICIES'
+    environment variable, a JSON object mapping table names, or '*' for every
+    other table, to policies:
+    - interval_minutes (number): The table is due once this long has passed
+    since it was last refreshed. Defaults to 0, due on every run.
+    - priority (number): Due tables with a higher priority are extracted first.
+    Defaults to 0.
+    - max_age_minutes (number): Tables refreshed longer ago than this are
+    extracted ahead of any priority. Defaults to no limit.
 
-    Parameters:
-    - bucket (str): The name of the S3 bucket.
-    - source_key (str): The key of latest table.
-    - destination_key (str): The key of the archive folder.
+    Returns:
+    - dict: The policies, empty if the variable is unset, in which case every
+    table is due on every run.
 
     Raises:
-    - IngestError: If there is an issue copying the object within the S3 bucket.
+    - IngestError: If the variable is not a JSON object of valid policies.
     """
     try:
-        s3 = boto3.client("s3", region_name="eu-west-2")
-        s3.copy_object(
-            Bucket=bucket,
-            CopySource={"Bucket": bucket, "Key": f"{source_key}"},
-            Key=f"{destination_key}",
-        )
-    except ClientError as e:
-        raise IngestError(f"Failed to copy table. {e}")
+        policies = json.loads(os.environ.get("REFRESH_POLICIES", "{}"))
+        for policy in policies.values():
+            for field, value in policy.items():
+                if field not in REFRESH_POLICY_FIELDS:
+                    raise ValueError(f"Unknown field {field}")
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise ValueError(f"{field} must be a number")
+        return policies
+    except (ValueError, AttributeError) as e:
+        raise IngestError(f"Invalid refresh policies. {e}")
+
+
+def get_refresh_limit():
+    """
+    Retrieves the maximum number of tables extracted by one run.
 
+    Returns:
+    - int: The value of the 'REFRESH_MAX_TABLES' environment variable, 0 (default)
+    for no limit. Due tables beyond the limit wait for a later run.
 
-def store_table_in_bucket(bucket, dict_table, table_name, date):
+    Raises:
+    - IngestError: If the environment variable is not a non-negative integer.
     """
-    Stores a table (in dictionary format) in the S3 bucket in the 'latest' folder
-    with the current date.
+    value = os.environ.get("REFRESH_MAX_TABLES", "0")
+    try:
+        limit = int(value)
+    except ValueError:
+        limit = -1
+    if limit < 0:
+        raise IngestError(f"Invalid refresh limit. {value}")
+    return limit
+
+
+def get_due_tables(tables, policies, refresh_times, now, limit=0):
+    """
+    Selects the tables due for extraction by their refresh policies, in the
+    order they should be extracted.
+
+    Tables past their maximum age come first, then tables by descending
+    priority, then the longest unrefreshed. Tables never refreshed count as
+    infinitely old, so they are past any maximum age and come first.
+
+    Parameters:
+    - tables (list): The names of the tables.
+    - policies (dict): The refresh policies, see get_refresh_policies.
+    - refresh_times (dict): The time each table was last refreshed, as ISO
+    strings.
+    - now (datetime): The time of the run.
+    - limit (int): The maximum number of tables to select, 0 for no limit.
+
+    Returns:
+    - list: The names of the due tables.
+    """
+    default = policies.get("*", {})
+    due = []
+    for table_name in tables:
+        policy = {**default, **policies.get(table_name, {})}
+        refreshed = refresh_times.get(table_name)
+        age = math.inf
+        if refreshed is not None:
+            age = (now - datetime.fromisoformat(refreshed)).total_seconds() / 60
+        if age < policy.get("interval_minutes", 0):
+            continue
+        overdue = age >= policy.get("max_age_minutes", math.inf)
+        due.append((not overdue, -policy.get("priority", 0), -age, table_name))
+    due.sort(key=lambda entry: entry[:3])
+    if limit:
+        due = due[:limit]
+    return [table_name for *_, table_name in due]
+
+
+def format_run_id(current_time):
+    return current_time.strftime("%Y%m%dT%H%M%S")
+
+
+def get_segment_key(table_name, run_id, ingest_format="json"):
+    """
+    Builds the key of the delta segment written by an ingestion run.
 
     Parameters:
-    - bucket (str): The name of the S3 bucket.
-    - dict_table (dict): The table data in dictionary format.
     - table_name (str): The name of the table.
-    - date (str): The current date to be used in the key.
+    - run_id (str): The timestamp of the ingestion run, see format_run_id.
+    - ingest_format (str): The storage format of the segment.
+
+    Returns:
+    - str: The key of the segment.
+    """
+    return f"segments/{table_name}/{run_id}.{ingest_format}"
+
+
+def get_extract_concurrency():
+    """
+    Retrieves the maximum number of tables extracted in parallel.
+
+    Returns:
+    - int: The value of the 'EXTRACT_CONCURRENCY' environment variable, 1 if unset.
 
     Raises:
-    - IngestError: If there is an issue storing the table in the S3 bucket.
+    - IngestError: If the value is not a positive integer.
     """
     try:
-        s3 = boto3.client("s3", region_name="eu-west-2")
-        s3.put_object(
-            Body=json.dumps(dict_table, indent=4, default=str).encode(),
-            Bucket=bucket,
-            Key=f"latest/{date}/{table_name}.json",
-        )
-    except ClientError as e:
-        raise IngestError(f"Failed to store table in bucket. {e}")
+        concurrency = int(os.environ.get("EXTRACT_CONCURRENCY", "1"))
+    except ValueError as e:
+        raise IngestError(f"Invalid extract concurrency. {e}")
+    if concurrency < 1:
+        raise IngestError(f"Invalid extract concurrency. {concurrency}")
+    return concurrency
 
 
-def store_date_in_bucket(bucket, date):
+def get_extract_range_concurrency():
     """
-    Stores the current date in the S3 bucket under the key 'latest_date'.
+    Retrieves the maximum number of key ranges of one table fetched in parallel,
+    see extract_table_in_ranges.
 
-    Parameters:
-    - bucket (str): The name of the S3 bucket.
-    - date (str): The current date to store.
+    Returns:
+    - int: The value of the 'EXTRACT_RANGE_CONCURRENCY' environment variable,
+    or the extract concurrency if unset.
 
     Raises:
-    - IngestError: If there is an issue storing the date in the S3 bucket.
+    - IngestError: If the value is not a positive integer.
     """
+    if "EXTRACT_RANGE_CONCURRENCY" not in os.environ:
+        return get_extract_concurrency()
     try:
-        s3 = boto3.client("s3", region_name="eu-west-2")
-        s3.put_object(
-            Body=date.encode(),
-            Bucket=bucket,
-            Key="latest_date",
-        )
-    except ClientError as e:
-        raise IngestError(f"Failed to store date in bucket. {e}")
+        concurrency = int(os.environ["EXTRACT_RANGE_CONCURRENCY"])
+    except ValueError as e:
+        raise IngestError(f"Invalid extract range concurrency. {e}")
+    if concurrency < 1:
+        raise IngestError(f"Invalid extract range concurrency. {concurrency}")
+    return concurrency
 
 
-def get_date(bucket):
+def get_extract_consistency():
     """
-    Retrieves the latest ingestion date from the S3 bucket.
+    Retrieves the consistency of the tables read by one run.
 
-    Parameters:
-    - bucket (str): The name of the S3 bucket.
+    Returns:
+    - str: 'none' (default) reads each table as of when it is read, 'snapshot'
+    reads every table from one snapshot exported by the handler's connection.
+
+    Raises:
+    - IngestError: If the environment variable 'EXTRACT_CONSISTENCY' holds an
+    unknown value.
+    """
+    consistency = os.environ.get("EXTRACT_CONSISTENCY", "none")
+    if consistency not in EXTRACT_CONSISTENCIES:
+        raise IngestError(f"Unknown extract consistency. {consistency}")
+    return consistency
+
+
+def get_extract_checkpoint():
+    """
+    Retrieves whether an ingestion run may span several invocations.
 
     Returns:
-    - str: The latest ingestion date as a string.
+    - str: 'none' (default) extracts every table in one invocation, 'resume'
+    checkpoints the run in the S3 bucket and stops before the invocation times
+    out, to carry on in the next one.
 
     Raises:
-    - IngestError: If there is an issue retrieving the date from the S3 bucket.
+    - IngestError: If the environment variable 'EXTRACT_CHECKPOINT' holds an
+    unknown value.
     """
-    try:
-        s3 = boto3.client("s3", region_name="eu-west-2")
-        date_object = s3.get_object(Bucket=bucket, Key="latest_date")
-        return date_object["Body"].read().decode()
-    except ClientError as e:
-        raise IngestError(f"Failed to get date from bucket. {e}")
+    checkpoint = os.environ.get("EXTRACT_CHECKPOINT", "none")
+    if checkpoint not in EXTRACT_CHECKPOINTS:
+        raise IngestError(f"Unknown extract checkpoint. {checkpoint}")
+    return checkpoint
 
 
-def update_dict_table(bucket, table_name, latest_date, conn):
+def get_extract_time_reserve():
     """
-    Updates a dictionary table with new rows from the database, if any are available.
+    Retrieves the time an invocation keeps back to store its checkpoint and
+    return when a run is resumable.
+
+    Returns:
+    - float: The value of the 'EXTRACT_TIME_RESERVE' environment variable in
+    seconds, 10 if unset. It should cover fetching one key range or one small
+    table.
+
+    Raises:
+    - IngestError: If the value is not a non-negative number.
+    """
+    try:
+        reserve = float(os.environ.get("EXTRACT_TIME_RESERVE", EXTRACT_TIME_RESERVE))
+    except ValueError as e:
+        raise IngestError(f"Invalid extract time reserve. {e}")
+    if not reserve >= 0:
+        raise IngestError(f"Invalid extract time reserve. {reserve}")
+    return reserve
 
-    Parameters:
-    - bucket (str): The name of the S3 bucket.
-    - table_name (str): The name of the table to update.
-    - latest_date (str): The date of the last ingestion.
-    - conn (pg8000.native.Connection): The database connection object.
+
+def get_extract_range_rows():
+    """
+    Retrieves the number of rows per key range when large tables are extracted in
+    parallel key ranges.
 
     Returns:
-    - A tuple containing:
-        - bool: True if the table was updated, False if not.
-        - dict: The updated table in dictionary format.
+    - int: The value of the 'EXTRACT_RANGE_ROWS' environment variable, 0 if unset,
+    which disables key-range extraction.
 
     Raises:
-    - IngestError: If there is an issue retrieving or updating the table.
+    - IngestError: If the value is not a non-negative integer.
     """
     try:
-        s3 = boto3.client("s3", region_name="eu-west-2")
-        table_object = s3.get_object(
-            Bucket=bucket, Key=f"latest/{latest_date}/{table_name}.json"
-        )
-        dict_table = json.loads(table_object["Body"].read().decode())
-        
-        query = f"SELECT created_at FROM {table_name}"
-        db_row_count = len(conn.run(query)) 
-        s3_row_count = len(dict_table["created_at"]) 
-        
-        if db_row_count > s3_row_count:
-            update_rows = conn.run(
-                f"SELECT * FROM {table_name} OFFSET :length",
-                length=s3_row_count,
-            ) 
-            columns = [c["name"] for c in conn.columns]
-            
-            for column, values in zip(columns, zip(*update_rows)):
-                dict_table[column] += values
-            
-            return True, dict_table
-        return (False, dict_table)
-    except Exception as e:
-        raise IngestError(f"Failed to update table. {e}")
+        range_rows = int(os.environ.get("EXTRACT_RANGE_ROWS", "0"))
+    except ValueError as e:
+        raise IngestError(f"Invalid extract range rows. {e}")
+    if range_rows < 0:
+        raise IngestError(f"Invalid extract range rows. {range_rows}")
+    return range_rows
+
+
+def get_secrets(sm):
+    """
+    Retrieves database connection details from AWS Secrets Manager in a single
+    batched call.
+
+    Parameters:
+    - sm (boto3.client): The Secrets Manager client.
+
+    Returns:
+    - A dictionary containing database credentials including:
+        - 'database','host','user','password'
+    """
+    return fetch_secrets(sm, DB_SECRET_IDS)
+
+
+db_secrets = SecretsProvider(lambda: get_secrets(get_secretsmanager_client()))
+"""
+Database credentials cached across warm invocations, see SecretsProvider.
+"""
+
+db_connection = ConnectionManager(lambda: get_connection(), ping_native)
+"""
+Database connection kept open across warm invocations, see ConnectionManager.
+"""
+
+db_pool = ConnectionPool(lambda: get_connection(), ping_native, MAX_POOL_SIZE)
+"""
+Database connections used by the concurrent extraction workers, see
+ConnectionPool.
+"""
+
+range_pool = ConnectionPool(lambda: get_connection(), ping_native, MAX_POOL_SIZE)
+"""
+Database connections used to fetch the key ranges of large tables. Kept apart
+from 'db_pool', so range workers never wait on connections held by the table
+workers that started them.
+"""
+
+catalog_cache = CatalogCache()
+"""
+Catalog of the database cached across warm invocations, see CatalogCache.
+"""
+
+
+def get_connection():
+    """
+    Establishes a connection to the ToteSys database using credentials from
+    AWS Secrets Manager.
+
+    The credentials are cached across warm invocations. If the database rejects
+    them, they are fetched again and the connection is retried once.
+
+    Returns:
+    - MeteredConnection: A connection object to the database, whose queries
+    count towards the metrics of the table being extracted.
+
+    Raises:
+    - IngestError: If there is an issue retrieving secrets or connecting to the
+    database.
+    """
+    try:
+        try:
+            return MeteredConnection(pg8000.native.Connection(**db_secrets.get()))
+        except DatabaseError as e:
+            if not is_authentication_error(e):
+                raise
+            db_secrets.invalidate()
+            return MeteredConnection(pg8000.native.Connection(**db_secrets.get()))
+    except ClientError as e:
+        raise IngestError(f"Failed to retrieve secrets. {e}")
+    except Exception as e:
+        raise IngestError(f"Failed to connect to database. {e}")
+
+
+snapshot_connections = weakref.WeakKeyDictionary()
+"""
+Maps each connection inside a transaction on an exported snapshot to the id of
+the snapshot. Reads on these connections run inside that transaction instead of
+opening their own.
+"""
+
+
+@contextmanager
+def exported_snapshot(conn, enabled=True):
+    """
+    Opens a repeatable-read transaction on a connection and exports its snapshot,
+    so other connections can read the database as of the same instant.
+
+    The transaction, and so the snapshot, stays open until the with block exits.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - enabled (bool): If False, no snapshot is exported and None is yielded.
+
+    Yields:
+    - str: The id of the exported snapshot, or None.
+
+    Raises:
+    - IngestError: If the snapshot cannot be exported.
+    """
+    if not enabled:
+        yield None
+        return
+    try:
+        conn.run("START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        snapshot_id = conn.run("SELECT pg_export_snapshot()")[0][0]
+    except DatabaseError as e:
+        end_transaction_quietly(conn)
+        raise IngestError(f"Failed to export snapshot. {e}")
+    snapshot_connections[conn] = snapshot_id
+    try:
+        yield snapshot_id
+    finally:
+        snapshot_connections.pop(conn, None)
+        end_transaction_quietly(conn)
+
+
+@contextmanager
+def attached_snapshot(conn, snapshot_id):
+    """
+    Opens a repeatable-read transaction on a connection that reads from an
+    exported snapshot, for the duration of a with block.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - snapshot_id (str): The id of the exported snapshot, or None to leave the
+    connection as it is.
+
+    Raises:
+    - IngestError: If the connection cannot attach to the snapshot.
+    """
+    if snapshot_id is None:
+        yield
+        return
+    try:
+        conn.run("START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+        conn.run(f"SET TRANSACTION SNAPSHOT '{snapshot_id}'")
+    except DatabaseError as e:
+        end_transaction_quietly(conn)
+        raise IngestError(f"Failed to attach to snapshot. {e}")
+    snapshot_connections[conn] = snapshot_id
+    try:
+        yield
+    finally:
+        snapshot_connections.pop(conn, None)
+        end_transaction_quietly(conn)
+
+
+def end_transaction_quietly(conn):
+    """
+    Ends the read-only transaction of a connection, ignoring errors from
+    connections that are already broken.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    """
+    try:
+        conn.run("ROLLBACK")
+    except Exception:
+        pass
+
+
+def start_read_transaction(conn, isolation=None):
+    """
+    Starts the read-only transaction of a read that spans several statements,
+    unless the connection is already reading from an exported snapshot.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - isolation (str): The isolation level, e.g. 'REPEATABLE READ', or None for
+    the server default.
+    """
+    if conn in snapshot_connections:
+        return
+    if isolation is None:
+        conn.run("START TRANSACTION READ ONLY")
+    else:
+        conn.run(f"START TRANSACTION ISOLATION LEVEL {isolation} READ ONLY")
+
+
+def commit_read_transaction(conn):
+    """
+    Commits a transaction started by start_read_transaction.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    """
+    if conn not in snapshot_connections:
+        conn.run("COMMIT")
+
+
+def rollback_read_transaction(conn):
+    """
+    Rolls back a transaction started by start_read_transaction after an error,
+    ignoring errors from connections that are already broken.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    """
+    if conn not in snapshot_connections:
+        try:
+            conn.run("ROLLBACK")
+        except DatabaseError:
+            pass
+
+
+def get_table_names(conn, catalog=None):
+    """
+    Retrieves the names of all tables in the ToteSys database.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - catalog (dict): The catalog of the database, see get_catalog. If given,
+    the names are taken from it instead of queried.
+
+    Returns:
+    - A list of table names that are not prefixed with an underscore.
+
+    Raises:
+    - IngestError: If there is an issue executing the query to retrieve table names.
+    """
+    if catalog is not None:
+        return [table for table in catalog["tables"] if table[0] != "_"]
+    try:
+        tables = conn.run(
+            "SELECT table_name "
+            "FROM information_schema.tables "
+            "WHERE table_schema='public' "
+            "AND table_type='BASE TABLE';"
+        )
+        return [table[0] for table in tables if table[0][0] != "_"]
+    except DatabaseError as e:
+        raise IngestError(f"Failed to get table names. {e}")
+
+
+def get_stored_catalog(bucket):
+    """
+    Retrieves the catalog stored by the last run from the S3 bucket.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+
+    Returns:
+    - dict: The catalog, or None if none has been stored yet.
+
+    Raises:
+    - IngestError: If there is an issue retrieving the catalog from the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        catalog_object = s3.get_object(Bucket=bucket, Key="catalog.json")
+        return json.loads(catalog_object["Body"].read().decode())
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            return None
+        raise IngestError(f"Failed to get catalog from bucket. {e}")
+
+
+def store_catalog(bucket, catalog):
+    """
+    Stores the catalog in the S3 bucket under 'catalog.json', where later cold
+    starts and the downstream stages can read the typed columns of each table.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - catalog (dict): The catalog to store.
+
+    Raises:
+    - IngestError: If there is an issue storing the catalog in the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        s3.put_object(
+            Body=json.dumps(catalog).encode(), Bucket=bucket, Key="catalog.json"
+        )
+    except ClientError as e:
+        raise IngestError(f"Failed to store catalog in bucket. {e}")
+
+
+def get_catalog(conn, bucket):
+    """
+    Retrieves the tables, columns, types and primary keys of the database.
+
+    Only the schema fingerprint is queried on every run. The catalog itself is
+    taken from 'catalog_cache' on warm invocations, or from the copy stored in
+    the S3 bucket on cold starts, and only read from the database when the
+    fingerprint has changed. The catalog is left in 'catalog_cache', where
+    get_primary_key looks up primary keys for the rest of the run.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - bucket (str): The name of the S3 bucket.
+
+    Returns:
+    - dict: The catalog, see read_catalog.
+
+    Raises:
+    - IngestError: If there is an issue reading or storing the catalog.
+    """
+    try:
+        fingerprint = read_fingerprint(conn)
+        catalog = catalog_cache.get(fingerprint)
+        if catalog is not None:
+            return catalog
+        catalog = get_stored_catalog(bucket)
+        if catalog is None or catalog["fingerprint"] != fingerprint:
+            catalog = read_catalog(conn, fingerprint)
+            store_catalog(bucket, catalog)
+    except DatabaseError as e:
+        raise IngestError(f"Failed to get catalog. {e}")
+    catalog_cache.put(catalog)
+    return catalog
+
+
+def get_refresh_times(bucket):
+    """
+    Retrieves the time each table was last refreshed from 'refresh.json' in the
+    S3 bucket.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+
+    Returns:
+    - dict: The refresh time of each table as an ISO string, empty if none have
+    been stored yet.
+
+    Raises:
+    - IngestError: If there is an issue retrieving the times from the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        times_object = s3.get_object(Bucket=bucket, Key="refresh.json")
+        return json.loads(times_object["Body"].read().decode())
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            return {}
+        raise IngestError(f"Failed to get refresh times from bucket. {e}")
+
+
+def store_refresh_times(bucket, refresh_times):
+    """
+    Stores the time each table was last refreshed in the S3 bucket under
+    'refresh.json'.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - refresh_times (dict): The refresh time of each table as an ISO string.
+
+    Raises:
+    - IngestError: If there is an issue storing the times in the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        s3.put_object(
+            Body=json.dumps(refresh_times).encode(), Bucket=bucket, Key="refresh.json"
+        )
+    except ClientError as e:
+        raise IngestError(f"Failed to store refresh times in bucket. {e}")
+
+
+def get_table_probes(conn, tables, change_probe):
+    """
+    Probes the tables for changes without reading their rows.
+
+    'stats' reads the cumulative insert, update and delete counters of every table
+    from 'pg_stat_user_tables' in a single query. 'aggregate' runs
+    'SELECT count(*), max(last_updated)' on each table. An index on
+    'last_updated' answers the max() directly, but count(*) still reads every
+    row, at best as an index-only scan, so this probe costs time in proportion
+    to the size of each table on every run; it is exact where 'stats' is not
+    available. A table whose probe matches the one stored by the last run has
+    not changed since.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - tables (list): The names of the tables to probe.
+    - change_probe (str): 'none', 'stats' or 'aggregate'.
+
+    Returns:
+    - dict: Maps each probed table name to its probe, a JSON-compatible list.
+    Tables that could not be probed are left out.
+
+    Raises:
+    - IngestError: If there is an issue running the probes.
+    """
+    try:
+        if change_probe == "stats":
+            rows = conn.run(
+                "SELECT relname, n_tup_ins, n_tup_upd, n_tup_del "
+                "FROM pg_stat_user_tables "
+                "WHERE schemaname='public';"
+            )
+            counters = {row[0]: list(row[1:]) for row in rows}
+            return {
+                table_name: counters[table_name]
+                for table_name in tables
+                if table_name in counters
+            }
+        if change_probe == "aggregate":
+            probes = {}
+            for table_name in tables:
+                row_count, last_updated = conn.run(
+                    f"SELECT count(*), max({WATERMARK_COLUMN}) FROM {table_name}"
+                )[0]
+                probes[table_name] = [row_count, str(last_updated)]
+            return probes
+        return {}
+    except DatabaseError as e:
+        raise IngestError(f"Failed to probe tables. {e}")
+
+
+def get_changed_tables(tables, probes, stored_probes):
+    """
+    Selects the tables that may have changed since the last run.
+
+    Parameters:
+    - tables (list): The names of the tables.
+    - probes (dict): The current probes, see get_table_probes.
+    - stored_probes (dict): The probes stored by the last run.
+
+    Returns:
+    - list: The tables without a current probe or whose probe differs from the
+    stored one, in the order of 'tables'.
+    """
+    return [
+        table_name
+        for table_name in tables
+        if probes.get(table_name) is None
+        or probes[table_name] != stored_probes.get(table_name)
+    ]
+
+
+def get_stored_probes(bucket):
+    """
+    Retrieves the table probes stored by the last run from the S3 bucket.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+
+    Returns:
+    - dict: Maps each table name to its probe, empty if none has been stored yet.
+
+    Raises:
+    - IngestError: If there is an issue retrieving the probes from the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        probes_object = s3.get_object(Bucket=bucket, Key="probes.json")
+        return json.loads(probes_object["Body"].read().decode())
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            return {}
+        raise IngestError(f"Failed to get probes from bucket. {e}")
+
+
+def store_probes(bucket, probes):
+    """
+    Stores the table probes in the S3 bucket under 'probes.json'.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - probes (dict): Maps each table name to its probe.
+
+    Raises:
+    - IngestError: If there is an issue storing the probes in the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        s3.put_object(
+            Body=json.dumps(probes).encode(), Bucket=bucket, Key="probes.json"
+        )
+    except ClientError as e:
+        raise IngestError(f"Failed to store probes in bucket. {e}")
+
+
+def get_dict_table(conn, table):
+    """
+    Retrieves all rows from a specified table and converts them into a dictionary
+    format.
+
+    The rows are fetched through a server-side cursor, 'STREAM_BATCH_SIZE' at a
+    time, and appended to a ColumnBuffer per column, so only one batch of rows
+    is held as Python objects at once.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - table (str): The name of the ToteSys Database table to retrieve data from.
+
+    Returns:
+    - dict: A dictionary where the keys are column names and the values are
+    ColumnBuffers of column data.
+
+    Raises:
+    - IngestError: If there is an issue executing the query to retrieve table data.
+    """
+    try:
+        start_read_transaction(conn)
+        conn.run(f"DECLARE dict_cursor NO SCROLL CURSOR FOR SELECT * FROM {table}")
+        dict_table = None
+        while True:
+            rows = conn.run(f"FETCH FORWARD {STREAM_BATCH_SIZE} FROM dict_cursor")
+            if dict_table is None:
+                dict_table = {c["name"]: ColumnBuffer() for c in conn.columns}
+            append_rows(dict_table, rows)
+            current_metrics().add(rows=len(rows))
+            if len(rows) < STREAM_BATCH_SIZE:
+                break
+        conn.run("CLOSE dict_cursor")
+        commit_read_transaction(conn)
+        return dict_table
+    except DatabaseError as e:
+        rollback_read_transaction(conn)
+        raise IngestError(f"Failed to get table values, {e}")
+
+
+def is_bucket_empty(bucket):
+    """
+    Checks whether the S3 bucket is empty.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+
+    Returns:
+    - True if the bucket is empty, False if bucket is not empty.
+
+    Raises:
+    - IngestError: If there is an issue accessing the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        objects = s3.list_objects_v2(Bucket=bucket, Prefix="latest/")
+        if "Contents" not in objects:
+            return True
+        return False
+    except ClientError as e:
+        raise IngestError(f"Failed to check if bucket is empty. {e}")
+
+
+def delete_table(bucket, key):
+    """
+    Deletes a specified table from the S3 bucket.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - key (str): The key of the table to delete.
+
+    Raises:
+    - IngestError: If there is an issue deleting the object from the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        s3.delete_object(Bucket=bucket, Key=f"{key}")
+    except ClientError as e:
+        raise IngestError(f"Failed to delete table. {e}")
+
+
+def store_table_in_bucket(
+    bucket, dict_table, table_name, date, ingest_format="json", key=None
+):
+    """
+    Stores a table (in dictionary format) in the S3 bucket in the 'latest' folder
+    with the current date.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - dict_table (dict): The table data in dictionary format.
+    - table_name (str): The name of the table.
+    - date (str): The current date to be used in the key.
+    - ingest_format (str): The storage format of the table.
+    - key (str): The key to store the table under, instead of the 'latest' folder.
+
+    Raises:
+    - IngestError: If there is an issue storing the table in the S3 bucket.
+    """
+    body = serialise_dict_table(dict_table, ingest_format)
+    try:
+        s3 = get_s3_client()
+        with timing("s3"):
+            s3.put_object(
+                Body=body,
+                Bucket=bucket,
+                Key=key or get_table_key(date, table_name, ingest_format),
+            )
+        current_metrics().add(written=len(body))
+    except ClientError as e:
+        raise IngestError(f"Failed to store table in bucket. {e}")
+
+
+def get_date(bucket):
+    """
+    Retrieves the latest ingestion date from the S3 bucket.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+
+    Returns:
+    - str: The latest ingestion date as a string.
+
+    Raises:
+    - IngestError: If there is an issue retrieving the date from the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        date_object = s3.get_object(Bucket=bucket, Key="latest_date")
+        return date_object["Body"].read().decode()
+    except ClientError as e:
+        raise IngestError(f"Failed to get date from bucket. {e}")
+
+
+def get_schema_from_columns(columns):
+    """
+    Builds the schema of a query result from the column descriptions of pg8000.
+
+    Parameters:
+    - columns (list): The column descriptions in 'conn.columns'.
+
+    Returns:
+    - list: A list of {'name', 'type'} dictionaries, one per column.
+    """
+    return [
+        {"name": c["name"], "type": PG_TYPE_NAMES.get(c["type_oid"], "text")}
+        for c in columns
+    ]
+
+
+def get_schema_from_dict_table(dict_table):
+    """
+    Infers the schema of a table in dictionary format from its first non-null
+    value in each column.
+
+    Parameters:
+    - dict_table (dict): The table data in dictionary format.
+
+    Returns:
+    - list: A list of {'name', 'type'} dictionaries, one per column.
+    """
+    schema = []
+    for column, values in dict_table.items():
+        value = next((v for v in values if v is not None), None)
+        schema.append(
+            {"name": column, "type": PYTHON_TYPE_NAMES.get(type(value).__name__, "text")}
+        )
+    return schema
+
+
+def encode_ndjson_rows(columns, rows, ingest_format):
+    """
+    Encodes rows as newline-delimited JSON.
+
+    'ndjson' writes each row as an object keyed by column name. 'ndjson.gz' writes
+    each row as an array, since the column names are held by the schema line.
+
+    Parameters:
+    - columns (list): The column names of the rows.
+    - rows (iterable): The rows to encode.
+    - ingest_format (str): 'ndjson' or 'ndjson.gz'.
+
+    Returns:
+    - bytes: The encoded rows, uncompressed.
+    """
+    if ingest_format == "ndjson":
+        lines = (json.dumps(dict(zip(columns, row)), default=str) for row in rows)
+    else:
+        lines = (json.dumps(list(row), default=str) for row in rows)
+    return "".join(line + "\n" for line in lines).encode()
+
+
+def encode_schema_line(schema):
+    """
+    Encodes the schema line that opens an 'ndjson.gz' table.
+
+    Parameters:
+    - schema (list): A list of {'name', 'type'} dictionaries.
+
+    Returns:
+    - bytes: The encoded schema line.
+    """
+    return (json.dumps({"schema": schema}) + "\n").encode()
+
+
+def format_csv_value(value):
+    """
+    Formats a value the way Postgres writes it in 'COPY ... (FORMAT csv)'.
+
+    Parameters:
+    - value: The value to format.
+
+    Returns:
+    - str: The formatted value, CSV_NULL for None.
+    """
+    if value is None:
+        return CSV_NULL
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, datetime):
+        return format_csv_timestamp(value)
+    return str(value)
+
+
+def format_csv_timestamp(value):
+    """
+    Formats a timestamp the way Postgres writes it as text: the fraction of a
+    second without its trailing zeros, and the offset in whole hours unless it
+    has minutes, e.g. '2022-11-03 14:20:49.962+00'.
+
+    Parameters:
+    - value (datetime): The timestamp to format.
+
+    Returns:
+    - str: The formatted timestamp.
+    """
+    text = value.strftime("%Y-%m-%d %H:%M:%S")
+    if value.microsecond:
+        text += f".{value.microsecond:06d}".rstrip("0")
+    offset = value.utcoffset()
+    if offset is not None:
+        sign = "-" if offset.days < 0 else "+"
+        minutes = abs(offset).seconds // 60
+        text += f"{sign}{minutes // 60:02d}"
+        if minutes % 60:
+            text += f":{minutes % 60:02d}"
+    return text
+
+
+def parse_csv_value(value, column_type):
+    """
+    Converts a value read from a 'csv.gz' table to the type of its column.
+
+    Parameters:
+    - value (str): The value as written in the CSV.
+    - column_type (str): The type of the column in the schema line.
+
+    Returns:
+    - The converted value, None for CSV_NULL. Timestamps are converted to
+    datetimes, so rows appended to the table hold values of the same type.
+    Columns other than integers, floats, booleans and timestamps are kept as
+    strings.
+    """
+    if value == CSV_NULL:
+        return None
+    if column_type == "integer":
+        return int(value)
+    if column_type == "float":
+        return float(value)
+    if column_type == "boolean":
+        return value == "t"
+    if column_type == "timestamp":
+        return datetime.fromisoformat(value)
+    return value
+
+
+def encode_csv_rows(rows):
+    """
+    Encodes rows as CSV in the format of Postgres 'COPY ... (FORMAT csv)'.
+
+    Parameters:
+    - rows (iterable): The rows to encode.
+
+    Returns:
+    - bytes: The encoded rows, uncompressed.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    for row in rows:
+        writer.writerow([format_csv_value(value) for value in row])
+    return buffer.getvalue().encode()
+
+
+def encode_json_value(value):
+    """
+    Encodes the values json cannot, for json.dumps(default=...): ColumnBuffers
+    as lists, anything else, e.g. dates and decimals, as strings.
+
+    Parameters:
+    - value: The value to encode.
+
+    Returns:
+    - list or str: The encoded value.
+    """
+    if isinstance(value, ColumnBuffer):
+        return value.tolist()
+    return str(value)
+
+
+def serialise_dict_table(dict_table, ingest_format="json"):
+    """
+    Serialises a table in dictionary format into the given ingest format.
+
+    'parquet' requires pandas and fastparquet to be installed in the ingest layer.
+
+    Parameters:
+    - dict_table (dict): The table data in dictionary format.
+    - ingest_format (str): The storage format of the table.
+
+    Returns:
+    - bytes: The serialised table.
+
+    Raises:
+    - IngestError: If the table cannot be serialised.
+    """
+    columns = list(dict_table)
+    rows = zip(*dict_table.values())
+    if ingest_format == "ndjson":
+        return encode_ndjson_rows(columns, rows, ingest_format)
+    if ingest_format == "ndjson.gz":
+        return gzip.compress(
+            encode_schema_line(get_schema_from_dict_table(dict_table))
+            + encode_ndjson_rows(columns, rows, ingest_format)
+        )
+    if ingest_format == "csv.gz":
+        return gzip.compress(
+            encode_schema_line(get_schema_from_dict_table(dict_table))
+            + encode_csv_rows(rows)
+        )
+    if ingest_format == "parquet":
+        try:
+            import pandas as pd
+
+            df = pd.DataFrame(
+                {
+                    column: [
+                        str(v) if isinstance(v, Decimal) else v for v in values
+                    ]
+                    for column, values in dict_table.items()
+                }
+            )
+            buffer = io.BytesIO()
+            df.to_parquet(buffer, index=False)
+            return buffer.getvalue()
+        except Exception as e:
+            raise IngestError(f"Failed to serialise table to parquet. {e}")
+    return json.dumps(
+        dict_table, separators=(",", ":"), default=encode_json_value
+    ).encode()
+
+
+def deserialise_dict_table(body, ingest_format="json"):
+    """
+    Deserialises a table stored in the given ingest format into dictionary format.
+
+    Parameters:
+    - body (bytes): The stored table.
+    - ingest_format (str): The storage format of the table.
+
+    Returns:
+    - dict: A dictionary where the keys are column names and the values are
+    ColumnBuffers of column data, or lists for 'parquet'.
+    """
+    if ingest_format == "ndjson":
+        dict_table = {}
+        for line in body.splitlines():
+            for column, value in json.loads(line).items():
+                dict_table.setdefault(column, ColumnBuffer()).append(value)
+        return dict_table
+    if ingest_format == "ndjson.gz":
+        lines = gzip.decompress(body).splitlines()
+        columns = [c["name"] for c in json.loads(lines[0])["schema"]]
+        dict_table = {column: ColumnBuffer() for column in columns}
+        for line in lines[1:]:
+            append_rows(dict_table, [json.loads(line)])
+        return dict_table
+    if ingest_format == "csv.gz":
+        schema_line, _, body = gzip.decompress(body).partition(b"\n")
+        schema = json.loads(schema_line)["schema"]
+        dict_table = {column["name"]: ColumnBuffer() for column in schema}
+        for row in csv.reader(io.StringIO(body.decode())):
+            for column, value in zip(schema, row):
+                dict_table[column["name"]].append(
+                    parse_csv_value(value, column["type"])
+                )
+        return dict_table
+    if ingest_format == "parquet":
+        import pandas as pd
+
+        return pd.read_parquet(io.BytesIO(body)).to_dict("list")
+    return {
+        column: ColumnBuffer(values)
+        for column, values in json.loads(body.decode()).items()
+    }
+
+
+def get_dict_table_from_bucket(bucket, key, ingest_format="json"):
+    """
+    Retrieves a table stored in the S3 bucket and converts it into dictionary
+    format.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - key (str): The key of the table.
+    - ingest_format (str): The storage format of the table.
+
+    Returns:
+    - dict: A dictionary where the keys are column names and the values are lists of
+    column data.
+
+    Raises:
+    - botocore.exceptions.ClientError: If the table cannot be retrieved.
+    """
+    s3 = get_s3_client()
+    with timing("s3"):
+        body = s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    return deserialise_dict_table(body, ingest_format)
+
+
+def update_dict_table(bucket, table_name, latest_date, conn, ingest_format="json"):
+    """
+    Updates a dictionary table with new rows from the database, if any are available.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the table to update.
+    - latest_date (str): The date of the last ingestion.
+    - conn (pg8000.native.Connection): The database connection object.
+    - ingest_format (str): The storage format of the table.
+
+    Returns:
+    - A tuple containing:
+        - bool: True if the table was updated, False if not.
+        - dict: The updated table in dictionary format.
+
+    Raises:
+    - IngestError: If there is an issue retrieving or updating the table.
+    """
+    try:
+        dict_table = get_dict_table_from_bucket(
+            bucket, get_table_key(latest_date, table_name, ingest_format), ingest_format
+        )
+        
+        query = f"SELECT created_at FROM {table_name}"
+        db_row_count = len(conn.run(query)) 
+        s3_row_count = len(dict_table.get("created_at", []))
+        
+        if db_row_count > s3_row_count:
+            update_rows = conn.run(
+                f"SELECT * FROM {table_name} OFFSET :length",
+                length=s3_row_count,
+            ) 
+            metrics = current_metrics()
+            metrics.add(rows=len(update_rows))
+            metrics.watermark = {"offset": s3_row_count}
+            columns = [c["name"] for c in conn.columns]
+            
+            for column, values in zip(columns, zip(*update_rows)):
+                dict_table.setdefault(column, ColumnBuffer()).extend(values)
+            
+            return True, dict_table
+        return (False, dict_table)
+    except Exception as e:
+        raise IngestError(f"Failed to update table. {e}")
+
+
+def get_primary_key(conn, table_name):
+    """
+    Retrieves the primary key column of a table in the ToteSys database, from
+    the catalog cached by get_catalog if the run read one.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - table_name (str): The name of the table.
+
+    Returns:
+    - str: The name of the primary key column.
+
+    Raises:
+    - IngestError: If the query fails or the table has no single-column primary key.
+    """
+    catalog = catalog_cache.current()
+    if catalog is not None and table_name in catalog["tables"]:
+        columns = catalog["tables"][table_name]["primary_key"]
+    else:
+        try:
+            rows = conn.run(
+                "SELECT a.attname "
+                "FROM pg_index i "
+                "JOIN pg_attribute a "
+                "ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) "
+                "WHERE i.indrelid = CAST(:table_name AS regclass) "
+                "AND i.indisprimary;",
+                table_name=table_name,
+            )
+        except DatabaseError as e:
+            raise IngestError(f"Failed to get primary key. {e}")
+        columns = [row[0] for row in rows]
+    if len(columns) != 1:
+        raise IngestError(f"Failed to get primary key. {table_name}")
+    return columns[0]
+
+
+def get_watermark_from_dict_table(dict_table, primary_key):
+    """
+    Computes the high-water mark of a table in dictionary format.
+
+    Parameters:
+    - dict_table (dict): The table data in dictionary format.
+    - primary_key (str): The name of the primary key column.
+
+    Returns:
+    - dict: The greatest ('last_updated', primary key) pair, with 'last_updated'
+    as a string, or None if the table is empty.
+    """
+    if not dict_table.get(WATERMARK_COLUMN):
+        return None
+    last_updated, key = max(
+        zip(map(str, dict_table[WATERMARK_COLUMN]), dict_table[primary_key])
+    )
+    return {WATERMARK_COLUMN: last_updated, "key": key}
+
+
+def get_watermark(bucket, table_name):
+    """
+    Retrieves the stored high-water mark of a table from the S3 bucket.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the table.
+
+    Returns:
+    - dict: The stored watermark, or None if no watermark has been stored yet.
+
+    Raises:
+    - IngestError: If there is an issue retrieving the watermark from the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        watermark_object = s3.get_object(
+            Bucket=bucket, Key=f"watermarks/{table_name}.json"
+        )
+        return json.loads(watermark_object["Body"].read().decode())
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            return None
+        raise IngestError(f"Failed to get watermark from bucket. {e}")
+
+
+def store_watermark(bucket, table_name, watermark):
+    """
+    Stores the high-water mark of a table in the S3 bucket under
+    'watermarks/{table_name}.json'.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the table.
+    - watermark (dict): The watermark to store, or None for an empty table.
+
+    Raises:
+    - IngestError: If there is an issue storing the watermark in the S3 bucket.
+    """
+    if watermark is None:
+        return
+    try:
+        s3 = get_s3_client()
+        s3.put_object(
+            Body=json.dumps(watermark, default=str).encode(),
+            Bucket=bucket,
+            Key=f"watermarks/{table_name}.json",
+        )
+    except ClientError as e:
+        raise IngestError(f"Failed to store watermark in bucket. {e}")
+
+
+def merge_rows_into_dict_table(dict_table, columns, rows, primary_key):
+    """
+    Merges rows into a dictionary table, replacing rows whose primary key is
+    already present and appending the others.
+
+    Parameters:
+    - dict_table (dict): The table data in dictionary format, updated in place.
+    - columns (list): The column names of the rows.
+    - rows (list): The rows to merge.
+    - primary_key (str): The name of the primary key column.
+
+    Returns:
+    - dict: The merged table in dictionary format.
+    """
+    positions = {key: i for i, key in enumerate(dict_table.get(primary_key, []))}
+    key_index = columns.index(primary_key)
+    for column in columns:
+        dict_table.setdefault(column, ColumnBuffer())
+    for row in rows:
+        position = positions.get(row[key_index])
+        if position is None:
+            positions[row[key_index]] = len(dict_table[primary_key])
+            for column, value in zip(columns, row):
+                dict_table[column].append(value)
+        else:
+            for column, value in zip(columns, row):
+                dict_table[column][position] = value
+    return dict_table
+
+
+def get_rows_after_watermark(conn, table_name, primary_key, watermark):
+    """
+    Fetches the rows of a table inserted or updated after a high-water mark, in
+    ('last_updated', primary key) order.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - table_name (str): The name of the table.
+    - primary_key (str): The name of the primary key column.
+    - watermark (dict): The high-water mark, or None to fetch every row.
+
+    Returns:
+    - A tuple containing:
+        - list: The column names of the rows.
+        - list: The fetched rows.
+        - dict: The watermark of the last fetched row, or 'watermark' if no rows
+        were fetched.
+
+    Raises:
+    - pg8000.exceptions.DatabaseError: If the query fails.
+    """
+    if watermark is None:
+        rows = conn.run(
+            f"SELECT * FROM {table_name} "
+            f"ORDER BY {WATERMARK_COLUMN}, {primary_key}"
+        )
+    else:
+        rows = conn.run(
+            f"SELECT * FROM {table_name} "
+            f"WHERE ({WATERMARK_COLUMN}, {primary_key}) > "
+            f"(CAST(:last_updated AS timestamp), :key) "
+            f"ORDER BY {WATERMARK_COLUMN}, {primary_key}",
+            last_updated=watermark[WATERMARK_COLUMN],
+            key=watermark["key"],
+        )
+    metrics = current_metrics()
+    metrics.add(rows=len(rows))
+    metrics.watermark = watermark
+    columns = [c["name"] for c in conn.columns]
+    if not rows:
+        return columns, rows, watermark
+    last_row = dict(zip(columns, rows[-1]))
+    new_watermark = {
+        WATERMARK_COLUMN: str(last_row[WATERMARK_COLUMN]),
+        "key": last_row[primary_key],
+    }
+    return columns, rows, new_watermark
+
+
+def update_dict_table_by_watermark(
+    bucket, table_name, latest_date, conn, ingest_format="json"
+):
+    """
+    Updates a dictionary table with the rows inserted or updated since the table's
+    high-water mark.
+
+    Only rows whose ('last_updated', primary key) pair is greater than the stored
+    watermark are fetched, so the query is a range scan on an index over those
+    columns instead of a full table scan. Updated rows replace their previous
+    version in the table; new rows are appended.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the table to update.
+    - latest_date (str): The date of the last ingestion.
+    - conn (pg8000.native.Connection): The database connection object.
+    - ingest_format (str): The storage format of the table.
+
+    Returns:
+    - A tuple containing:
+        - bool: True if the table was updated, False if not.
+        - dict: The updated table in dictionary format.
+        - dict: The new watermark of the table.
+
+    Raises:
+    - IngestError: If there is an issue retrieving or updating the table.
+    """
+    try:
+        dict_table = get_dict_table_from_bucket(
+            bucket, get_table_key(latest_date, table_name, ingest_format), ingest_format
+        )
+        primary_key = get_primary_key(conn, table_name)
+        watermark = get_watermark(bucket, table_name)
+        if watermark is None:
+            watermark = get_watermark_from_dict_table(dict_table, primary_key)
+
+        columns, update_rows, new_watermark = get_rows_after_watermark(
+            conn, table_name, primary_key, watermark
+        )
+        if not update_rows:
+            return False, dict_table, watermark
+
+        merge_rows_into_dict_table(dict_table, columns, update_rows, primary_key)
+        return True, dict_table, new_watermark
+    except IngestError:
+        raise
+    except Exception as e:
+        raise IngestError(f"Failed to update table. {e}")
+
+
+class S3MultipartWriter:
+    """
+    File-like object that streams bytes into an S3 object through a multipart
+    upload, so an object can be written without holding it in memory.
+
+    Bytes are buffered until a part of 'part_size' bytes is ready, then uploaded.
+    Closing the writer uploads the remaining bytes as the last part and completes
+    the upload; used as a context manager, the upload is aborted if the block
+    raises, unless the writer was suspended.
+
+    An upload suspended by one Lambda invocation can be carried on by another,
+    given its upload id, its uploaded parts and its buffered bytes, see suspend.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - key (str): The key of the object to write.
+    - part_size (int): The size of each uploaded part, at least 5 MiB.
+    - upload_id (str): The id of a suspended upload to carry on, or None to
+    start a new one.
+    - parts (list): The parts already uploaded to the suspended upload.
+    """
+
+    def __init__(
+        self, bucket, key, part_size=MULTIPART_PART_SIZE, upload_id=None, parts=()
+    ):
+        self.s3 = get_s3_client()
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.parts = list(parts)
+        self.buffer = bytearray()
+        self.bytes_written = 0
+        self.suspended = False
+        self.upload_id = upload_id
+        if upload_id is None:
+            with timing("s3"):
+                self.upload_id = self.s3.create_multipart_upload(
+                    Bucket=bucket, Key=key
+                )["UploadId"]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.suspended:
+            return
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def write(self, data):
+        self.buffer += data
+        self.bytes_written += len(data)
+        while len(self.buffer) >= self.part_size:
+            self._upload_part(bytes(self.buffer[: self.part_size]))
+            del self.buffer[: self.part_size]
+        return len(data)
+
+    def _upload_part(self, body):
+        part_number = len(self.parts) + 1
+        with timing("s3"):
+            part = self.s3.upload_part(
+                Body=body,
+                Bucket=self.bucket,
+                Key=self.key,
+                PartNumber=part_number,
+                UploadId=self.upload_id,
+            )
+        current_metrics().add(written=len(body))
+        self.parts.append({"ETag": part["ETag"], "PartNumber": part_number})
+
+    def close(self):
+        if self.buffer or not self.parts:
+            self._upload_part(bytes(self.buffer))
+            self.buffer.clear()
+        with timing("s3"):
+            self.s3.complete_multipart_upload(
+                Bucket=self.bucket,
+                Key=self.key,
+                MultipartUpload={"Parts": self.parts},
+                UploadId=self.upload_id,
+            )
+
+    def abort(self):
+        with timing("s3"):
+            self.s3.abort_multipart_upload(
+                Bucket=self.bucket, Key=self.key, UploadId=self.upload_id
+            )
+
+    def suspend(self):
+        """
+        Leaves the upload open for another invocation to carry on.
+
+        Returns:
+        - A tuple containing:
+            - dict: {'upload_id', 'parts'}, the arguments to resume the upload.
+            - bytes: The buffered bytes not uploaded yet, to write again to the
+            resumed writer. They are less than a part, which is the smallest
+            size S3 accepts for any part but the last.
+        """
+        self.suspended = True
+        state = {"upload_id": self.upload_id, "parts": list(self.parts)}
+        return state, bytes(self.buffer)
+
+
+def stream_table_to_bucket(
+    conn,
+    bucket,
+    table_name,
+    date,
+    primary_key=None,
+    batch_size=STREAM_BATCH_SIZE,
+    ingest_format="ndjson",
+    key=None,
+):
+    """
+    Streams all rows of a table into the S3 bucket as newline-delimited JSON,
+    gzip-compressed on the fly for 'ndjson.gz'.
+
+    Rows are fetched in batches of 'batch_size' through a server-side cursor and
+    written straight into a multipart upload, so memory use does not grow with the
+    size of the table and the first parts reach S3 while the table is still being
+    read.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the ToteSys Database table to stream.
+    - date (str): The current date to be used in the key.
+    - primary_key (str): The name of the primary key column. When given, the
+    high-water mark of the table is tracked while streaming.
+    - batch_size (int): The number of rows fetched per round trip.
+    - ingest_format (str): 'ndjson' or 'ndjson.gz'.
+    - key (str): The key to stream the table to, instead of the 'latest' folder.
+
+    Returns:
+    - A tuple containing:
+        - int: The number of rows streamed.
+        - dict: The watermark of the table, or None.
+
+    Raises:
+    - IngestError: If there is an issue reading the table or writing to S3.
+    """
+    row_count = 0
+    high = None
+    try:
+        start_read_transaction(conn)
+        conn.run(
+            f"DECLARE extract_cursor NO SCROLL CURSOR FOR SELECT * FROM {table_name}"
+        )
+        compressor = None
+        if ingest_format == "ndjson.gz":
+            compressor = zlib.compressobj(wbits=31)
+        with S3MultipartWriter(
+            bucket, key or get_table_key(date, table_name, ingest_format)
+        ) as writer:
+            columns = None
+            while True:
+                rows = conn.run(f"FETCH FORWARD {batch_size} FROM extract_cursor")
+                data = b""
+                if columns is None:
+                    columns = [c["name"] for c in conn.columns]
+                    if compressor is not None:
+                        data += encode_schema_line(
+                            get_schema_from_columns(conn.columns)
+                        )
+                if rows:
+                    data += encode_ndjson_rows(columns, rows, ingest_format)
+                if compressor is not None:
+                    data = compressor.compress(data)
+                writer.write(data)
+                if not rows:
+                    break
+                row_count += len(rows)
+                if primary_key is not None:
+                    updated_index = columns.index(WATERMARK_COLUMN)
+                    key_index = columns.index(primary_key)
+                    batch_high = max(
+                        (str(row[updated_index]), row[key_index]) for row in rows
+                    )
+                    if high is None or batch_high > high:
+                        high = batch_high
+            if compressor is not None:
+                writer.write(compressor.flush())
+        conn.run("CLOSE extract_cursor")
+        commit_read_transaction(conn)
+        current_metrics().add(rows=row_count)
+        if high is None:
+            return row_count, None
+        return row_count, {WATERMARK_COLUMN: high[0], "key": high[1]}
+    except Exception as e:
+        rollback_read_transaction(conn)
+        raise IngestError(f"Failed to stream table to bucket. {e}")
+
+
+def get_table_watermark(conn, table_name, primary_key):
+    """
+    Reads the high-water mark of a table from the database.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - table_name (str): The name of the table.
+    - primary_key (str): The name of the primary key column.
+
+    Returns:
+    - dict: The greatest ('last_updated', primary key) pair, with 'last_updated'
+    as a string, or None if the table is empty.
+
+    Raises:
+    - pg8000.exceptions.DatabaseError: If the query fails.
+    """
+    rows = conn.run(
+        f"SELECT {WATERMARK_COLUMN}, {primary_key} FROM {table_name} "
+        f"ORDER BY {WATERMARK_COLUMN} DESC, {primary_key} DESC LIMIT 1"
+    )
+    if not rows:
+        return None
+    return {WATERMARK_COLUMN: str(rows[0][0]), "key": rows[0][1]}
+
+
+class GzipWriter:
+    """
+    File-like object that gzip-compresses the bytes written to it on the fly and
+    writes them to another file-like object. Closing it writes the end of the
+    gzip stream, but does not close the wrapped object.
+
+    Parameters:
+    - writer: The file-like object the compressed bytes are written to.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.compressor = zlib.compressobj(wbits=31)
+
+    def write(self, data):
+        self.writer.write(self.compressor.compress(data))
+        return len(data)
+
+    def close(self):
+        self.writer.write(self.compressor.flush())
+
+
+def copy_table_to_bucket(conn, bucket, table_name, date, primary_key=None, key=None):
+    """
+    Exports all rows of a table into the S3 bucket with 'COPY ... TO STDOUT' as
+    gzip-compressed CSV behind a schema line.
+
+    The raw CSV produced by the server is compressed and written straight into a
+    multipart upload, so no value is decoded into a Python object on the way;
+    type conversion is left to the process stage, guided by the schema line. The
+    schema, the export and the watermark are read in one repeatable-read
+    transaction, so they all see the same snapshot of the table.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the ToteSys Database table to export.
+    - date (str): The current date to be used in the key.
+    - primary_key (str): The name of the primary key column. When given, the
+    high-water mark of the table is read after the export.
+    - key (str): The key to export the table to, instead of the 'latest' folder.
+
+    Returns:
+    - A tuple containing:
+        - int: The number of rows exported.
+        - dict: The watermark of the table, or None.
+
+    Raises:
+    - IngestError: If there is an issue exporting the table or writing to S3.
+    """
+    try:
+        start_read_transaction(conn, "REPEATABLE READ")
+        conn.run(f"SELECT * FROM {table_name} LIMIT 0")
+        schema = get_schema_from_columns(conn.columns)
+        with S3MultipartWriter(
+            bucket, key or get_table_key(date, table_name, "csv.gz")
+        ) as writer:
+            gzip_writer = GzipWriter(writer)
+            gzip_writer.write(encode_schema_line(schema))
+            conn.run(
+                f"COPY {table_name} TO STDOUT WITH (FORMAT csv, NULL '{CSV_NULL}')",
+                stream=gzip_writer,
+            )
+            row_count = conn.row_count
+            gzip_writer.close()
+        watermark = None
+        if primary_key is not None:
+            watermark = get_table_watermark(conn, table_name, primary_key)
+        commit_read_transaction(conn)
+        current_metrics().add(rows=row_count)
+        return row_count, watermark
+    except Exception as e:
+        rollback_read_transaction(conn)
+        raise IngestError(f"Failed to copy table to bucket. {e}")
+
+
+def plan_key_ranges(conn, table_name, key_column, range_rows):
+    """
+    Splits a large table into ranges of its integer primary key, planned from the
+    estimated row count in 'pg_class' and the smallest and greatest key.
+
+    The first range is open below and the last range open above, so rows
+    outside the planned bounds are still extracted.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - table_name (str): The name of the table.
+    - key_column (str): The name of the integer primary key column.
+    - range_rows (int): The estimated number of rows per range.
+
+    Returns:
+    - list: The (low, high) key ranges in key order, where low is inclusive, high
+    exclusive and None unbounded, or None if the table is too small to split.
+
+    Raises:
+    - pg8000.exceptions.DatabaseError: If the queries fail.
+    """
+    estimate = conn.run(
+        "SELECT CAST(reltuples AS bigint) FROM pg_class "
+        "WHERE oid = CAST(:table_name AS regclass);",
+        table_name=table_name,
+    )[0][0]
+    if estimate < 2 * range_rows:
+        return None
+    low, high = conn.run(
+        f"SELECT min({key_column}), max({key_column}) FROM {table_name}"
+    )[0]
+    if not isinstance(low, int) or not isinstance(high, int):
+        return None
+    count = min(MAX_KEY_RANGES, math.ceil(estimate / range_rows), high - low + 1)
+    if count < 2:
+        return None
+    step = math.ceil((high - low + 1) / count)
+    bounds = [None] + [low + i * step for i in range(1, count)] + [None]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def get_key_range_condition(key_column, key_range):
+    """
+    Builds the WHERE clause selecting a key range.
+
+    The bounds are integers and written as literals, as COPY does not accept
+    query parameters.
+
+    Parameters:
+    - key_column (str): The name of the primary key column.
+    - key_range (tuple): The (low, high) key range, see plan_key_ranges.
+
+    Returns:
+    - str: The WHERE clause, empty for an unbounded range.
+    """
+    low, high = key_range
+    conditions = []
+    if low is not None:
+        conditions.append(f"{key_column} >= {int(low)}")
+    if high is not None:
+        conditions.append(f"{key_column} < {int(high)}")
+    if not conditions:
+        return ""
+    return " WHERE " + " AND ".join(conditions)
+
+
+def fetch_key_range(conn, table_name, key_column, key_range, ingest_format, first):
+    """
+    Fetches the rows of a key range in key order and encodes them as one part of
+    a table in the given ingest format.
+
+    Each part of a compressed format is a complete gzip member, so the parts of a
+    table concatenate into a valid gzip stream. Only the first part carries the
+    schema line.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - table_name (str): The name of the table.
+    - key_column (str): The name of the primary key column.
+    - key_range (tuple): The (low, high) key range, see plan_key_ranges.
+    - ingest_format (str): 'ndjson', 'ndjson.gz' or 'csv.gz'.
+    - first (bool): Whether this is the first part of the table.
+
+    Returns:
+    - A tuple containing:
+        - bytes: The encoded part.
+        - int: The number of rows in the part.
+
+    Raises:
+    - pg8000.exceptions.DatabaseError: If the query fails.
+    """
+    query = (
+        f"SELECT * FROM {table_name}"
+        f"{get_key_range_condition(key_column, key_range)} ORDER BY {key_column}"
+    )
+    if ingest_format in COPY_FORMATS:
+        buffer = io.BytesIO()
+        gzip_writer = GzipWriter(buffer)
+        if first:
+            conn.run(f"SELECT * FROM {table_name} LIMIT 0")
+            gzip_writer.write(encode_schema_line(get_schema_from_columns(conn.columns)))
+        conn.run(
+            f"COPY ({query}) TO STDOUT WITH (FORMAT csv, NULL '{CSV_NULL}')",
+            stream=gzip_writer,
+        )
+        row_count = conn.row_count
+        gzip_writer.close()
+        return buffer.getvalue(), row_count
+    rows = conn.run(query)
+    data = b""
+    if first and ingest_format == "ndjson.gz":
+        data += encode_schema_line(get_schema_from_columns(conn.columns))
+    data += encode_ndjson_rows([c["name"] for c in conn.columns], rows, ingest_format)
+    if ingest_format == "ndjson.gz":
+        data = gzip.compress(data)
+    return data, len(rows)
+
+
+def extract_table_in_ranges(
+    conn,
+    bucket,
+    table_name,
+    date,
+    primary_key,
+    key_column,
+    key_ranges,
+    ingest_format,
+    key=None,
+):
+    """
+    Extracts a large table into the S3 bucket by fetching its key ranges
+    concurrently, each on its own connection from 'range_pool'. If 'conn' reads
+    from an exported snapshot, so do the range connections.
+
+    The parts are written to a single multipart upload in key order as they
+    complete, so the stored table is ordered by primary key and downstream
+    readers see one object, as if it had been extracted in a single pass. At
+    most twice as many ranges as workers are in flight, and the next range is
+    only submitted once a part is written, so the parts held in memory while
+    waiting for a slow range stay bounded. The
+    watermark is read before any range is fetched, so rows changed while the
+    ranges are being read are fetched again by the next run rather than missed.
+
+    When the run is resumable and the invocation runs out of time, the upload
+    is suspended after the last range written: the next range, the upload id
+    and parts, and the buffered bytes, stored under 'checkpoints/', are kept in
+    the run checkpoint, and the next invocation carries on from there. The
+    ranges it reads come from a later snapshot than the earlier ones; rows
+    changed in between are past the watermark, so the next run fetches them.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the table.
+    - date (str): The current date to be used in the key.
+    - primary_key (str): The name of the primary key column, or None to skip
+    tracking the watermark.
+    - key_column (str): The name of the integer primary key column.
+    - key_ranges (list): The key ranges, see plan_key_ranges.
+    - ingest_format (str): 'ndjson', 'ndjson.gz' or 'csv.gz'.
+    - key (str): The key to store the table under, instead of the 'latest' folder.
+
+    Returns:
+    - A tuple containing:
+        - int: The number of rows extracted.
+        - dict: The watermark of the table, or None.
+
+    Raises:
+    - IngestError: If there is an issue extracting or storing the table.
+    """
+
+    snapshot_id = snapshot_connections.get(conn)
+    metrics = current_metrics()
+    checkpoint = current_checkpoint()
+    key = key or get_table_key(date, table_name, ingest_format)
+    chunk = get_resumable_chunk(bucket, table_name, key)
+
+    def run(index, key_range):
+        with measuring(metrics), range_pool.connection() as range_conn:
+            with attached_snapshot(range_conn, snapshot_id):
+                return fetch_key_range(
+                    range_conn,
+                    table_name,
+                    key_column,
+                    key_range,
+                    ingest_format,
+                    index == 0,
+                )
+
+    fetched = 0
+    try:
+        if chunk is None:
+            first = 0
+            row_count = 0
+            watermark = None
+            if primary_key is not None:
+                watermark = get_table_watermark(conn, table_name, primary_key)
+            writer = S3MultipartWriter(bucket, key)
+        else:
+            key_ranges = [tuple(key_range) for key_range in chunk["key_ranges"]]
+            first = chunk["next_range"]
+            row_count = chunk["rows"]
+            watermark = chunk["watermark"]
+            writer = S3MultipartWriter(
+                bucket, key, upload_id=chunk["upload_id"], parts=chunk["parts"]
+            )
+            writer.write(get_chunk_buffer(bucket, chunk["buffer_key"]))
+        max_workers = min(get_extract_range_concurrency(), len(key_ranges) - first)
+        in_flight = 2 * max_workers
+        with writer:
+            pool = ThreadPoolExecutor(max_workers=max_workers)
+            try:
+                futures = {
+                    index: pool.submit(run, index, key_ranges[index])
+                    for index in range(first, min(first + in_flight, len(key_ranges)))
+                }
+                for index in range(first, len(key_ranges)):
+                    data, rows = futures.pop(index).result()
+                    writer.write(data)
+                    if index + in_flight < len(key_ranges):
+                        futures[index + in_flight] = pool.submit(
+                            run, index + in_flight, key_ranges[index + in_flight]
+                        )
+                    row_count += rows
+                    fetched += rows
+                    if index + 1 == len(key_ranges):
+                        continue
+                    if checkpoint is None or not checkpoint.expired():
+                        continue
+                    upload, buffer = writer.suspend()
+                    buffer_key = f"checkpoints/{key}.{index + 1}.buffer"
+                    store_chunk_buffer(bucket, buffer_key, buffer)
+                    checkpoint.put_chunk(
+                        table_name,
+                        {
+                            "key": key,
+                            "key_column": key_column,
+                            "key_ranges": key_ranges,
+                            "next_range": index + 1,
+                            "rows": row_count,
+                            "watermark": watermark,
+                            "buffer_key": buffer_key,
+                            **upload,
+                        },
+                    )
+                    if chunk is not None:
+                        delete_table(bucket, chunk["buffer_key"])
+                    metrics.add(rows=fetched)
+                    raise ExtractionPaused(table_name)
+            finally:
+                pool.shutdown(cancel_futures=True)
+        if chunk is not None:
+            delete_table(bucket, chunk["buffer_key"])
+        metrics.add(rows=fetched)
+        return row_count, watermark
+    except (ExtractionPaused, IngestError):
+        raise
+    except Exception as e:
+        raise IngestError(f"Failed to extract table in ranges. {e}")
+
+
+def get_resumable_chunk(bucket, table_name, key):
+    """
+    Retrieves the resume state of a table whose key-range extraction was
+    suspended by an earlier invocation of the current run.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the table.
+    - key (str): The key the table is being extracted to.
+
+    Returns:
+    - dict: The resume state, see extract_table_in_ranges, or None if the run
+    is not resumable, the table was not suspended, or its upload can no longer
+    be carried on, e.g. because it was completed by an invocation that timed
+    out before checkpointing it.
+
+    Raises:
+    - IngestError: If there is an issue checking the upload.
+    """
+    checkpoint = current_checkpoint()
+    if checkpoint is None:
+        return None
+    chunk = checkpoint.get_chunk(table_name)
+    if chunk is None or chunk["key"] != key:
+        return None
+    try:
+        s3 = get_s3_client()
+        with timing("s3"):
+            s3.list_parts(Bucket=bucket, Key=key, UploadId=chunk["upload_id"])
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchUpload":
+            return None
+        raise IngestError(f"Failed to check suspended upload. {e}")
+    return chunk
+
+
+def store_chunk_buffer(bucket, key, data):
+    """
+    Stores the bytes buffered by a suspended multipart upload in the S3 bucket.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - key (str): The key to store the bytes under.
+    - data (bytes): The buffered bytes.
+
+    Raises:
+    - IngestError: If there is an issue storing the bytes in the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        with timing("s3"):
+            s3.put_object(Body=data, Bucket=bucket, Key=key)
+    except ClientError as e:
+        raise IngestError(f"Failed to store chunk buffer in bucket. {e}")
+
+
+def get_chunk_buffer(bucket, key):
+    """
+    Retrieves the bytes buffered by a suspended multipart upload from the S3
+    bucket.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - key (str): The key the bytes are stored under.
+
+    Returns:
+    - bytes: The buffered bytes.
+
+    Raises:
+    - IngestError: If there is an issue retrieving the bytes from the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        with timing("s3"):
+            return s3.get_object(Bucket=bucket, Key=key)["Body"].read()
+    except ClientError as e:
+        raise IngestError(f"Failed to get chunk buffer from bucket. {e}")
+
+
+def get_key_ranges(conn, table_name, primary_key, ingest_format):
+    """
+    Plans the key ranges of a table if it should be extracted in parallel ranges.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - table_name (str): The name of the table.
+    - primary_key (str): The name of the primary key column, or None if unknown.
+    - ingest_format (str): The storage format of the table.
+
+    Returns:
+    - A tuple containing:
+        - str: The name of the primary key column, or None.
+        - list: The key ranges, see plan_key_ranges, or None to extract the table
+        in a single pass.
+
+    Raises:
+    - IngestError: If there is an issue planning the ranges.
+    """
+    range_rows = get_extract_range_rows()
+    if range_rows == 0 or ingest_format not in RANGE_FORMATS:
+        return primary_key, None
+    if primary_key is None:
+        try:
+            primary_key = get_primary_key(conn, table_name)
+        except IngestError:
+            return None, None
+    try:
+        return primary_key, plan_key_ranges(conn, table_name, primary_key, range_rows)
+    except DatabaseError as e:
+        raise IngestError(f"Failed to plan key ranges. {e}")
+
+
+def extract_full_table(
+    conn, bucket, table_name, date, primary_key, ingest_format, key=None
+):
+    """
+    Extracts all rows of a table into the S3 bucket with the fastest path the
+    ingest format allows: 'COPY ... TO STDOUT' for 'csv.gz', a server-side cursor
+    for the NDJSON formats and a single query otherwise. Tables large enough to
+    be split, or whose key ranges were suspended by an earlier invocation of the
+    run, are extracted in parallel key ranges instead, see
+    extract_table_in_ranges.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The database connection object.
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the table.
+    - date (str): The current date to be used in the key.
+    - primary_key (str): The name of the primary key column, or None to skip
+    tracking the watermark.
+    - ingest_format (str): The storage format of the table.
+    - key (str): The key to store the table under, instead of the 'latest' folder.
+
+    Returns:
+    - A tuple containing:
+        - int: The number of rows extracted.
+        - dict: The watermark of the table, or None.
+
+    Raises:
+    - IngestError: If there is an issue extracting or storing the table.
+    """
+    checkpoint = current_checkpoint()
+    chunk = None if checkpoint is None else checkpoint.get_chunk(table_name)
+    if chunk is not None:
+        key_column, key_ranges = chunk["key_column"], chunk["key_ranges"]
+    else:
+        key_column, key_ranges = get_key_ranges(
+            conn, table_name, primary_key, ingest_format
+        )
+    if key_ranges is not None:
+        return extract_table_in_ranges(
+            conn,
+            bucket,
+            table_name,
+            date,
+            primary_key,
+            key_column,
+            key_ranges,
+            ingest_format,
+            key,
+        )
+    if ingest_format in COPY_FORMATS:
+        return copy_table_to_bucket(conn, bucket, table_name, date, primary_key, key)
+    if ingest_format in STREAMING_FORMATS:
+        return stream_table_to_bucket(
+            conn,
+            bucket,
+            table_name,
+            date,
+            primary_key,
+            ingest_format=ingest_format,
+            key=key,
+        )
+    dict_table = get_dict_table(conn, table_name)
+    store_table_in_bucket(bucket, dict_table, table_name, date, ingest_format, key)
+    watermark = None
+    if primary_key is not None:
+        watermark = get_watermark_from_dict_table(dict_table, primary_key)
+    return len(next(iter(dict_table.values()), [])), watermark
+
+
+def update_table_in_bucket(
+    bucket, table_name, latest_date, date, conn, extract_mode, ingest_format
+):
+    """
+    Updates a table with the new rows from the database and, if there are any,
+    stores it under the current date in the 'latest' folder.
+
+    The previous version of the table is left in place, as earlier manifests
+    still point at it.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the table.
+    - latest_date (str): The date of the last ingestion.
+    - date (str): The current date to be used in the key.
+    - conn (pg8000.native.Connection): The database connection object.
+    - extract_mode (str): 'rowcount' or 'watermark'.
+    - ingest_format (str): The storage format of the table.
+
+    Returns:
+    - bool: True if the table was updated, False if not.
+
+    Raises:
+    - IngestError: If there is an issue updating or storing the table.
+    """
+    watermark = None
+    if extract_mode == "watermark":
+        needs_update, updated_dict_table, watermark = update_dict_table_by_watermark(
+            bucket, table_name, latest_date, conn, ingest_format
+        )
+    else:
+        needs_update, updated_dict_table = update_dict_table(
+            bucket, table_name, latest_date, conn, ingest_format
+        )
+    if needs_update:
+        store_table_in_bucket(
+            bucket, updated_dict_table, table_name, date, ingest_format
+        )
+        store_watermark(bucket, table_name, watermark)
+    return needs_update
+
+
+def store_full_table_in_bucket(
+    bucket, table_name, date, conn, extract_mode, ingest_format
+):
+    """
+    Extracts all rows of a table and stores them in the 'latest' folder with the
+    current date, see extract_full_table.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the table.
+    - date (str): The current date to be used in the key.
+    - conn (pg8000.native.Connection): The database connection object.
+    - extract_mode (str): 'rowcount' or 'watermark'.
+    - ingest_format (str): The storage format of the table.
+
+    Returns:
+    - bool: Always True, the table is always stored.
+
+    Raises:
+    - IngestError: If there is an issue extracting or storing the table.
+    """
+    primary_key = None
+    if extract_mode == "watermark":
+        primary_key = get_primary_key(conn, table_name)
+    _, watermark = extract_full_table(
+        conn, bucket, table_name, date, primary_key, ingest_format
+    )
+    store_watermark(bucket, table_name, watermark)
+    return True
+
+
+def get_manifest(bucket):
+    """
+    Retrieves the current manifest of the tables in the S3 bucket.
+
+    The manifest points at the current object of every table:
+    {'version', 'date', 'tables': {table_name: {'key', 'date', 'format'}}}.
+    Buckets written before manifests existed are read from their 'latest_date'
+    key and 'latest' folder instead.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+
+    Returns:
+    - dict: The manifest, or None if no table has been stored yet.
+
+    Raises:
+    - IngestError: If there is an issue retrieving the manifest from the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        manifest_object = s3.get_object(Bucket=bucket, Key="manifest.json")
+        return json.loads(manifest_object["Body"].read().decode())
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchKey":
+            raise IngestError(f"Failed to get manifest from bucket. {e}")
+    if is_bucket_empty(bucket):
+        return None
+    return get_legacy_manifest(bucket, get_date(bucket))
+
+
+def get_legacy_manifest(bucket, latest_date):
+    """
+    Builds a manifest from the tables stored under a date in the 'latest' folder.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - latest_date (str): The date of the last ingestion.
+
+    Returns:
+    - dict: The manifest of the tables, with version 0.
+
+    Raises:
+    - IngestError: If there is an issue listing the tables in the S3 bucket.
+    """
+    prefix = f"latest/{latest_date}/"
+    tables = {}
+    try:
+        s3 = get_s3_client()
+        paginator = s3.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for content in page.get("Contents", []):
+                file_name = content["Key"].removeprefix(prefix)
+                table_name, _, ingest_format = file_name.partition(".")
+                tables[table_name] = {
+                    "key": content["Key"],
+                    "date": latest_date,
+                    "format": ingest_format,
+                }
+    except ClientError as e:
+        raise IngestError(f"Failed to list tables in bucket. {e}")
+    return {"version": 0, "date": latest_date, "tables": tables}
+
+
+def get_next_manifest(manifest, tables, needs_updates, date, ingest_format):
+    """
+    Builds the manifest that follows an ingestion run.
+
+    Parameters:
+    - manifest (dict): The current manifest, or None.
+    - tables (list): The names of the ingested tables.
+    - needs_updates (list): For each table, whether it was stored by this run.
+    - date (str): The current date.
+    - ingest_format (str): The storage format of the stored tables.
+
+    Returns:
+    - dict: The next manifest. Changed tables point at their new key, the others
+    keep their current entry.
+    """
+    current = manifest or {"version": 0, "tables": {}}
+    next_tables = dict(current["tables"])
+    for table_name, needs_update in zip(tables, needs_updates):
+        if needs_update:
+            next_tables[table_name] = {
+                "key": get_table_key(date, table_name, ingest_format),
+                "date": date,
+                "format": ingest_format,
+            }
+    return {"version": current["version"] + 1, "date": date, "tables": next_tables}
+
+
+def store_manifest(bucket, manifest):
+    """
+    Stores a new version of the manifest in the S3 bucket.
+
+    The version is first stored under 'manifests/{version}.json', where it is
+    kept as the archive, then copied to 'manifest.json', the pointer readers use.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - manifest (dict): The manifest to store.
+
+    Raises:
+    - IngestError: If there is an issue storing the manifest in the S3 bucket.
+    """
+    body = json.dumps(manifest).encode()
+    try:
+        s3 = get_s3_client()
+        s3.put_object(
+            Body=body,
+            Bucket=bucket,
+            Key=f"manifests/{manifest['version']:08d}.json",
+        )
+        s3.put_object(Body=body, Bucket=bucket, Key="manifest.json")
+    except ClientError as e:
+        raise IngestError(f"Failed to store manifest in bucket. {e}")
+
+
+def update_table_from_manifest(
+    bucket, table_name, manifest, date, conn, extract_mode, ingest_format
+):
+    """
+    Ingests a table in full if the manifest does not list it in the current
+    format, and updates it otherwise.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the table.
+    - manifest (dict): The current manifest, or None.
+    - date (str): The current date to be used in the key.
+    - conn (pg8000.native.Connection): The database connection object.
+    - extract_mode (str): 'rowcount' or 'watermark'.
+    - ingest_format (str): The storage format of the table.
+
+    Returns:
+    - bool: True if the table was stored, False if it is unchanged.
+
+    Raises:
+    - IngestError: If there is an issue extracting or storing the table.
+    """
+    entry = (manifest or {"tables": {}})["tables"].get(table_name)
+    if entry is None or entry["format"] != ingest_format:
+        return store_full_table_in_bucket(
+            bucket, table_name, date, conn, extract_mode, ingest_format
+        )
+    return update_table_in_bucket(
+        bucket, table_name, entry["date"], date, conn, extract_mode, ingest_format
+    )
+
+
+def get_segment_manifest(bucket, table_name):
+    """
+    Retrieves the segment manifest of a table from the S3 bucket.
+
+    The manifest lists, in order, the delta segments that make up the table:
+    {'table', 'primary_key', 'segments': [{'key', 'format', 'rows'}]}.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the table.
+
+    Returns:
+    - dict: The manifest, or None if no segment has been stored yet.
+
+    Raises:
+    - IngestError: If there is an issue retrieving the manifest from the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        manifest_object = s3.get_object(
+            Bucket=bucket, Key=f"segments/{table_name}/manifest.json"
+        )
+        return json.loads(manifest_object["Body"].read().decode())
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            return None
+        raise IngestError(f"Failed to get segment manifest from bucket. {e}")
+
+
+def store_segment_manifest(bucket, table_name, manifest):
+    """
+    Stores the segment manifest of a table in the S3 bucket under
+    'segments/{table_name}/manifest.json'.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the table.
+    - manifest (dict): The manifest to store.
+
+    Raises:
+    - IngestError: If there is an issue storing the manifest in the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        s3.put_object(
+            Body=json.dumps(manifest, default=str).encode(),
+            Bucket=bucket,
+            Key=f"segments/{table_name}/manifest.json",
+        )
+    except ClientError as e:
+        raise IngestError(f"Failed to store segment manifest in bucket. {e}")
+
+
+def get_delta_rows(bucket, table_name, manifest, conn, primary_key=None):
+    """
+    Fetches the rows of a table that are not yet in its segments.
+
+    Without a primary key, the rows past the number of rows already stored are
+    fetched ('rowcount'). With one, the rows changed since the table's stored
+    high-water mark are fetched ('watermark').
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the table.
+    - manifest (dict): The segment manifest of the table.
+    - conn (pg8000.native.Connection): The database connection object.
+    - primary_key (str): The name of the primary key column, or None.
+
+    Returns:
+    - A tuple containing:
+        - list: The column names of the rows.
+        - list: The fetched rows.
+        - dict: The new watermark of the table, or None.
+
+    Raises:
+    - IngestError: If there is an issue fetching the rows.
+    """
+    try:
+        if primary_key is None:
+            length = sum(segment["rows"] for segment in manifest["segments"])
+            rows = conn.run(
+                f"SELECT * FROM {table_name} OFFSET :length", length=length
+            )
+            metrics = current_metrics()
+            metrics.add(rows=len(rows))
+            metrics.watermark = {"offset": length}
+            return [c["name"] for c in conn.columns], rows, None
+        return get_rows_after_watermark(
+            conn, table_name, primary_key, get_watermark(bucket, table_name)
+        )
+    except DatabaseError as e:
+        raise IngestError(f"Failed to get new rows of table. {e}")
+
+
+def append_table_segment(
+    bucket, table_name, run_id, conn, extract_mode, ingest_format
+):
+    """
+    Writes the new and changed rows of a table to the S3 bucket as an immutable
+    delta segment and appends it to the table's segment manifest.
+
+    The first run of a table writes all of its rows as the base segment. Later
+    runs only write the rows that are not yet in a segment, so the cost of a run
+    no longer grows with the history already ingested. The segment is stored
+    before the manifest that lists it, so readers never see a listed segment
+    that does not exist yet.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the table.
+    - run_id (str): The timestamp of the ingestion run, see format_run_id.
+    - conn (pg8000.native.Connection): The database connection object.
+    - extract_mode (str): 'rowcount' or 'watermark'.
+    - ingest_format (str): The storage format of the segment.
+
+    Returns:
+    - bool: True if a segment was appended, False if there were no new rows.
+
+    Raises:
+    - IngestError: If there is an issue extracting or storing the segment.
+    """
+    manifest = get_segment_manifest(bucket, table_name)
+    primary_key = None
+    if extract_mode == "watermark":
+        primary_key = get_primary_key(conn, table_name)
+    key = get_segment_key(table_name, run_id, ingest_format)
+    if manifest is None:
+        manifest = {"table": table_name, "segments": []}
+        row_count, watermark = extract_full_table(
+            conn, bucket, table_name, run_id, primary_key, ingest_format, key
+        )
+    else:
+        columns, rows, watermark = get_delta_rows(
+            bucket, table_name, manifest, conn, primary_key
+        )
+        if not rows:
+            return False
+        dict_table = {
+            column: list(values) for column, values in zip(columns, zip(*rows))
+        }
+        store_table_in_bucket(bucket, dict_table, table_name, run_id, ingest_format, key)
+        row_count = len(rows)
+    manifest["primary_key"] = primary_key or manifest.get("primary_key")
+    manifest["segments"].append(
+        {"key": key, "format": ingest_format, "rows": row_count}
+    )
+    store_segment_manifest(bucket, table_name, manifest)
+    store_watermark(bucket, table_name, watermark)
+    return True
+
+
+def get_cdc_checkpoint(bucket):
+    """
+    Retrieves the checkpoint of the 'cdc' ingest engine from the S3 bucket.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+
+    Returns:
+    - dict: {'slot', 'lsn'}, the LSN of the last transaction stored from the
+    slot, or None if no change has been stored yet.
+
+    Raises:
+    - IngestError: If there is an issue retrieving the checkpoint from the S3
+    bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        checkpoint_object = s3.get_object(Bucket=bucket, Key="cdc/checkpoint.json")
+        return json.loads(checkpoint_object["Body"].read().decode())
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            return None
+        raise IngestError(f"Failed to get cdc checkpoint from bucket. {e}")
+
+
+def store_cdc_checkpoint(bucket, checkpoint):
+    """
+    Stores the checkpoint of the 'cdc' ingest engine in the S3 bucket under
+    'cdc/checkpoint.json'.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - checkpoint (dict): The checkpoint to store.
+
+    Raises:
+    - IngestError: If there is an issue storing the checkpoint in the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        s3.put_object(
+            Body=json.dumps(checkpoint).encode(),
+            Bucket=bucket,
+            Key="cdc/checkpoint.json",
+        )
+    except ClientError as e:
+        raise IngestError(f"Failed to store cdc checkpoint in bucket. {e}")
+
+
+def append_change_segment(
+    bucket, table_name, run_id, dict_table, commit_lsn, conn, ingest_format
+):
+    """
+    Writes the changes of a table to the S3 bucket as an immutable change
+    segment and appends it to the table's segment manifest.
+
+    Change segments hold one row per insert, update or delete, with its
+    operation in the 'cdc_op' column. Readers apply them in order on top of the
+    base segment, keeping the last version of each primary key and dropping the
+    keys whose last version is a delete.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - table_name (str): The name of the table.
+    - run_id (str): The timestamp of the ingestion run, see format_run_id.
+    - dict_table (dict): The changes, see group_changes.
+    - commit_lsn (str): The LSN of the last transaction in the segment.
+    - conn (pg8000.native.Connection): The database connection object.
+    - ingest_format (str): The storage format of the segment.
+
+    Raises:
+    - IngestError: If there is an issue storing the segment.
+    """
+    manifest = get_segment_manifest(bucket, table_name)
+    if not manifest.get("primary_key"):
+        manifest["primary_key"] = get_primary_key(conn, table_name)
+    key = get_segment_key(table_name, f"{run_id}.changes", ingest_format)
+    store_table_in_bucket(bucket, dict_table, table_name, run_id, ingest_format, key)
+    manifest["segments"].append(
+        {
+            "key": key,
+            "format": ingest_format,
+            "rows": len(dict_table[OPERATION_COLUMN]),
+            "kind": "changes",
+            "lsn": commit_lsn,
+        }
+    )
+    store_segment_manifest(bucket, table_name, manifest)
+
+
+def ingest_changes(bucket, conn, tables, run_id, ingest_format, metrics=None):
+    """
+    Ingests the changes recorded in a logical replication slot as change
+    segments, one per changed table.
+
+    The slot is created on the first run, before the base segment of each
+    table is extracted, so every change committed after a base segment was read
+    is still in the slot. Replaying a change already in the base segment is
+    harmless, as the last version of each row wins.
+
+    The slot is only read with pg_logical_slot_peek_changes. It is advanced
+    after the segments and the checkpoint are stored, so a failed run leaves the
+    changes in the slot, and transactions read again after a failure to advance
+    are skipped by the LSN stored in the checkpoint.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - conn (pg8000.native.Connection): The database connection object.
+    - tables (list): The names of the tables to ingest.
+    - run_id (str): The timestamp of the ingestion run, see format_run_id.
+    - ingest_format (str): The storage format of the segments.
+    - metrics (dict): If given, the work done for each table is recorded in a
+    TableMetrics stored under its name.
+
+    Returns:
+    - list: The names of the tables that got a new segment.
+
+    Raises:
+    - IngestError: If there is an issue reading the slot or storing the changes.
+    """
+    if metrics is not None:
+        for table_name in tables:
+            metrics.setdefault(table_name, TableMetrics())
+    else:
+        metrics = {}
+    slot_name = get_cdc_slot_name()
+    try:
+        create_slot_if_missing(conn, slot_name)
+    except DatabaseError as e:
+        raise IngestError(f"Failed to create replication slot. {e}")
+    updated = []
+    for table_name in tables:
+        with measuring(metrics.get(table_name)):
+            if get_segment_manifest(bucket, table_name) is None:
+                if append_table_segment(
+                    bucket, table_name, run_id, conn, "watermark", ingest_format
+                ):
+                    updated.append(table_name)
+    try:
+        transactions = split_transactions(
+            peek_changes(conn, slot_name, CDC_BATCH_SIZE)
+        )
+    except DatabaseError as e:
+        raise IngestError(f"Failed to read replication slot. {e}")
+    checkpoint = get_cdc_checkpoint(bucket)
+    if checkpoint is not None and checkpoint["slot"] == slot_name:
+        transactions = [
+            (lsn, lines)
+            for lsn, lines in transactions
+            if parse_lsn(lsn) > parse_lsn(checkpoint["lsn"])
+        ]
+    if not transactions:
+        return updated
+    commit_lsn = transactions[-1][0]
+    for table_name, dict_table in group_changes(transactions, tables).items():
+        with measuring(metrics.get(table_name)):
+            current_metrics().add(rows=len(dict_table[OPERATION_COLUMN]))
+            current_metrics().watermark = checkpoint
+            append_change_segment(
+                bucket, table_name, run_id, dict_table, commit_lsn, conn, ingest_format
+            )
+        if table_name not in updated:
+            updated.append(table_name)
+    store_cdc_checkpoint(bucket, {"slot": slot_name, "lsn": commit_lsn})
+    try:
+        advance_slot(conn, slot_name, commit_lsn)
+    except DatabaseError as e:
+        raise IngestError(f"Failed to advance replication slot. {e}")
+    return updated
+
+
+def get_run_manifest(run_id, started_at, tables, needs_updates, metrics):
+    """
+    Builds the manifest of an ingestion run.
+
+    Parameters:
+    - run_id (str): The timestamp of the ingestion run, see format_run_id.
+    - started_at (datetime): The time the run started.
+    - tables (list): The names of the tables extracted by the run.
+    - needs_updates (list): Whether each table was updated.
+    - metrics (dict): The TableMetrics of each table.
+
+    Returns:
+    - dict: {'run_id', 'started_at', 'duration_seconds', 'tables'}, where
+    'tables' maps each table to its 'updated' flag, rows fetched, bytes written,
+    query and S3 seconds and the watermark the extraction started from.
+    """
+    return {
+        "run_id": run_id,
+        "started_at": started_at.isoformat(),
+        "duration_seconds": round((datetime.now() - started_at).total_seconds(), 3),
+        "tables": {
+            table_name: {
+                "updated": bool(needs_update),
+                **metrics.get(table_name, TableMetrics()).as_dict(),
+            }
+            for table_name, needs_update in zip(tables, needs_updates)
+        },
+    }
+
+
+def store_run_manifest(bucket, run_manifest):
+    """
+    Stores the manifest of an ingestion run in the S3 bucket under
+    'runs/{run_id}.json'.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - run_manifest (dict): The manifest to store, see get_run_manifest.
+
+    Raises:
+    - IngestError: If there is an issue storing the manifest in the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        s3.put_object(
+            Body=json.dumps(run_manifest, default=str).encode(),
+            Bucket=bucket,
+            Key=f"runs/{run_manifest['run_id']}.json",
+        )
+    except ClientError as e:
+        raise IngestError(f"Failed to store run manifest in bucket. {e}")
+
+
+def get_run_checkpoint(bucket):
+    """
+    Retrieves the checkpoint of an unfinished ingestion run from the S3 bucket.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+
+    Returns:
+    - dict: The state of the run, see RunCheckpoint, or None if every run has
+    finished.
+
+    Raises:
+    - IngestError: If there is an issue retrieving the checkpoint from the S3
+    bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        checkpoint_object = s3.get_object(Bucket=bucket, Key="checkpoints/run.json")
+        return json.loads(checkpoint_object["Body"].read().decode())
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            return None
+        raise IngestError(f"Failed to get run checkpoint from bucket. {e}")
+
+
+def store_run_checkpoint(bucket, state):
+    """
+    Stores the checkpoint of an unfinished ingestion run in the S3 bucket under
+    'checkpoints/run.json'.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+    - state (dict): The state of the run, see RunCheckpoint.
+
+    Raises:
+    - IngestError: If there is an issue storing the checkpoint in the S3 bucket.
+    """
+    try:
+        s3 = get_s3_client()
+        s3.put_object(
+            Body=json.dumps(state, default=str).encode(),
+            Bucket=bucket,
+            Key="checkpoints/run.json",
+        )
+    except ClientError as e:
+        raise IngestError(f"Failed to store run checkpoint in bucket. {e}")
+
+
+def delete_run_checkpoint(bucket):
+    """
+    Deletes the checkpoint of a finished ingestion run from the S3 bucket.
+
+    Parameters:
+    - bucket (str): The name of the S3 bucket.
+
+    Raises:
+    - IngestError: If there is an issue deleting the checkpoint.
+    """
+    try:
+        s3 = get_s3_client()
+        s3.delete_object(Bucket=bucket, Key="checkpoints/run.json")
+    except ClientError as e:
+        raise IngestError(f"Failed to delete run checkpoint. {e}")
+
+
+def extract_tables(
+    tables, extract_table, conn, concurrency=1, snapshot_id=None, metrics=None
+):
+    """
+    Runs an extraction function over every table, serially on the given
+    connection or in parallel on a bounded pool of worker threads.
+
+    Each worker borrows a connection from 'db_pool' for every table, so at most
+    'concurrency' pooled connections are in use against the source database.
+    They are kept open for later warm invocations. Given a snapshot exported by
+    'conn', each worker reads its table from that snapshot, so all tables are a
+    consistent cut of the database however they are spread across workers.
+
+    Parameters:
+    - tables (list): The names of the tables to extract.
+    - extract_table (callable): Called as extract_table(table_name, conn).
+    - conn (pg8000.native.Connection): The connection used for serial extraction.
+    - concurrency (int): The maximum number of tables extracted at once.
+    - snapshot_id (str): The id of the snapshot exported by 'conn', or None.
+    - metrics (dict): If given, the work done for each table is recorded in a
+    TableMetrics stored under its name.
+
+    Returns:
+    - list: The results of extract_table, in the order of 'tables'.
+
+    Raises:
+    - IngestError: If the extraction of any table fails.
+    """
+    if metrics is not None:
+        for table_name in tables:
+            metrics.setdefault(table_name, TableMetrics())
+    else:
+        metrics = {}
+
+    if concurrency <= 1 or len(tables) <= 1:
+        results = []
+        for table_name in tables:
+            with measuring(metrics.get(table_name)):
+                results.append(extract_table(table_name, conn))
+        return results
+
+    def run(table_name):
+        with measuring(metrics.get(table_name)), db_pool.connection() as worker_conn:
+            with attached_snapshot(worker_conn, snapshot_id):
+                return extract_table(table_name, worker_conn)
+
+    with ThreadPoolExecutor(max_workers=min(concurrency, len(tables))) as pool:
+        return list(pool.map(run, tables))
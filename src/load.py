@@ -1,4 +1,6 @@
-import boto3
+from src.aws_clients import get_s3_client, get_secretsmanager_client
+from src.credentials import SecretsProvider, fetch_secrets, is_authentication_error
+from src.connections import ConnectionManager, ping_dbapi
 import pandas as pd
 from botocore.exceptions import ClientError
 import pg8000.dbapi
@@ -10,6 +12,14 @@ import io
 logging.basicConfig(level=50)
 
 
+WH_SECRET_IDS = {
+    "database": "whdb_name",
+    "host": "whdb_host",
+    "user": "whdb_user",
+    "password": "whdb_pass",
+}
+
+
 class LoadError(Exception):
     pass
 
@@ -17,7 +27,7 @@ class LoadError(Exception):
 def lambda_handler(event, context):
     try:
         S3_PROCESS_BUCKET = get_bucket_name("S3_PROCESS_BUCKET")
-        conn = get_connection()
+        conn = wh_connection.get()
         tables_names = event["tables"]
         for table_name in tables_names:
             if table_name == "dim_design":
@@ -101,7 +111,8 @@ def get_bucket_name(bucket_name):
 
 def get_secrets(sm):
     """
-    Retrieves Data Warehouse connection details from AWS Secrets Manager.
+    Retrieves Data Warehouse connection details from AWS Secrets Manager in a
+    single batched call.
 
     Parameters:
     - sm (boto3.client): The Secrets Manager client.
@@ -111,34 +122,44 @@ def get_secrets(sm):
         - 'database','host','user','password'
     """
     try:
-        db = sm.get_secret_value(SecretId="whdb_name")["SecretString"]
-        host = sm.get_secret_value(SecretId="whdb_host")["SecretString"]
-        user = sm.get_secret_value(SecretId="whdb_user")["SecretString"]
-        password = sm.get_secret_value(SecretId="whdb_pass")["SecretString"]
-        return {"database": db, "host": host, "user": user, "password": password}
+        return fetch_secrets(sm, WH_SECRET_IDS)
     except ClientError as e:
         raise LoadError(f"Failed to get secrets. {e}")
 
 
+wh_secrets = SecretsProvider(lambda: get_secrets(get_secretsmanager_client()))
+
+
 def get_connection():
     """
     Establishes a connection to the Data Warehouse using credentials from
     AWS Secrets Manager.
 
+    The credentials are cached across warm invocations. If the warehouse rejects
+    them, they are fetched again and the connection is retried once.
+
     Returns:
     - pg8000.native.Connection: A connection object to the database.
 
     """
     try:
-        sm = boto3.client("secretsmanager", region_name="eu-west-2")
-        return pg8000.dbapi.connect(**get_secrets(sm))
+        try:
+            return pg8000.dbapi.connect(**wh_secrets.get())
+        except DatabaseError as e:
+            if not is_authentication_error(e):
+                raise
+            wh_secrets.invalidate()
+            return pg8000.dbapi.connect(**wh_secrets.get())
     except DatabaseError as e:
         raise LoadError(f"Failed to get connection. {e}")
 
 
+wh_connection = ConnectionManager(lambda: get_connection(), ping_dbapi)
+
+
 def get_table_df_from_parquet(bucket, parquet_name):
     try:
-        s3 = boto3.client("s3", region_name="eu-west-2")
+        s3 = get_s3_client()
         buffer = io.BytesIO()
         s3.download_fileobj(
             Bucket=bucket, Key=f"{parquet_name}.parquet", Fileobj=buffer
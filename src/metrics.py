@@ -0,0 +1,158 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+_local = threading.local()
+
+
+class TableMetrics:
+    """
+    Counters of the work done for one table during one ingestion run.
+
+    Time is split into 'query' time, spent waiting on the database, and 's3'
+    time, spent waiting on S3. Timers of either kind started inside the other
+    on the same thread pause it, so an S3 upload made while a COPY is running
+    only counts as S3 time. Counters may be updated from several threads, e.g.
+    by the key-range workers of one table.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+        self.seconds = {"query": 0.0, "s3": 0.0}
+        self.watermark = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_dict(cls, counters):
+        """
+        Rebuilds metrics from the dictionary returned by as_dict.
+
+        Parameters:
+        - counters (dict): The counters.
+
+        Returns:
+        - TableMetrics: The metrics.
+        """
+        metrics = cls()
+        metrics.rows = counters["rows"]
+        metrics.bytes = counters["bytes"]
+        metrics.seconds = {
+            "query": counters["query_seconds"],
+            "s3": counters["s3_seconds"],
+        }
+        metrics.watermark = counters["watermark"]
+        return metrics
+
+    def add(self, rows=0, written=0):
+        """
+        Adds to the number of rows fetched and bytes written.
+
+        Parameters:
+        - rows (int): The number of rows fetched from the database.
+        - written (int): The number of bytes written to S3.
+        """
+        with self._lock:
+            self.rows += rows
+            self.bytes += written
+
+    def add_time(self, kind, seconds):
+        with self._lock:
+            self.seconds[kind] += seconds
+
+    def as_dict(self):
+        """
+        Returns the counters as a JSON-serialisable dictionary.
+
+        Returns:
+        - dict: {'rows', 'bytes', 'query_seconds', 's3_seconds', 'watermark'}.
+        """
+        with self._lock:
+            return {
+                "rows": self.rows,
+                "bytes": self.bytes,
+                "query_seconds": round(self.seconds["query"], 6),
+                "s3_seconds": round(self.seconds["s3"], 6),
+                "watermark": self.watermark,
+            }
+
+
+@contextmanager
+def measuring(metrics):
+    """
+    Records the work done on the current thread for the duration of a with
+    block into a TableMetrics.
+
+    Parameters:
+    - metrics (TableMetrics): The metrics to record into, or None to record
+    nothing.
+    """
+    previous = getattr(_local, "metrics", None)
+    _local.metrics = metrics
+    try:
+        yield
+    finally:
+        _local.metrics = previous
+
+
+def current_metrics():
+    """
+    Retrieves the metrics recorded on the current thread.
+
+    Returns:
+    - TableMetrics: The metrics, or a throwaway instance if nothing is being
+    recorded, so callers can always add to the result.
+    """
+    metrics = getattr(_local, "metrics", None)
+    return TableMetrics() if metrics is None else metrics
+
+
+@contextmanager
+def timing(kind):
+    """
+    Adds the duration of a with block to the 'query' or 's3' time of the
+    metrics recorded on the current thread, if any.
+
+    Parameters:
+    - kind (str): 'query' or 's3'.
+    """
+    metrics = getattr(_local, "metrics", None)
+    if metrics is None:
+        yield
+        return
+    timers = _local.__dict__.setdefault("timers", [])
+    now = time.perf_counter()
+    if timers:
+        outer_metrics, outer_kind, started = timers[-1]
+        outer_metrics.add_time(outer_kind, now - started)
+    timers.append([metrics, kind, now])
+    try:
+        yield
+    finally:
+        now = time.perf_counter()
+        metrics, kind, started = timers.pop()
+        metrics.add_time(kind, now - started)
+        if timers:
+            timers[-1][2] = now
+
+
+class MeteredConnection:
+    """
+    Wraps a pg8000.native connection so the time spent in run() counts as query
+    time in the metrics of the current thread. Every other attribute, e.g.
+    'columns' and 'row_count', is read from the wrapped connection.
+
+    Parameters:
+    - conn (pg8000.native.Connection): The connection to wrap.
+    """
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def run(self, *args, **kwargs):
+        with timing("query"):
+            return self._conn.run(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
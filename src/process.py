@@ -1,14 +1,77 @@
+import numpy as np
 import pandas as pd
-import boto3
+from src.aws_clients import get_s3_client
 from botocore.exceptions import ClientError
 import json
+import gzip
 import logging
 import requests
 import io
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 logging.basicConfig(level=50)
 
+INGEST_FORMATS = ("json", "ndjson", "ndjson.gz", "parquet", "csv.gz")
+CSV_NULL = "\\N"
+INGEST_LAYOUTS = ("snapshot", "segments")
+DIM_DATE_MODES = ("facts", "spine")
+OPERATION_COLUMN = "cdc_op"
+
+segment_cache = {}
+"""
+Dataframes of the delta segments already read, keyed by segment key. Segments
+are immutable, so warm invocations only download the segments they have not
+seen yet. The segments a table's manifest no longer lists are dropped.
+"""
+
+read_cache = {}
+"""
+Objects read from S3, keyed by bucket and key, with their ETag and parsed
+value. An invocation revalidates an entry with a conditional GET the first time
+it reads it and serves it from memory after that, so 'latest_date' and the
+manifests are downloaded once per invocation and unchanged objects are not
+downloaded or parsed again. Dataframes are handed out as copies, so a builder
+that changes its input cannot change it for the others. Tables are cached in a
+group per table name, which only keeps the key read last, so the versions the
+manifest no longer points at are dropped.
+"""
+read_cache_lock = threading.Lock()
+
+DIM_DATE_INDEX = "dim_date_index.npy"
+"""
+Key of the sorted datetime64[D] array of the dates in dim_date, stored in the
+process bucket next to dim_date.parquet so a run can find its new dates without
+reading the table.
+"""
+
+FACT_DATE_COLUMNS = {
+    "fact_sales_order": (
+        "created_date",
+        "last_updated_date",
+        "agreed_payment_date",
+        "agreed_delivery_date",
+    ),
+    "fact_payment": ("created_date", "last_updated_date", "payment_date"),
+    "fact_purchase_order": (
+        "created_date",
+        "last_updated_date",
+        "agreed_payment_date",
+        "agreed_delivery_date",
+    ),
+}
+"""
+The 'YYYY-MM-DD' columns of each fact table that reference dim_date, in the
+order get_dim_date receives the fact tables.
+"""
+
+TIMESTAMP_COLUMNS = ("created_at", "last_updated")
+"""
+The 'YYYY-MM-DD HH:MM:SS[.ffffff]' columns the fact tables split into a date
+and a time column, e.g. 'created_at' into 'created_date' and 'created_time'.
+"""
+
 
 class ProcessError(Exception):
     pass
@@ -19,132 +82,131 @@ def lambda_handler(event, context):
         S3_INGEST_BUCKET = get_bucket_name("S3_INGEST_BUCKET")
         S3_PROCESS_BUCKET = get_bucket_name("S3_PROCESS_BUCKET")
         tables_names = event["tables"]
+        expire_read_cache()
+        outputs = get_transforms_to_run(tables_names)
+        built = run_transforms(
+            S3_INGEST_BUCKET, S3_PROCESS_BUCKET, outputs, get_process_concurrency()
+        )
         update_tables_names = []
-        fact_purchase_order = None
-        fact_payment = None
-        fact_sales_order = None
-        for table_name in tables_names:
-            if table_name == "staff":
-                df_staff = get_dataframe_from_table_json(S3_INGEST_BUCKET, table_name)
-                df_department = get_dataframe_from_table_json(
-                    S3_INGEST_BUCKET, "department"
-                )
-                dim_staff = get_dim_staff(df_staff, df_department)
-                dim_staff_parquet = df_to_parquet(dim_staff)
-                store_parquet_file(S3_PROCESS_BUCKET, dim_staff_parquet, "dim_staff")
-                insert_table_to_update_tables_arr(update_tables_names, "dim_staff")
-            elif table_name == "address":
-                df_address = get_dataframe_from_table_json(S3_INGEST_BUCKET, table_name)
-                dim_location = get_dim_location(df_address)
-                dim_location_parquet = df_to_parquet(dim_location)
-                store_parquet_file(
-                    S3_PROCESS_BUCKET, dim_location_parquet, "dim_location"
-                )
-                insert_table_to_update_tables_arr(update_tables_names, "dim_location")
-            elif table_name == "design":
-                df_design = get_dataframe_from_table_json(S3_INGEST_BUCKET, table_name)
-                dim_design = get_dim_design(df_design)
-                dim_design_parquet = df_to_parquet(dim_design)
-                store_parquet_file(S3_PROCESS_BUCKET, dim_design_parquet, "dim_design")
-                insert_table_to_update_tables_arr(update_tables_names, "dim_design")
-            elif table_name == "currency":
-                df_currency = get_dataframe_from_table_json(
-                    S3_INGEST_BUCKET, table_name
-                )
-                dim_currency = get_dim_currency(df_currency)
-                dim_currency_parquet = df_to_parquet(dim_currency)
-                store_parquet_file(
-                    S3_PROCESS_BUCKET, dim_currency_parquet, "dim_currency"
-                )
-                insert_table_to_update_tables_arr(update_tables_names, "dim_currency")
-            elif table_name == "counterparty":
-                df_counterparty = get_dataframe_from_table_json(
-                    S3_INGEST_BUCKET, table_name
-                )
-                df_address = get_dataframe_from_table_json(S3_INGEST_BUCKET, "address")
-                dim_counterparty = get_dim_counterparty(df_counterparty, df_address)
-                dim_counterparty_parquet = df_to_parquet(dim_counterparty)
-                store_parquet_file(
-                    S3_PROCESS_BUCKET, dim_counterparty_parquet, "dim_counterparty"
-                )
-                insert_table_to_update_tables_arr(
-                    update_tables_names, "dim_counterparty"
-                )
-            elif table_name == "sales_order":
-                df_sales_order = get_dataframe_from_table_json(
-                    S3_INGEST_BUCKET, table_name
-                )
-                fact_sales_order = get_fact_sales_order(df_sales_order)
-                fact_sales_order_parquet = df_to_parquet(fact_sales_order)
-                store_parquet_file(
-                    S3_PROCESS_BUCKET, fact_sales_order_parquet, "fact_sales_order"
-                )
-                insert_table_to_update_tables_arr(
-                    update_tables_names, "fact_sales_order"
-                )
-            elif table_name == "transaction":
-                df_transaction = get_dataframe_from_table_json(
-                    S3_INGEST_BUCKET, table_name
-                )
-                dim_transaction = get_dim_transaction(df_transaction)
-                dim_transaction_parquet = df_to_parquet(dim_transaction)
-                store_parquet_file(
-                    S3_PROCESS_BUCKET, dim_transaction_parquet, "dim_transaction"
-                )
-                insert_table_to_update_tables_arr(
-                    update_tables_names, "dim_transaction"
-                )
-            elif table_name == "payment_type":
-                df_payment_type = get_dataframe_from_table_json(
-                    S3_INGEST_BUCKET, table_name
-                )
-                dim_payment_type = get_dim_payment_type(df_payment_type)
-                dim_payment_type_parquet = df_to_parquet(dim_payment_type)
-                store_parquet_file(
-                    S3_PROCESS_BUCKET, dim_payment_type_parquet, "dim_payment_type"
-                )
-                insert_table_to_update_tables_arr(
-                    update_tables_names, "dim_payment_type"
-                )
-            elif table_name == "payment":
-                df_payment = get_dataframe_from_table_json(S3_INGEST_BUCKET, table_name)
-                fact_payment = get_fact_payment(df_payment)
-                fact_payment_parquet = df_to_parquet(fact_payment)
-                store_parquet_file(
-                    S3_PROCESS_BUCKET, fact_payment_parquet, "fact_payment"
-                )
-                insert_table_to_update_tables_arr(update_tables_names, "fact_payment")
-            elif table_name == "purchase_order":
-                df_purchase_order = get_dataframe_from_table_json(
-                    S3_INGEST_BUCKET, table_name
-                )
-                fact_purchase_order = get_fact_purchase_order(df_purchase_order)
-                fact_purchase_order_parquet = df_to_parquet(fact_purchase_order)
-                store_parquet_file(
-                    S3_PROCESS_BUCKET,
-                    fact_purchase_order_parquet,
-                    "fact_purchase_order",
-                )
-                insert_table_to_update_tables_arr(
-                    update_tables_names, "fact_purchase_order"
-                )
-        if (
-            fact_sales_order is not None
-            or fact_payment is not None
-            or fact_purchase_order is not None
-        ):
-            dim_date = get_dim_date(
-                S3_PROCESS_BUCKET, fact_sales_order, fact_payment, fact_purchase_order
-            )
-            dim_date_parquet = df_to_parquet(dim_date)
-            store_parquet_file(S3_PROCESS_BUCKET, dim_date_parquet, "dim_date")
-            insert_table_to_update_tables_arr(update_tables_names, "dim_date")
+        for output in built:
+            insert_table_to_update_tables_arr(update_tables_names, output)
         return {"msg": "Data process successful.", "tables": update_tables_names}
     except ProcessError as e:
         logging.critical(e)
         return {"msg": "Failed to process data", "err": str(e)}
 
 
+def get_process_concurrency():
+    try:
+        concurrency = int(os.environ.get("PROCESS_CONCURRENCY", "1"))
+    except ValueError as e:
+        raise ProcessError(f"Invalid process concurrency. {e}")
+    if concurrency < 1:
+        raise ProcessError(f"Invalid process concurrency. {concurrency}")
+    return concurrency
+
+
+def get_transforms():
+    """
+    Declares each table of the warehouse: the ingested tables it is built from
+    ('inputs'), the tables built earlier in the run it reads ('after', passed as
+    None when they are not rebuilt), and its builder, called with the process
+    bucket first if 'bucket' is set, then the inputs, then the 'after' tables.
+    A table is rebuilt when any of its inputs or 'after' tables changed. A
+    builder returns None when its table is unchanged, and 'stored' is called
+    with the process bucket and the table once it is stored. Tables are listed
+    after the tables they read.
+    """
+    return {
+        "dim_staff": {"inputs": ("staff", "department"), "build": get_dim_staff},
+        "dim_location": {"inputs": ("address",), "build": get_dim_location},
+        "dim_design": {"inputs": ("design",), "build": get_dim_design},
+        "dim_currency": {"inputs": ("currency",), "build": get_dim_currency},
+        "dim_counterparty": {
+            "inputs": ("counterparty", "address"),
+            "build": get_dim_counterparty,
+        },
+        "dim_transaction": {"inputs": ("transaction",), "build": get_dim_transaction},
+        "dim_payment_type": {
+            "inputs": ("payment_type",),
+            "build": get_dim_payment_type,
+        },
+        "fact_sales_order": {
+            "inputs": ("sales_order",),
+            "build": get_fact_sales_order,
+        },
+        "fact_payment": {"inputs": ("payment",), "build": get_fact_payment},
+        "fact_purchase_order": {
+            "inputs": ("purchase_order",),
+            "build": get_fact_purchase_order,
+        },
+        "dim_date": {
+            "inputs": (),
+            "after": ("fact_sales_order", "fact_payment", "fact_purchase_order"),
+            "build": get_dim_date,
+            "bucket": True,
+            "stored": store_dim_date_index,
+        },
+    }
+
+
+def get_transforms_to_run(tables_names):
+    outputs = []
+    for output, transform in get_transforms().items():
+        if any(table_name in tables_names for table_name in transform["inputs"]):
+            outputs.append(output)
+        elif any(upstream in outputs for upstream in transform.get("after", ())):
+            outputs.append(output)
+    return outputs
+
+
+def load_transform_inputs(bucket, outputs, concurrency=1):
+    transforms = get_transforms()
+    uses = {}
+    for output in outputs:
+        for table_name in transforms[output]["inputs"]:
+            uses.setdefault(table_name, []).append(output)
+
+    def load(table_name):
+        return [
+            get_dataframe_from_table_json(bucket, table_name)
+            for _ in uses[table_name]
+        ]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        frames = dict(zip(uses, (iter(loaded) for loaded in pool.map(load, uses))))
+    return {
+        output: [next(frames[table_name]) for table_name in transforms[output]["inputs"]]
+        for output in outputs
+    }
+
+
+def run_transforms(ingest_bucket, process_bucket, outputs, concurrency=1):
+    inputs = load_transform_inputs(ingest_bucket, outputs, concurrency)
+    transforms = get_transforms()
+    futures = {}
+
+    def build(output, inputs):
+        transform = transforms[output]
+        upstream = [
+            futures[name].result() if name in futures else None
+            for name in transform.get("after", ())
+        ]
+        args = [process_bucket] if transform.get("bucket") else []
+        df = transform["build"](*args, *inputs, *upstream)
+        if df is None:
+            return None
+        store_parquet_file(process_bucket, df_to_parquet(df), output)
+        if "stored" in transform:
+            transform["stored"](process_bucket, df)
+        return df
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for output in outputs:
+            futures[output] = pool.submit(build, output, inputs[output])
+        return [output for output in outputs if futures[output].result() is not None]
+
+
 def insert_table_to_update_tables_arr(update_tables_names, table_name):
     i = len(update_tables_names) - 1
     update_tables_names.append(table_name)
@@ -162,32 +224,199 @@ def get_bucket_name(bucket_name):
         raise ProcessError(f"Failed to get env bucket name. {e}")
 
 
+def read_object(bucket, key, parse, group=None):
+    with read_cache_lock:
+        if group is not None and (bucket, key) not in read_cache:
+            for cached_key, cached in list(read_cache.items()):
+                if cached["group"] == (bucket, group):
+                    del read_cache[cached_key]
+        entry = read_cache.setdefault(
+            (bucket, key),
+            {
+                "etag": None,
+                "value": None,
+                "fresh": False,
+                "group": None if group is None else (bucket, group),
+                "lock": threading.Lock(),
+            },
+        )
+    with entry["lock"]:
+        if not entry["fresh"]:
+            s3 = get_s3_client()
+            conditions = {"IfNoneMatch": entry["etag"]} if entry["etag"] else {}
+            try:
+                response = s3.get_object(Bucket=bucket, Key=key, **conditions)
+                entry["value"] = parse(response["Body"].read())
+                entry["etag"] = response["ETag"]
+            except ClientError as e:
+                if e.response["Error"]["Code"] not in ("304", "NotModified"):
+                    entry["etag"] = None
+                    raise
+            entry["fresh"] = True
+        value = entry["value"]
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    return value
+
+
+def expire_read_cache():
+    with read_cache_lock:
+        for entry in read_cache.values():
+            entry["fresh"] = False
+
+
+def reset_read_cache():
+    with read_cache_lock:
+        read_cache.clear()
+
+
 def get_date(bucket):
     try:
-        s3 = boto3.client("s3", region_name="eu-west-2")
-        date_object = s3.get_object(Bucket=bucket, Key="latest_date")
-        return date_object["Body"].read().decode()
+        return read_object(bucket, "latest_date", lambda body: body.decode())
     except ClientError as e:
         raise ProcessError(f"Failed to get date from bucket. {e}")
 
 
-def get_dataframe_from_table_json(bucket, table_name):
+def get_manifest(bucket):
     try:
-        s3 = boto3.client("s3", region_name="eu-west-2")
+        return read_object(bucket, "manifest.json", json.loads)
+    except ClientError as e:
+        if e.response["Error"]["Code"] == "NoSuchKey":
+            return None
+        raise ProcessError(f"Failed to get manifest from bucket. {e}")
+
+
+def get_table_location(bucket, table_name):
+    manifest = get_manifest(bucket)
+    if manifest is None:
         latest_date = get_date(bucket)
-        table_json = (
-            s3.get_object(
-                Bucket=bucket,
-                Key=f"latest/{latest_date}/{table_name}.json",
-            )["Body"]
-            .read()
-            .decode()
+        ingest_format = get_ingest_format()
+        return f"latest/{latest_date}/{table_name}.{ingest_format}", ingest_format
+    try:
+        entry = manifest["tables"][table_name]
+    except KeyError as e:
+        raise ProcessError(f"Failed to find table in manifest. {e}")
+    return entry["key"], entry["format"]
+
+
+def get_ingest_format():
+    ingest_format = os.environ.get("INGEST_FORMAT", "json")
+    if ingest_format not in INGEST_FORMATS:
+        raise ProcessError(f"Unknown ingest format. {ingest_format}")
+    return ingest_format
+
+
+def get_ingest_layout():
+    layout = os.environ.get("INGEST_LAYOUT", "snapshot")
+    if layout not in INGEST_LAYOUTS:
+        raise ProcessError(f"Unknown ingest layout. {layout}")
+    return layout
+
+
+def get_segment_manifest(bucket, table_name):
+    try:
+        return read_object(bucket, f"segments/{table_name}/manifest.json", json.loads)
+    except ClientError as e:
+        raise ProcessError(f"Failed to get segment manifest. {e}")
+
+
+def get_dataframe_from_segments(bucket, table_name):
+    manifest = get_segment_manifest(bucket, table_name)
+    keys = {segment["key"] for segment in manifest["segments"]}
+    for key in list(segment_cache):
+        if key.startswith(f"segments/{table_name}/") and key not in keys:
+            segment_cache.pop(key, None)
+    try:
+        s3 = get_s3_client()
+        frames = []
+        for segment in manifest["segments"]:
+            df = segment_cache.get(segment["key"])
+            if df is None:
+                body = s3.get_object(Bucket=bucket, Key=segment["key"])["Body"].read()
+                df = get_dataframe_from_bytes(body, segment["format"])
+                segment_cache[segment["key"]] = df
+            frames.append(df)
+    except ClientError as e:
+        raise ProcessError(f"Failed to get table segments. {e}")
+    df = pd.concat(frames, ignore_index=True)
+    if manifest.get("primary_key"):
+        key = manifest["primary_key"]
+        # each key keeps the position of its first row with the values of its
+        # last one, so updates stay in place and inserts stay at the end
+        groups = df.groupby(key, sort=False, dropna=False).ngroup()
+        latest = groups[~df.duplicated(subset=key, keep="last")]
+        df = df.loc[latest.sort_values(kind="stable").index]
+        df = df.reset_index(drop=True)
+    if OPERATION_COLUMN in df.columns:
+        df = df[df[OPERATION_COLUMN] != "D"].drop(columns=OPERATION_COLUMN)
+        df = df.reset_index(drop=True)
+        for column, dtype in frames[0].dtypes.items():
+            if column in df.columns and df[column].dtype != dtype:
+                if not df[column].isna().any():
+                    df[column] = df[column].astype(dtype)
+    return df
+
+
+def reset_segment_cache():
+    segment_cache.clear()
+
+
+def get_dataframe_from_table_json(bucket, table_name):
+    if get_ingest_layout() == "segments":
+        return get_dataframe_from_segments(bucket, table_name)
+    try:
+        key, ingest_format = get_table_location(bucket, table_name)
+        return read_object(
+            bucket,
+            key,
+            lambda body: get_dataframe_from_bytes(body, ingest_format),
+            table_name,
         )
-        return pd.DataFrame(json.loads(table_json))
     except ClientError as e:
         raise ProcessError(f"Failed to get table json. {e}")
 
 
+def get_dataframe_from_bytes(body, ingest_format="json"):
+    if ingest_format == "ndjson":
+        return pd.DataFrame([json.loads(line) for line in body.splitlines() if line])
+    if ingest_format == "ndjson.gz":
+        lines = gzip.decompress(body).splitlines()
+        schema = json.loads(lines[0])["schema"]
+        return pd.DataFrame(
+            [json.loads(line) for line in lines[1:]],
+            columns=[column["name"] for column in schema],
+        )
+    if ingest_format == "csv.gz":
+        return get_dataframe_from_csv(gzip.decompress(body))
+    if ingest_format == "parquet":
+        df = pd.read_parquet(io.BytesIO(body))
+        for column in df.select_dtypes(include="datetime").columns:
+            df[column] = df[column].astype(str)
+        return df
+    return pd.DataFrame(json.loads(body.decode()))
+
+
+def get_dataframe_from_csv(body):
+    schema_line, _, rows = body.partition(b"\n")
+    schema = json.loads(schema_line)["schema"]
+    columns = [column["name"] for column in schema]
+    if not rows.strip():
+        return pd.DataFrame(columns=columns)
+    df = pd.read_csv(
+        io.BytesIO(rows),
+        names=columns,
+        dtype=str,
+        keep_default_na=False,
+        na_values=[CSV_NULL],
+    )
+    for column in schema:
+        if column["type"] in ("integer", "float"):
+            df[column["name"]] = pd.to_numeric(df[column["name"]])
+        elif column["type"] == "boolean":
+            df[column["name"]] = df[column["name"]].map({"t": True, "f": False})
+    return df
+
+
 def get_dim_staff(df_staff, df_department):
     try:
         df_staff_department = df_staff.join(
@@ -309,21 +538,25 @@ def get_dim_transaction(df_transaction):
         raise ProcessError(f"Failed to get dim_transaction. {e}")
 
 
+def split_timestamps(df, columns=TIMESTAMP_COLUMNS):
+    for column in columns:
+        values = df[column].to_numpy(dtype=str)
+        if len(values):
+            parts = np.char.partition(values, " ")
+        else:
+            parts = np.empty((0, 3), dtype=str)
+        if (parts[:, 1] != " ").any():
+            raise ValueError(f"Timestamp without a time in '{column}'.")
+        name = column.removesuffix("_at")
+        df[f"{name}_date"] = parts[:, 0].astype(object)
+        df[f"{name}_time"] = parts[:, 2].astype(object)
+    return df
+
+
 def get_fact_payment(df_payment):
     try:
         df_payment["payment_record_id"] = range(1, len(df_payment) + 1)
-        df_payment["created_date"] = df_payment["created_at"].apply(
-            lambda x: x[: x.index(" ")]
-        )
-        df_payment["created_time"] = df_payment["created_at"].apply(
-            lambda x: x[x.index(" ") + 1 :]
-        )
-        df_payment["last_updated_date"] = df_payment["last_updated"].apply(
-            lambda x: x[: x.index(" ")]
-        )
-        df_payment["last_updated_time"] = df_payment["last_updated"].apply(
-            lambda x: x[x.index(" ") + 1 :]
-        )
+        split_timestamps(df_payment)
         return df_payment.drop(
             columns=[
                 "created_at",
@@ -354,18 +587,7 @@ def get_fact_payment(df_payment):
 def get_fact_purchase_order(df_purchase_order):
     try:
         df_purchase_order["purchase_record_id"] = range(1, len(df_purchase_order) + 1)
-        df_purchase_order["created_date"] = df_purchase_order["created_at"].apply(
-            lambda x: x[: x.index(" ")]
-        )
-        df_purchase_order["created_time"] = df_purchase_order["created_at"].apply(
-            lambda x: x[x.index(" ") + 1 :]
-        )
-        df_purchase_order["last_updated_date"] = df_purchase_order[
-            "last_updated"
-        ].apply(lambda x: x[: x.index(" ")])
-        df_purchase_order["last_updated_time"] = df_purchase_order[
-            "last_updated"
-        ].apply(lambda x: x[x.index(" ") + 1 :])
+        split_timestamps(df_purchase_order)
         return df_purchase_order.drop(columns=["created_at", "last_updated"]).set_index(
             "purchase_record_id"
         )[
@@ -393,18 +615,7 @@ def get_fact_purchase_order(df_purchase_order):
 def get_fact_sales_order(df_sales_order):
     try:
         df_sales_order["sales_record_id"] = range(1, len(df_sales_order) + 1)
-        df_sales_order["created_date"] = df_sales_order["created_at"].apply(
-            lambda x: x[: x.index(" ")]
-        )
-        df_sales_order["created_time"] = df_sales_order["created_at"].apply(
-            lambda x: x[x.index(" ") + 1 :]
-        )
-        df_sales_order["last_updated_date"] = df_sales_order["last_updated"].apply(
-            lambda x: x[: x.index(" ")]
-        )
-        df_sales_order["last_updated_time"] = df_sales_order["last_updated"].apply(
-            lambda x: x[x.index(" ") + 1 :]
-        )
+        split_timestamps(df_sales_order)
         return (
             df_sales_order.rename(columns={"staff_id": "sales_staff_id"})
             .drop(columns=["created_at", "last_updated"])
@@ -433,57 +644,132 @@ def get_fact_sales_order(df_sales_order):
 
 def get_dim_date(bucket, fact_sales_order, fact_payment, fact_purchase_order):
     try:
-        dates = []
-        s3 = boto3.client("s3", region_name="eu-west-2")
-        try:
-            buffer = io.BytesIO()
-            s3.download_fileobj(Bucket=bucket, Key=f"dim_date.parquet", Fileobj=buffer)
-            s3_dates = pd.read_parquet(buffer)["date_id"].apply(lambda x: x.strftime('%Y-%m-%d'))
-            dates.append(s3_dates)
-        except ClientError:
-            pass
-        if fact_sales_order is not None:
-            dates += [
-                fact_sales_order["created_date"],
-                fact_sales_order["last_updated_date"],
-                fact_sales_order["agreed_payment_date"],
-                fact_sales_order["agreed_delivery_date"],
-            ]
-        if fact_payment is not None:
-            dates += [
-                fact_payment["created_date"],
-                fact_payment["last_updated_date"],
-                fact_payment["payment_date"],
-            ]
-        if fact_purchase_order is not None:
-            dates += [
-                fact_purchase_order["created_date"],
-                fact_purchase_order["last_updated_date"],
-                fact_purchase_order["agreed_payment_date"],
-                fact_purchase_order["agreed_delivery_date"],
-            ]
-        timestamps = (
-            pd.concat(dates)
-            .drop_duplicates(ignore_index=True)
-            .apply(lambda x: pd.to_datetime(x))
-        )
-        dim_date = pd.DataFrame(
-            {
-                "date_id": timestamps,
-            }
-        )
-        dim_date["year"] = dim_date["date_id"].dt.year
-        dim_date["month"] = dim_date["date_id"].dt.month
-        dim_date["day"] = dim_date["date_id"].dt.day
-        dim_date["day_of_week"] = dim_date["date_id"].dt.day_of_week
-        dim_date["day_name"] = dim_date["date_id"].dt.day_name()
-        dim_date["month_name"] = dim_date["date_id"].dt.month_name()
-        dim_date["quarter"] = dim_date["date_id"].dt.quarter
-        return dim_date.sort_values(by='date_id', ignore_index=True)
+        known_dates = get_dim_date_index(bucket)
+        facts = (fact_sales_order, fact_payment, fact_purchase_order)
+        if get_dim_date_mode() == "spine":
+            dates = get_spine_dates(known_dates, *facts)
+        else:
+            dates = get_fact_dates(*facts)
+        new_dates = np.setdiff1d(dates, known_dates, assume_unique=True)
+        if not len(new_dates):
+            return None
+        dim_date = get_calendar(new_dates)
+        if len(known_dates):
+            # the index is stored after dim_date, so it can be behind it
+            dim_date = pd.concat(
+                [get_stored_dim_date(bucket), dim_date], ignore_index=True
+            ).drop_duplicates(subset="date_id", ignore_index=True)
+        return dim_date
     except Exception as e:
         raise ProcessError(f"Failed to get dim_date. {e}")
 
 
+def get_fact_dates(*facts):
+    values = [
+        fact[column].to_numpy()
+        for fact, columns in zip(facts, FACT_DATE_COLUMNS.values())
+        if fact is not None
+        for column in columns
+    ]
+    if not values:
+        return np.array([], dtype="datetime64[D]")
+    candidates = pd.unique(np.concatenate(values))
+    dates = pd.to_datetime(candidates, format="ISO8601").to_numpy()
+    return np.unique(dates.astype("datetime64[D]"))
+
+
+def get_dim_date_mode():
+    mode = os.environ.get("DIM_DATE_MODE", "facts")
+    if mode not in DIM_DATE_MODES:
+        raise ProcessError(f"Unknown dim_date mode. {mode}")
+    return mode
+
+
+def get_dim_date_spine():
+    spine = os.environ.get("DIM_DATE_SPINE", "2020-2035")
+    try:
+        first_year, last_year = (int(year) for year in spine.split("-"))
+    except ValueError as e:
+        raise ProcessError(f"Invalid dim_date spine. {spine} {e}")
+    if first_year > last_year:
+        raise ProcessError(f"Invalid dim_date spine. {spine}")
+    return (
+        np.datetime64(f"{first_year:04}-01-01"),
+        np.datetime64(f"{last_year:04}-12-31"),
+    )
+
+
+def get_spine_dates(known_dates, *facts):
+    if len(known_dates):
+        start, end = known_dates[0], known_dates[-1]
+        contiguous = len(known_dates) == (end - start).astype(int) + 1
+    else:
+        start, end = get_dim_date_spine()
+        contiguous = False
+    values = [
+        fact[column]
+        for fact, columns in zip(facts, FACT_DATE_COLUMNS.values())
+        if fact is not None and len(fact)
+        for column in columns
+    ]
+    if values:
+        bounds = pd.to_datetime(
+            [min(value.min() for value in values), max(value.max() for value in values)],
+            format="ISO8601",
+        ).to_numpy().astype("datetime64[D]")
+        if contiguous and start <= bounds[0] and bounds[1] <= end:
+            return np.array([], dtype="datetime64[D]")
+        start, end = min(start, bounds[0]), max(end, bounds[1])
+    start = start.astype("datetime64[Y]").astype("datetime64[D]")
+    end = (end.astype("datetime64[Y]") + 1).astype("datetime64[D]") - 1
+    return pd.date_range(start, end, freq="D").to_numpy().astype("datetime64[D]")
+
+
+def get_calendar(dates):
+    dim_date = pd.DataFrame({"date_id": pd.to_datetime(dates.astype(str))})
+    dim_date["year"] = dim_date["date_id"].dt.year
+    dim_date["month"] = dim_date["date_id"].dt.month
+    dim_date["day"] = dim_date["date_id"].dt.day
+    dim_date["day_of_week"] = dim_date["date_id"].dt.day_of_week
+    dim_date["day_name"] = dim_date["date_id"].dt.day_name()
+    dim_date["month_name"] = dim_date["date_id"].dt.month_name()
+    dim_date["quarter"] = dim_date["date_id"].dt.quarter
+    return dim_date
+
+
+def get_stored_dim_date(bucket):
+    try:
+        s3 = get_s3_client()
+        buffer = io.BytesIO()
+        s3.download_fileobj(Bucket=bucket, Key="dim_date.parquet", Fileobj=buffer)
+    except ClientError:
+        return get_calendar(np.array([], dtype="datetime64[D]"))
+    return pd.read_parquet(buffer)
+
+
+def get_dim_date_index(bucket):
+    try:
+        return read_object(
+            bucket, DIM_DATE_INDEX, lambda body: np.load(io.BytesIO(body))
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "NoSuchKey":
+            raise
+    dim_date = get_stored_dim_date(bucket)
+    return np.unique(dim_date["date_id"].to_numpy().astype("datetime64[D]"))
+
+
+def store_dim_date_index(bucket, dim_date):
+    try:
+        dates = np.unique(dim_date["date_id"].to_numpy().astype("datetime64[D]"))
+        body = io.BytesIO()
+        np.save(body, dates, allow_pickle=False)
+        s3 = get_s3_client()
+        s3.put_object(Body=body.getvalue(), Bucket=bucket, Key=DIM_DATE_INDEX)
+    except ClientError as e:
+        raise ProcessError(f"Failed to store dim_date index in bucket. {e}")
+
+
 def df_to_parquet(df):
     try:
         parquet_file = io.BytesIO()
@@ -499,7 +785,7 @@ def df_to_parquet(df):
 
 def store_parquet_file(bucket, parquet_file, parquet_name):
     try:
-        s3 = boto3.client("s3", region_name="eu-west-2")
+        s3 = get_s3_client()
         s3.put_object(Body=parquet_file, Bucket=bucket, Key=f"{parquet_name}.parquet")
     except ClientError as e:
         raise ProcessError(f"Failed to store parquet_file in bucket. {e}")
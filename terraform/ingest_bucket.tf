@@ -10,8 +10,43 @@ resource "aws_s3_bucket" "lambda_code_bucket" {
 
 data "archive_file" "ingest_lambda_deployment_package" {
   type        = "zip"
-  source_file = "${path.module}/../src/extract.py"
   output_path = "${path.module}/../deployment-packages/ingest_lambda_code.zip"
+  source {
+    content  = file("${path.module}/../src/extract.py")
+    filename = "src/extract.py"
+  }
+  source {
+    content  = file("${path.module}/../src/aws_clients.py")
+    filename = "src/aws_clients.py"
+  }
+  source {
+    content  = file("${path.module}/../src/credentials.py")
+    filename = "src/credentials.py"
+  }
+  source {
+    content  = file("${path.module}/../src/connections.py")
+    filename = "src/connections.py"
+  }
+  source {
+    content  = file("${path.module}/../src/cdc.py")
+    filename = "src/cdc.py"
+  }
+  source {
+    content  = file("${path.module}/../src/catalog.py")
+    filename = "src/catalog.py"
+  }
+  source {
+    content  = file("${path.module}/../src/columns.py")
+    filename = "src/columns.py"
+  }
+  source {
+    content  = file("${path.module}/../src/metrics.py")
+    filename = "src/metrics.py"
+  }
+  source {
+    content  = file("${path.module}/../src/checkpoints.py")
+    filename = "src/checkpoints.py"
+  }
 }
 
 resource "aws_s3_object" "ingest_lambda_code" {
@@ -44,7 +44,13 @@ resource "aws_iam_role_policy_attachment" "cw_ingest_policy_attachemnt" {
 
 data "aws_iam_policy_document" "s3_ingest_document" {
   statement {
-    actions   = ["s3:PutObject", "s3:GetObject", "s3:DeleteObject"]
+    actions = [
+      "s3:PutObject",
+      "s3:GetObject",
+      "s3:DeleteObject",
+      "s3:AbortMultipartUpload",
+      "s3:ListMultipartUploadParts"
+    ]
     resources = ["${aws_s3_bucket.ingest_bucket.arn}/*"]
   }
   statement {
@@ -89,6 +95,10 @@ data "aws_iam_policy_document" "sm_ingest_document" {
       "${data.aws_secretsmanager_secret.totesys_db_pass.arn}"
     ]
   }
+  statement {
+    actions   = ["secretsmanager:BatchGetSecretValue"]
+    resources = ["*"]
+  }
 }
 
 resource "aws_iam_policy" "sm_policy_ingest" {
@@ -10,14 +10,34 @@ resource "aws_lambda_function" "ingest_lambda" {
   s3_key           = aws_s3_object.ingest_lambda_code.key
   function_name    = "ingest_lambda"
   role             = aws_iam_role.ingest_lambda_role.arn
-  handler          = "extract.lambda_handler"
+  handler          = "src.extract.lambda_handler"
   source_code_hash = filebase64sha256(data.archive_file.ingest_lambda_deployment_package.output_path)
   timeout          = 60
   runtime          = "python3.12"
   layers           = [aws_lambda_layer_version.ingest_layer.arn]
   environment {
     variables = {
-      S3_INGEST_BUCKET = aws_s3_bucket.ingest_bucket.bucket
+      S3_INGEST_BUCKET          = aws_s3_bucket.ingest_bucket.bucket
+      EXTRACT_MODE              = "watermark"
+      INGEST_FORMAT             = "ndjson.gz"
+      EXTRACT_CONCURRENCY       = "4"
+      INGEST_LAYOUT             = "segments"
+      CHANGE_PROBE              = "stats"
+      EXTRACT_RANGE_ROWS        = "100000"
+      EXTRACT_RANGE_CONCURRENCY = "4"
+      EXTRACT_CONSISTENCY       = "snapshot"
+      SCHEMA_CATALOG            = "cached"
+      RUN_METRICS               = "manifest"
+      EXTRACT_CHECKPOINT        = "resume"
+      REFRESH_POLICIES          = jsonencode({
+        currency       = { interval_minutes = 1440, max_age_minutes = 2880 }
+        department     = { interval_minutes = 1440, max_age_minutes = 2880 }
+        payment_type   = { interval_minutes = 1440, max_age_minutes = 2880 }
+        sales_order    = { priority = 10 }
+        purchase_order = { priority = 10 }
+        payment        = { priority = 10 }
+        transaction    = { priority = 10 }
+      })
     }
   }
 }
@@ -1,8 +1,23 @@
 
 data "archive_file" "load_lambda_deployment_package" {
   type        = "zip"
-  source_file = "${path.module}/../src/load.py"
   output_path = "${path.module}/../deployment-packages/load_lambda_code.zip"
+  source {
+    content  = file("${path.module}/../src/load.py")
+    filename = "src/load.py"
+  }
+  source {
+    content  = file("${path.module}/../src/aws_clients.py")
+    filename = "src/aws_clients.py"
+  }
+  source {
+    content  = file("${path.module}/../src/credentials.py")
+    filename = "src/credentials.py"
+  }
+  source {
+    content  = file("${path.module}/../src/connections.py")
+    filename = "src/connections.py"
+  }
 }
 
 resource "aws_s3_object" "load_lambda_code" {
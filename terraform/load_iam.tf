@@ -69,6 +69,10 @@ data "aws_iam_policy_document" "sm_load_document" {
       "${data.aws_secretsmanager_secret.warehouse_db_pass.arn}",
     ]
   }
+  statement {
+    actions   = ["secretsmanager:BatchGetSecretValue"]
+    resources = ["*"]
+  }
 }
 
 resource "aws_iam_policy" "sm_policy_load" {
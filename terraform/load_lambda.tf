@@ -10,7 +10,7 @@ resource "aws_lambda_function" "load_lambda" {
   s3_key           = aws_s3_object.load_lambda_code.key
   function_name    = "load_lambda"
   role             = aws_iam_role.load_lambda_role.arn
-  handler          = "load.lambda_handler"
+  handler          = "src.load.lambda_handler"
   source_code_hash = filebase64sha256(data.archive_file.load_lambda_deployment_package.output_path)
   timeout          = 900
   runtime          = "python3.12"
@@ -6,8 +6,15 @@ resource "aws_s3_bucket" "process_bucket" {
 
 data "archive_file" "process_lambda_deployment_package" {
   type        = "zip"
-  source_file = "${path.module}/../src/process.py"
   output_path = "${path.module}/../deployment-packages/process_lambda_code.zip"
+  source {
+    content  = file("${path.module}/../src/process.py")
+    filename = "src/process.py"
+  }
+  source {
+    content  = file("${path.module}/../src/aws_clients.py")
+    filename = "src/aws_clients.py"
+  }
 }
 
 resource "aws_s3_object" "process_lambda_code" {
@@ -37,7 +37,7 @@ data "aws_iam_policy_document" "s3_process_document" {
   }
   statement {
     actions   = ["s3:ListBucket"]
-    resources = ["${aws_s3_bucket.process_bucket.arn}", "${aws_s3_bucket.ingest_bucket.arn}/*"]
+    resources = ["${aws_s3_bucket.process_bucket.arn}", "${aws_s3_bucket.ingest_bucket.arn}"]
   }
 }
 
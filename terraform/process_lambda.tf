@@ -10,15 +10,20 @@ resource "aws_lambda_function" "process_lambda" {
   s3_key           = aws_s3_object.process_lambda_code.key
   function_name    = "process_lambda"
   role             = aws_iam_role.process_lambda_role.arn
-  handler          = "process.lambda_handler"
+  handler          = "src.process.lambda_handler"
   source_code_hash = filebase64sha256(data.archive_file.process_lambda_deployment_package.output_path)
   timeout          = 120
   runtime          = "python3.12"
   layers           = [aws_lambda_layer_version.process_layer.arn]
   environment {
     variables = {
-      S3_INGEST_BUCKET  = aws_s3_bucket.ingest_bucket.bucket,
-      S3_PROCESS_BUCKET = aws_s3_bucket.process_bucket.bucket
+      S3_INGEST_BUCKET    = aws_s3_bucket.ingest_bucket.bucket,
+      S3_PROCESS_BUCKET   = aws_s3_bucket.process_bucket.bucket,
+      INGEST_FORMAT       = "ndjson.gz"
+      INGEST_LAYOUT       = "segments"
+      PROCESS_CONCURRENCY = "4"
+      DIM_DATE_MODE       = "spine"
+      DIM_DATE_SPINE      = "2020-2035"
     }
   }
 }
@@ -27,7 +27,26 @@ resource "aws_sfn_state_machine" "sfn_state_machine" {
           "BackoffRate": 2
         }
       ],
-      "Next": "Process ingested data"
+      "Next": "Ingestion finished?"
+    },
+    "Ingestion finished?": {
+      "Type": "Choice",
+      "Choices": [
+        {
+          "And": [
+            {
+              "Variable": "$.status",
+              "IsPresent": true
+            },
+            {
+              "Variable": "$.status",
+              "StringEquals": "continue"
+            }
+          ],
+          "Next": "Ingest data"
+        }
+      ],
+      "Default": "Process ingested data"
     },
     "Process ingested data": {
       "Type": "Task",
@@ -0,0 +1,24 @@
+import pytest
+from src.aws_clients import reset_clients
+from src.credentials import reset_secrets
+from src.connections import reset_connections
+from src.catalog import reset_catalogs
+from src.process import reset_segment_cache, reset_read_cache
+
+
+@pytest.fixture(autouse=True)
+def shared_aws_clients():
+    """Start every test with empty client, secret, connection and data caches."""
+    reset_clients()
+    reset_secrets()
+    reset_connections()
+    reset_segment_cache()
+    reset_read_cache()
+    reset_catalogs()
+    yield
+    reset_clients()
+    reset_secrets()
+    reset_connections()
+    reset_segment_cache()
+    reset_read_cache()
+    reset_catalogs()
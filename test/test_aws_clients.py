@@ -0,0 +1,82 @@
+import os
+import threading
+import boto3
+import pytest
+from moto import mock_aws
+from unittest.mock import patch, MagicMock
+from src.aws_clients import (
+    get_client,
+    get_s3_client,
+    get_secretsmanager_client,
+    set_client,
+    reset_clients,
+    CLIENT_CONFIG,
+)
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_SECURITY_TOKEN"] = "testing"
+    os.environ["AWS_SESSION_TOKEN"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+class TestGetClient:
+    @patch("boto3.client")
+    def test_get_client_is_created_once(self, mock_boto_client):
+        assert get_s3_client() is get_s3_client()
+        mock_boto_client.assert_called_once_with(
+            "s3", region_name="eu-west-2", config=CLIENT_CONFIG
+        )
+
+    @patch("boto3.client")
+    def test_get_client_per_service(self, mock_boto_client):
+        mock_boto_client.side_effect = lambda service_name, **kwargs: MagicMock(
+            service_name=service_name
+        )
+        assert get_s3_client().service_name == "s3"
+        assert get_secretsmanager_client().service_name == "secretsmanager"
+
+    @patch("boto3.client")
+    def test_get_client_concurrent_creation(self, mock_boto_client):
+        barrier = threading.Barrier(8, timeout=5)
+        clients = []
+
+        def get():
+            barrier.wait()
+            clients.append(get_client("s3"))
+
+        threads = [threading.Thread(target=get) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        mock_boto_client.assert_called_once()
+        assert all(client is clients[0] for client in clients)
+
+    def test_client_config(self):
+        assert CLIENT_CONFIG.tcp_keepalive
+        assert CLIENT_CONFIG.max_pool_connections >= 10
+
+    def test_set_client(self):
+        stub = MagicMock()
+        set_client("s3", stub)
+        assert get_s3_client() is stub
+
+    @patch("boto3.client")
+    def test_reset_clients(self, mock_boto_client):
+        set_client("s3", MagicMock())
+        reset_clients()
+        assert get_s3_client() is mock_boto_client.return_value
+
+    def test_shared_client_works_with_moto(self, aws_credentials):
+        with mock_aws():
+            boto3.client("s3", region_name="eu-west-2").create_bucket(
+                Bucket="mock-bucket",
+                CreateBucketConfiguration={"LocationConstraint": "eu-west-2"},
+            )
+            buckets = get_s3_client().list_buckets()["Buckets"]
+        assert [bucket["Name"] for bucket in buckets] == ["mock-bucket"]
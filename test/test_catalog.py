@@ -0,0 +1,72 @@
+from unittest.mock import MagicMock
+from src.catalog import (
+    CatalogCache,
+    read_fingerprint,
+    read_catalog,
+    reset_catalogs,
+)
+
+
+class TestReadCatalog:
+    def test_read_fingerprint(self):
+        conn = MagicMock()
+        conn.run.return_value = [["abc123"]]
+        assert read_fingerprint(conn) == "abc123"
+
+    def test_read_catalog(self):
+        conn = MagicMock()
+        conn.run.return_value = [
+            ["staff", "staff_id", 23, "integer", True, True],
+            ["staff", "first_name", 25, "text", True, False],
+            ["log", "message", 1043, "character varying(100)", False, False],
+        ]
+        assert read_catalog(conn, "abc123") == {
+            "fingerprint": "abc123",
+            "tables": {
+                "staff": {
+                    "columns": [
+                        {
+                            "name": "staff_id",
+                            "type": "integer",
+                            "type_oid": 23,
+                            "nullable": False,
+                        },
+                        {
+                            "name": "first_name",
+                            "type": "text",
+                            "type_oid": 25,
+                            "nullable": False,
+                        },
+                    ],
+                    "primary_key": ["staff_id"],
+                },
+                "log": {
+                    "columns": [
+                        {
+                            "name": "message",
+                            "type": "character varying(100)",
+                            "type_oid": 1043,
+                            "nullable": True,
+                        }
+                    ],
+                    "primary_key": [],
+                },
+            },
+        }
+
+
+class TestCatalogCache:
+    def test_get_checks_fingerprint(self):
+        cache = CatalogCache()
+        assert cache.get("abc123") is None
+        catalog = {"fingerprint": "abc123", "tables": {}}
+        cache.put(catalog)
+        assert cache.get("abc123") is catalog
+        assert cache.get("def456") is None
+        assert cache.current() is catalog
+
+    def test_reset_catalogs(self):
+        cache = CatalogCache()
+        cache.put({"fingerprint": "abc123", "tables": {}})
+        reset_catalogs()
+        assert cache.current() is None
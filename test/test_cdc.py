@@ -0,0 +1,172 @@
+import os
+import uuid
+import pytest
+import pg8000.native
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import MagicMock
+from src.cdc import (
+    parse_lsn,
+    format_lsn,
+    parse_value,
+    parse_change,
+    split_transactions,
+    group_changes,
+    create_slot_if_missing,
+    peek_changes,
+    advance_slot,
+)
+
+
+class TestLsn:
+    def test_parse_lsn(self):
+        assert parse_lsn("0/16B3748") == 0x16B3748
+        assert parse_lsn("1/0") == 1 << 32
+        assert parse_lsn("0/FFFFFFFF") < parse_lsn("1/0")
+
+    def test_format_lsn(self):
+        assert format_lsn(parse_lsn("A/16B3748")) == "A/16B3748"
+
+
+class TestParseChange:
+    @pytest.mark.parametrize(
+        "value, type_name, expected",
+        [
+            ("null", "integer", None),
+            ("42", "integer", 42),
+            ("3.5", "double precision", 3.5),
+            ("1234.50", "numeric", Decimal("1234.50")),
+            ("true", "boolean", True),
+            ("'it''s'", "character varying", "it's"),
+            (
+                "'2022-11-03 14:20:52.186'",
+                "timestamp without time zone",
+                datetime(2022, 11, 3, 14, 20, 52, 186000),
+            ),
+            ("unchanged-toast-datum", "text", None),
+        ],
+    )
+    def test_parse_value(self, value, type_name, expected):
+        assert parse_value(value, type_name) == expected
+
+    def test_parse_change_insert(self):
+        change = parse_change(
+            "table public.staff: INSERT: staff_id[integer]:1 "
+            "first_name[character varying]:'Jeremie' email_address[text]:null"
+        )
+        assert change == (
+            "staff",
+            "I",
+            {"staff_id": 1, "first_name": "Jeremie", "email_address": None},
+        )
+
+    def test_parse_change_update_with_old_key(self):
+        change = parse_change(
+            "table public.staff: UPDATE: old-key: staff_id[integer]:1 "
+            "new-tuple: staff_id[integer]:2 first_name[text]:'a b: c'"
+        )
+        assert change == ("staff", "U", {"staff_id": 2, "first_name": "a b: c"})
+
+    def test_parse_change_delete(self):
+        change = parse_change('table public."Sales": DELETE: "Id"[bigint]:7')
+        assert change == ("Sales", "D", {"Id": 7})
+
+    @pytest.mark.parametrize("data", ["BEGIN", "COMMIT", "message: x"])
+    def test_parse_change_not_a_change(self, data):
+        assert parse_change(data) is None
+
+
+class TestGroupChanges:
+    changes = [
+        ("0/10", "BEGIN"),
+        ("0/11", "table public.t: INSERT: id[integer]:1 name[text]:'a'"),
+        ("0/12", "table public.u: INSERT: id[integer]:9"),
+        ("0/13", "COMMIT"),
+        ("0/14", "BEGIN"),
+        ("0/15", "table public.t: DELETE: id[integer]:1"),
+        ("0/16", "COMMIT"),
+    ]
+
+    def test_split_transactions(self):
+        assert split_transactions(self.changes) == [
+            (
+                "0/13",
+                [
+                    "table public.t: INSERT: id[integer]:1 name[text]:'a'",
+                    "table public.u: INSERT: id[integer]:9",
+                ],
+            ),
+            ("0/16", ["table public.t: DELETE: id[integer]:1"]),
+        ]
+
+    def test_split_transactions_drops_unfinished_transaction(self):
+        assert split_transactions(self.changes[:3]) == []
+
+    def test_group_changes(self):
+        dict_tables = group_changes(split_transactions(self.changes), ["t"])
+        assert dict_tables == {
+            "t": {"id": [1, 1], "name": ["a", None], "cdc_op": ["I", "D"]}
+        }
+
+
+class TestSlot:
+    def test_create_slot_if_missing_existing(self):
+        conn = MagicMock()
+        conn.run.return_value = [[1]]
+        assert create_slot_if_missing(conn, "slot") is False
+        assert conn.run.call_count == 1
+
+    def test_create_slot_if_missing(self):
+        conn = MagicMock()
+        conn.run.return_value = []
+        assert create_slot_if_missing(conn, "slot") is True
+        conn.run.assert_called_with(
+            "SELECT pg_create_logical_replication_slot(:slot_name, :plugin)",
+            slot_name="slot",
+            plugin="test_decoding",
+        )
+
+    def test_advance_slot_moves_past_commit(self):
+        conn = MagicMock()
+        advance_slot(conn, "slot", "0/16B3748")
+        assert conn.run.call_args.kwargs["lsn"] == "0/16B3749"
+
+
+@pytest.mark.skipif(
+    "CDC_TEST_HOST" not in os.environ,
+    reason="needs a local Postgres with wal_level=logical, see CDC_TEST_HOST",
+)
+def test_slot_round_trip_against_postgres():
+    conn = pg8000.native.Connection(
+        host=os.environ["CDC_TEST_HOST"],
+        port=int(os.environ.get("CDC_TEST_PORT", "5432")),
+        user=os.environ.get("CDC_TEST_USER", "postgres"),
+        password=os.environ.get("CDC_TEST_PASSWORD"),
+        database=os.environ.get("CDC_TEST_DATABASE", "postgres"),
+    )
+    slot_name = f"test_{uuid.uuid4().hex[:8]}"
+    table_name = f"cdc_{slot_name}"
+    try:
+        conn.run(f"CREATE TABLE {table_name} (id integer PRIMARY KEY, name text)")
+        assert create_slot_if_missing(conn, slot_name) is True
+        conn.run(f"INSERT INTO {table_name} VALUES (1, 'a'), (2, 'b')")
+        conn.run(f"UPDATE {table_name} SET name = 'c' WHERE id = 2")
+        conn.run(f"DELETE FROM {table_name} WHERE id = 1")
+        transactions = split_transactions(peek_changes(conn, slot_name, 1000))
+        assert group_changes(transactions, [table_name]) == {
+            table_name: {
+                "id": [1, 2, 2, 1],
+                "name": ["a", "b", "c", None],
+                "cdc_op": ["I", "I", "U", "D"],
+            }
+        }
+        advance_slot(conn, slot_name, transactions[-1][0])
+        assert peek_changes(conn, slot_name, 1000) == []
+    finally:
+        conn.run(
+            "SELECT pg_drop_replication_slot(slot_name) FROM pg_replication_slots "
+            "WHERE slot_name = :slot_name",
+            slot_name=slot_name,
+        )
+        conn.run(f"DROP TABLE IF EXISTS {table_name}")
+        conn.close()
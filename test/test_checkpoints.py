@@ -0,0 +1,79 @@
+import threading
+from datetime import datetime
+from unittest.mock import MagicMock
+from src.checkpoints import Deadline, RunCheckpoint, resuming, current_checkpoint
+
+
+class TestDeadline:
+    def test_deadline_without_context_never_expires(self):
+        assert not Deadline.from_context({}, 10).expired()
+
+    def test_deadline_from_context(self):
+        context = MagicMock()
+        context.get_remaining_time_in_millis.return_value = 60000
+        assert not Deadline.from_context(context, 10).expired()
+        context.get_remaining_time_in_millis.return_value = 5000
+        assert Deadline.from_context(context, 10).expired()
+
+
+class TestRunCheckpoint:
+    def test_begin_stores_plan(self):
+        stored = []
+        checkpoint = RunCheckpoint(store=lambda state: stored.append(dict(state)))
+        assert checkpoint.tables is None
+        assert checkpoint.started_at is None
+        started_at = datetime(2024, 1, 1, 12, 0)
+        checkpoint.begin("r1", started_at, ["a", "b"], ["a", "b"], {"a": [1]})
+        assert checkpoint.started_at == started_at
+        assert stored[-1]["tables"] == ["a", "b"]
+        assert stored[-1]["probes"] == {"a": [1]}
+
+    def test_finish_table(self):
+        stored = []
+        checkpoint = RunCheckpoint(store=lambda state: stored.append(dict(state)))
+        checkpoint.begin("r1", datetime(2024, 1, 1), ["a", "b", "c"])
+        checkpoint.put_chunk("b", {"next_range": 1})
+        assert checkpoint.progressed
+        checkpoint.finish_table("b", True)
+        checkpoint.finish_table("c", False)
+        assert checkpoint.pending() == ["a"]
+        assert checkpoint.results() == [None, True, False]
+        assert checkpoint.get_chunk("b") is None
+        assert len(stored) == 4
+
+    def test_get_chunk_returns_copy(self):
+        checkpoint = RunCheckpoint()
+        checkpoint.put_chunk("a", {"parts": [1]})
+        checkpoint.get_chunk("a")["parts"].append(2)
+        assert checkpoint.get_chunk("a") == {"parts": [1]}
+
+    def test_add_metrics(self):
+        checkpoint = RunCheckpoint()
+        counters = {
+            "rows": 2,
+            "bytes": 10,
+            "query_seconds": 0.5,
+            "s3_seconds": 0.25,
+            "watermark": {"key": 1},
+        }
+        checkpoint.add_metrics("a", counters)
+        checkpoint.add_metrics("a", {**counters, "watermark": {"key": 2}})
+        assert checkpoint.state["metrics"]["a"] == {
+            "rows": 4,
+            "bytes": 20,
+            "query_seconds": 1.0,
+            "s3_seconds": 0.5,
+            "watermark": {"key": 1},
+        }
+
+
+def test_resuming_is_per_thread():
+    checkpoint = RunCheckpoint()
+    seen = []
+    with resuming(checkpoint):
+        assert current_checkpoint() is checkpoint
+        thread = threading.Thread(target=lambda: seen.append(current_checkpoint()))
+        thread.start()
+        thread.join()
+    assert seen == [None]
+    assert current_checkpoint() is None
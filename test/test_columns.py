@@ -0,0 +1,59 @@
+import pytest
+from datetime import date, datetime, timezone
+from decimal import Decimal
+from src.columns import ColumnBuffer, append_rows
+
+
+class TestColumnBuffer:
+    @pytest.mark.parametrize(
+        "values",
+        [
+            [1, None, -(2**63)],
+            [1.5, None, float("inf")],
+            [True, None, False],
+            [None, datetime(2022, 11, 3, 14, 20, 52, 186000)],
+            [date(2024, 1, 1), None],
+            [None, None, "a", "ü", ""],
+            [Decimal("1234.50"), None],
+            [datetime(2024, 1, 1, tzinfo=timezone.utc), None],
+            [None, None],
+            [],
+        ],
+    )
+    def test_round_trip(self, values):
+        buffer = ColumnBuffer(values)
+        assert len(buffer) == len(values)
+        assert buffer == values
+        assert [buffer[i] for i in range(len(values))] == values
+        assert [type(v) for v in buffer] == [type(v) for v in values]
+
+    def test_mixed_types_fall_back_to_list(self):
+        buffer = ColumnBuffer([1, 2])
+        buffer.append("3")
+        buffer.append(2**70)
+        assert buffer == [1, 2, "3", 2**70]
+
+    def test_integer_overflow_falls_back_to_list(self):
+        assert ColumnBuffer([1, 2**70]) == [1, 2**70]
+
+    def test_setitem(self):
+        buffer = ColumnBuffer(["a", "b", "c"])
+        buffer[1] = "updated"
+        buffer[-1] = None
+        assert buffer == ["a", "updated", None]
+        buffer[2] = "c"
+        assert buffer == ["a", "updated", "c"]
+        numbers = ColumnBuffer([1, None])
+        numbers[1] = 2
+        numbers[0] = None
+        assert numbers == [None, 2]
+
+    def test_index_error(self):
+        with pytest.raises(IndexError):
+            ColumnBuffer([1])[1]
+
+    def test_append_rows(self):
+        dict_table = {"id": ColumnBuffer(), "name": ColumnBuffer()}
+        append_rows(dict_table, [[1, "a"], [2, "b"]])
+        append_rows(dict_table, [])
+        assert dict_table == {"id": [1, 2], "name": ["a", "b"]}
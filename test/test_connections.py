@@ -0,0 +1,128 @@
+import threading
+import pytest
+from unittest.mock import MagicMock
+from src.connections import (
+    ConnectionManager,
+    ConnectionPool,
+    ping_native,
+    ping_dbapi,
+    reset_connections,
+)
+
+
+class TestPing:
+    def test_ping_native(self):
+        conn = MagicMock()
+        ping_native(conn)
+        conn.run.assert_called_once_with("SELECT 1")
+
+    def test_ping_dbapi(self):
+        conn = MagicMock()
+        ping_dbapi(conn)
+        conn.cursor.return_value.execute.assert_called_once_with("SELECT 1")
+
+
+class TestConnectionManager:
+    def test_get_reuses_healthy_connection(self):
+        connect = MagicMock(side_effect=lambda: MagicMock())
+        ping = MagicMock()
+        manager = ConnectionManager(connect, ping)
+        conn = manager.get()
+        assert manager.get() is conn
+        connect.assert_called_once()
+        ping.assert_called_once_with(conn)
+
+    def test_get_reconnects_on_failed_ping(self):
+        connect = MagicMock(side_effect=lambda: MagicMock())
+        ping = MagicMock(side_effect=Exception("Mock broken connection"))
+        manager = ConnectionManager(connect, ping)
+        first = manager.get()
+        second = manager.get()
+        assert second is not first
+        first.close.assert_called_once()
+        assert connect.call_count == 2
+
+    def test_get_propagates_connect_error(self):
+        manager = ConnectionManager(
+            MagicMock(side_effect=Exception("Mock connect error")), MagicMock()
+        )
+        with pytest.raises(Exception) as e:
+            manager.get()
+        assert str(e.value) == "Mock connect error"
+
+    def test_close(self):
+        manager = ConnectionManager(lambda: MagicMock(), MagicMock())
+        conn = manager.get()
+        manager.close()
+        conn.close.assert_called_once()
+        assert manager.get() is not conn
+
+    def test_reset_connections(self):
+        manager = ConnectionManager(lambda: MagicMock(), MagicMock())
+        conn = manager.get()
+        reset_connections()
+        conn.close.assert_called_once()
+
+
+class TestConnectionPool:
+    def test_connection_is_reused(self):
+        connect = MagicMock(side_effect=lambda: MagicMock())
+        pool = ConnectionPool(connect, MagicMock(), max_size=2)
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+        assert first is second
+        connect.assert_called_once()
+
+    def test_connection_is_discarded_on_error(self):
+        connect = MagicMock(side_effect=lambda: MagicMock())
+        pool = ConnectionPool(connect, MagicMock(), max_size=2)
+        with pytest.raises(ValueError):
+            with pool.connection() as first:
+                raise ValueError("Mock error")
+        first.close.assert_called_once()
+        with pool.connection() as second:
+            assert second is not first
+
+    def test_broken_idle_connection_is_replaced(self):
+        connect = MagicMock(side_effect=lambda: MagicMock())
+        pool = ConnectionPool(
+            connect, MagicMock(side_effect=Exception("Mock broken")), max_size=1
+        )
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            assert second is not first
+        first.close.assert_called_once()
+
+    def test_max_size_bounds_open_connections(self):
+        connect = MagicMock(side_effect=lambda: MagicMock())
+        pool = ConnectionPool(connect, MagicMock(), max_size=2)
+        in_use = []
+        peak = []
+        lock = threading.Lock()
+
+        def work():
+            with pool.connection() as conn:
+                with lock:
+                    in_use.append(conn)
+                    peak.append(len(in_use))
+                threading.Event().wait(0.01)
+                with lock:
+                    in_use.remove(conn)
+
+        threads = [threading.Thread(target=work) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert max(peak) <= 2
+        assert connect.call_count <= 2
+
+    def test_close(self):
+        pool = ConnectionPool(lambda: MagicMock(), MagicMock(), max_size=1)
+        with pool.connection() as conn:
+            pass
+        pool.close()
+        conn.close.assert_called_once()
@@ -0,0 +1,115 @@
+import os
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+from unittest.mock import MagicMock
+from src.credentials import (
+    SecretsProvider,
+    fetch_secrets,
+    is_authentication_error,
+    reset_secrets,
+)
+
+
+@pytest.fixture(scope="function")
+def aws_credentials():
+    """Mocked AWS Credentials for moto."""
+    os.environ["AWS_ACCESS_KEY_ID"] = "testing"
+    os.environ["AWS_SECRET_ACCESS_KEY"] = "testing"
+    os.environ["AWS_SECURITY_TOKEN"] = "testing"
+    os.environ["AWS_SESSION_TOKEN"] = "testing"
+    os.environ["AWS_DEFAULT_REGION"] = "eu-west-2"
+
+
+@pytest.fixture(scope="function")
+def sm(aws_credentials):
+    with mock_aws():
+        yield boto3.client("secretsmanager", region_name="eu-west-2")
+
+
+class TestFetchSecrets:
+    def test_fetch_secrets(self, sm):
+        sm.create_secret(Name="db_host", SecretString="test_host")
+        sm.create_secret(Name="db_user", SecretString="test_user")
+        assert fetch_secrets(sm, {"host": "db_host", "user": "db_user"}) == {
+            "host": "test_host",
+            "user": "test_user",
+        }
+
+    def test_fetch_secrets_is_one_call(self):
+        sm = MagicMock()
+        sm.batch_get_secret_value.return_value = {
+            "SecretValues": [
+                {"Name": "db_host", "ARN": "arn:host", "SecretString": "h"},
+                {"Name": "db_user", "ARN": "arn:user", "SecretString": "u"},
+            ]
+        }
+        assert fetch_secrets(sm, {"host": "db_host", "user": "db_user"}) == {
+            "host": "h",
+            "user": "u",
+        }
+        sm.batch_get_secret_value.assert_called_once_with(
+            SecretIdList=["db_host", "db_user"]
+        )
+        sm.get_secret_value.assert_not_called()
+
+    def test_fetch_secrets_missing_secret(self, sm):
+        sm.create_secret(Name="db_host", SecretString="test_host")
+        with pytest.raises(ClientError) as e:
+            fetch_secrets(sm, {"host": "db_host", "user": "db_user"})
+        assert e.value.response["Error"]["Code"] == "ResourceNotFoundException"
+
+
+class TestSecretsProvider:
+    def test_get_is_cached_within_ttl(self):
+        now = [0]
+        fetch = MagicMock(return_value={"password": "p1"})
+        provider = SecretsProvider(fetch, ttl=10, clock=lambda: now[0])
+        assert provider.get() == {"password": "p1"}
+        now[0] = 9
+        assert provider.get() == {"password": "p1"}
+        fetch.assert_called_once()
+
+    def test_get_refreshes_after_ttl(self):
+        now = [0]
+        fetch = MagicMock(side_effect=[{"password": "p1"}, {"password": "p2"}])
+        provider = SecretsProvider(fetch, ttl=10, clock=lambda: now[0])
+        provider.get()
+        now[0] = 10
+        assert provider.get() == {"password": "p2"}
+
+    def test_invalidate(self):
+        fetch = MagicMock(side_effect=[{"password": "p1"}, {"password": "p2"}])
+        provider = SecretsProvider(fetch)
+        provider.get()
+        provider.invalidate()
+        assert provider.get() == {"password": "p2"}
+
+    def test_get_returns_a_copy(self):
+        provider = SecretsProvider(lambda: {"password": "p1"})
+        provider.get()["password"] = "changed"
+        assert provider.get() == {"password": "p1"}
+
+    def test_reset_secrets(self):
+        fetch = MagicMock(return_value={"password": "p1"})
+        provider = SecretsProvider(fetch)
+        provider.get()
+        reset_secrets()
+        provider.get()
+        assert fetch.call_count == 2
+
+
+class TestIsAuthenticationError:
+    @pytest.mark.parametrize(
+        "args, expected",
+        [
+            (({"C": "28P01", "M": "password authentication failed"},), True),
+            (({"C": "28000"},), True),
+            (({"C": "42P01"},), False),
+            (("Connection failed",), False),
+            ((), False),
+        ],
+    )
+    def test_is_authentication_error(self, args, expected):
+        assert is_authentication_error(Exception(*args)) == expected
@@ -1,11 +1,16 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import json
+import re
+import gzip
+import threading
+from decimal import Decimal
 from moto import mock_aws
 import os
 import boto3
 import pytest
 import unittest
 from unittest.mock import patch, MagicMock
+from src.checkpoints import RunCheckpoint, ExtractionPaused, resuming
 from src.extract import (
     format_date,
     get_secrets,
@@ -14,12 +19,80 @@ from src.extract import (
     get_dict_table,
     get_table_names,
     is_bucket_empty,
-    store_date_in_bucket,
     get_date,
     store_table_in_bucket,
-    copy_table,
     delete_table,
     update_dict_table,
+    update_dict_table_by_watermark,
+    get_extract_mode,
+    get_primary_key,
+    get_watermark,
+    store_watermark,
+    get_watermark_from_dict_table,
+    merge_rows_into_dict_table,
+    get_ingest_format,
+    get_table_key,
+    get_dict_table_from_bucket,
+    stream_table_to_bucket,
+    S3MultipartWriter,
+    serialise_dict_table,
+    deserialise_dict_table,
+    get_schema_from_columns,
+    get_schema_from_dict_table,
+    format_csv_value,
+    parse_csv_value,
+    encode_schema_line,
+    copy_table_to_bucket,
+    get_extract_range_rows,
+    plan_key_ranges,
+    get_key_range_condition,
+    fetch_key_range,
+    extract_table_in_ranges,
+    get_key_ranges,
+    get_extract_concurrency,
+    get_extract_range_concurrency,
+    extract_tables,
+    update_table_in_bucket,
+    store_full_table_in_bucket,
+    get_change_probe,
+    get_table_probes,
+    get_changed_tables,
+    get_stored_probes,
+    store_probes,
+    get_manifest,
+    get_legacy_manifest,
+    get_next_manifest,
+    store_manifest,
+    update_table_from_manifest,
+    get_ingest_layout,
+    format_run_id,
+    get_segment_key,
+    get_segment_manifest,
+    store_segment_manifest,
+    get_delta_rows,
+    append_table_segment,
+    get_extract_consistency,
+    exported_snapshot,
+    attached_snapshot,
+    snapshot_connections,
+    get_ingest_engine,
+    get_cdc_checkpoint,
+    store_cdc_checkpoint,
+    ingest_changes,
+    get_schema_catalog,
+    get_catalog,
+    get_stored_catalog,
+    catalog_cache,
+    get_run_metrics,
+    get_run_manifest,
+    get_refresh_policies,
+    get_refresh_limit,
+    get_due_tables,
+    get_refresh_times,
+    get_extract_checkpoint,
+    get_extract_time_reserve,
+    get_run_checkpoint,
+    db_connection,
     lambda_handler,
     IngestError,
     DatabaseError,
@@ -116,33 +189,65 @@ class TestConnection:
             get_connection()
         assert str(e.value) == "Failed to connect to database. Connection failed"
 
+    @patch("pg8000.native.Connection")
+    @patch("src.extract.get_secrets")
+    def test_get_connection_caches_secrets(self, mock_get_secrets, mock_pg_conn):
+        mock_get_secrets.return_value = {"database": "test_db"}
+        get_connection()
+        get_connection()
+        mock_get_secrets.assert_called_once()
+        assert mock_pg_conn.call_count == 2
+
+    @patch("pg8000.native.Connection")
+    @patch("src.extract.get_secrets")
+    def test_get_connection_refreshes_secrets_on_auth_failure(
+        self, mock_get_secrets, mock_pg_conn
+    ):
+        mock_get_secrets.side_effect = [{"password": "old"}, {"password": "new"}]
+        mock_pg_conn.side_effect = [
+            DatabaseError({"C": "28P01", "M": "password authentication failed"}),
+            MagicMock(),
+        ]
+        get_connection()
+        assert mock_pg_conn.call_args_list[-1].kwargs == {"password": "new"}
+
     @patch.dict(os.environ, {"S3_INGEST_BUCKET": "mock-bucket"})
     @patch("src.extract.get_connection")
     @patch("src.extract.get_table_names")
-    @patch("src.extract.is_bucket_empty")
-    @patch("src.extract.get_date")
+    @patch("src.extract.get_manifest")
     @patch("boto3.client")
     def test_lambda_handler_success(
         self,
         mock_boto_client,
-        mock_get_date,
-        mock_is_bucket_empty,
+        mock_get_manifest,
         mock_get_table_names,
         mock_get_connection,
     ):
         mock_s3_client = MagicMock()
         mock_boto_client.return_value = mock_s3_client
         mock_get_connection.return_value = MagicMock()
-        mock_is_bucket_empty.return_value = False
+        mock_get_manifest.return_value = {
+            "version": 1,
+            "date": "2024-01-01",
+            "tables": {
+                table_name: {
+                    "key": f"latest/2024-01-01/{table_name}.json",
+                    "date": "2024-01-01",
+                    "format": "json",
+                }
+                for table_name in ["table1", "table2"]
+            },
+        }
         mock_get_table_names.return_value = ["table1", "table2"]
-        mock_get_date.return_value = "2024-01-01"
-        mock_s3_client.copy_object.return_value = {}
         mock_s3_client.get_object.return_value = {
             "Body": MagicMock(read=lambda: b'{"created_at": "2024-01-01"}')
         }
 
         result = lambda_handler({}, {})
         assert result == {"msg": "Ingestion successful", 'tables': []}
+        mock_s3_client.put_object.assert_not_called()
+        mock_s3_client.copy_object.assert_not_called()
+        mock_s3_client.delete_object.assert_not_called()
 
     @patch("src.extract.get_connection")
     def test_lambda_handler_missing_env_var(self, mock_get_connection):
@@ -250,37 +355,6 @@ class TestGetTableNames:
         assert str(e.value) == "Failed to get table names. Mock DB error"
 
 
-class TestCopyTable:
-
-    def test_copy_table(self, s3, s3_bucket):
-        s3.put_object(
-            Body=b"Mock bytes",
-            Bucket=S3_MOCK_BUCKET_NAME,
-            Key="latest/mock-date-1/mock-table.json",
-        )
-
-        copy_table(
-            S3_MOCK_BUCKET_NAME,
-            "latest/mock-date-1/mock-table.json",
-            "latest/mock-date-2/mock-table.json",
-        )
-
-        object = s3.get_object(
-            Bucket=S3_MOCK_BUCKET_NAME,
-            Key="latest/mock-date-2/mock-table.json",
-        )
-        assert object["Body"].read().decode() == "Mock bytes"
-
-    def test_copy_table_error(self, s3, s3_bucket):
-        with pytest.raises(IngestError) as e:
-            copy_table(S3_MOCK_BUCKET_WRONG_NAME, "s", "d")
-        assert (
-            str(e.value) == "Failed to copy table. An error occurred "
-            "(NoSuchBucket) when calling the CopyObject operation: The specified "
-            "bucket does not exist"
-        )
-
-
 class TestDeleteTable:
 
     def test_delete_table(self, s3, s3_bucket):
@@ -316,6 +390,22 @@ class TestGetDictTable:
         result = get_dict_table(mock_conn, "mock-db-table-1")
         assert result == {"c1": ["A", "B"], "c2": [1, 2]}
 
+    @patch("src.extract.STREAM_BATCH_SIZE", 2)
+    def test_get_dict_table_fetches_in_batches(self):
+        conn = MagicMock()
+        conn.columns = [{"name": "id"}]
+        batches = iter([[[1], [2]], [[3], [4]], [[5]]])
+
+        def run(sql, **params):
+            return next(batches) if sql.startswith("FETCH") else None
+
+        conn.run.side_effect = run
+        assert get_dict_table(conn, "t") == {"id": [1, 2, 3, 4, 5]}
+        statements = [c.args[0] for c in conn.run.call_args_list]
+        assert statements[0] == "START TRANSACTION READ ONLY"
+        assert statements.count("FETCH FORWARD 2 FROM dict_cursor") == 3
+        assert statements[-1] == "COMMIT"
+
     @patch("pg8000.native.Connection")
     def test_get_dict_table_error(self, mock_conn):
         mock_conn.run.side_effect = DatabaseError("Mock DB error")
@@ -353,24 +443,12 @@ class TestStoreTableInBucket:
         )
 
 
-class TestStoreAndGetDate:
+class TestGetDate:
 
-    def test_store_date_in_bucket(self, s3, s3_bucket):
-        store_date_in_bucket(S3_MOCK_BUCKET_NAME, "2024-01-01")
-        object = s3.get_object(Bucket=S3_MOCK_BUCKET_NAME, Key="latest_date")
-        assert object["Body"].read().decode() == "2024-01-01"
-
-    def test_store_date_in_bucket_error(self, s3, s3_bucket):
-        with pytest.raises(IngestError) as e:
-            store_date_in_bucket(S3_MOCK_BUCKET_WRONG_NAME, "2024-01-01")
-        assert (
-            str(e.value) == "Failed to store date in bucket. An error occurred "
-            "(NoSuchBucket) when calling the PutObject operation: The specified "
-            "bucket does not exist"
+    def test_get_date(self, s3, s3_bucket):
+        s3.put_object(
+            Body=b"2024-01-01", Bucket=S3_MOCK_BUCKET_NAME, Key="latest_date"
         )
-
-    def test_get_date(self, s3_bucket):
-        store_date_in_bucket(S3_MOCK_BUCKET_NAME, "2024-01-01")
         assert get_date(S3_MOCK_BUCKET_NAME) == "2024-01-01"
 
     def test_get_date_error(self, s3_bucket):
@@ -447,37 +525,1960 @@ class TestUpdateTable:
         }
 
 
+class TestWatermark:
+    def test_get_extract_mode_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_extract_mode() == "rowcount"
+
+    @patch.dict(os.environ, {"EXTRACT_MODE": "watermark"})
+    def test_get_extract_mode_watermark(self):
+        assert get_extract_mode() == "watermark"
+
+    @patch.dict(os.environ, {"EXTRACT_MODE": "mock-mode"})
+    def test_get_extract_mode_error(self):
+        with pytest.raises(IngestError) as e:
+            get_extract_mode()
+        assert str(e.value) == "Unknown extract mode. mock-mode"
+
+    def test_get_primary_key(self):
+        conn = MagicMock()
+        conn.run.return_value = [["sales_order_id"]]
+        assert get_primary_key(conn, "sales_order") == "sales_order_id"
+        assert conn.run.call_args.kwargs == {"table_name": "sales_order"}
+
+    def test_get_primary_key_error(self):
+        conn = MagicMock()
+        conn.run.return_value = []
+        with pytest.raises(IngestError) as e:
+            get_primary_key(conn, "mock_table")
+        assert str(e.value) == "Failed to get primary key. mock_table"
+
+    def test_get_watermark_from_dict_table(self):
+        dict_table = {
+            "id": [1, 2, 3],
+            "last_updated": [
+                "2024-01-02 00:00:00",
+                "2024-01-03 00:00:00",
+                "2024-01-03 00:00:00",
+            ],
+        }
+        assert get_watermark_from_dict_table(dict_table, "id") == {
+            "last_updated": "2024-01-03 00:00:00",
+            "key": 3,
+        }
+        assert get_watermark_from_dict_table({"last_updated": []}, "id") is None
+
+    def test_store_and_get_watermark(self, s3, s3_bucket):
+        assert get_watermark(S3_MOCK_BUCKET_NAME, "mock_table") is None
+        watermark = {"last_updated": "2024-01-03 00:00:00", "key": 3}
+        store_watermark(S3_MOCK_BUCKET_NAME, "mock_table", watermark)
+        assert get_watermark(S3_MOCK_BUCKET_NAME, "mock_table") == watermark
+
+    def test_get_watermark_error(self, s3, s3_bucket):
+        with pytest.raises(IngestError) as e:
+            get_watermark(S3_MOCK_BUCKET_WRONG_NAME, "mock_table")
+        assert str(e.value).startswith("Failed to get watermark from bucket.")
+
+    def test_merge_rows_into_dict_table(self):
+        dict_table = {"id": [1, 2], "name": ["A", "B"]}
+        result = merge_rows_into_dict_table(
+            dict_table, ["id", "name"], [[2, "B2"], [3, "C"]], "id"
+        )
+        assert result == {"id": [1, 2, 3], "name": ["A", "B2", "C"]}
+
+    def test_update_dict_table_by_watermark(self, s3, s3_bucket):
+        store_table_in_bucket(
+            S3_MOCK_BUCKET_NAME,
+            {
+                "id": [1, 2],
+                "name": ["A", "B"],
+                "last_updated": ["2024-01-01 00:00:00", "2024-01-02 00:00:00"],
+            },
+            "mock_table",
+            "2024-01-01",
+        )
+        conn = MagicMock()
+
+        def run(query, **kwargs):
+            if "pg_index" in query:
+                return [["id"]]
+            assert kwargs == {"last_updated": "2024-01-02 00:00:00", "key": 2}
+            return [
+                [1, "A2", datetime(2024, 1, 3)],
+                [3, "C", datetime(2024, 1, 4)],
+            ]
+
+        conn.run.side_effect = run
+        conn.columns = [{"name": "id"}, {"name": "name"}, {"name": "last_updated"}]
+        needs_update, dict_table, watermark = update_dict_table_by_watermark(
+            S3_MOCK_BUCKET_NAME, "mock_table", "2024-01-01", conn
+        )
+        assert needs_update
+        assert dict_table == {
+            "id": [1, 2, 3],
+            "name": ["A2", "B", "C"],
+            "last_updated": [
+                datetime(2024, 1, 3),
+                "2024-01-02 00:00:00",
+                datetime(2024, 1, 4),
+            ],
+        }
+        assert watermark == {"last_updated": "2024-01-04 00:00:00", "key": 3}
+
+    def test_update_dict_table_by_watermark_no_update(self, s3, s3_bucket):
+        mock_dict_table = {"id": [1], "last_updated": ["2024-01-01 00:00:00"]}
+        store_table_in_bucket(
+            S3_MOCK_BUCKET_NAME, mock_dict_table, "mock_table", "2024-01-01"
+        )
+        watermark = {"last_updated": "2024-01-01 00:00:00", "key": 1}
+        store_watermark(S3_MOCK_BUCKET_NAME, "mock_table", watermark)
+        conn = MagicMock()
+        conn.run.side_effect = lambda query, **kwargs: (
+            [["id"]] if "pg_index" in query else []
+        )
+        assert update_dict_table_by_watermark(
+            S3_MOCK_BUCKET_NAME, "mock_table", "2024-01-01", conn
+        ) == (False, mock_dict_table, watermark)
+
+    def test_update_dict_table_by_watermark_error(self, s3, s3_bucket):
+        with pytest.raises(IngestError) as e:
+            update_dict_table_by_watermark(
+                S3_MOCK_BUCKET_NAME, "mock_table", "2024-01-01", MagicMock()
+            )
+        assert str(e.value).startswith("Failed to update table.")
+
+
+class TestStreaming:
+    def test_get_ingest_format_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_ingest_format() == "json"
+
+    @patch.dict(os.environ, {"INGEST_FORMAT": "mock-format"})
+    def test_get_ingest_format_error(self):
+        with pytest.raises(IngestError) as e:
+            get_ingest_format()
+        assert str(e.value) == "Unknown ingest format. mock-format"
+
+    def test_get_table_key(self):
+        assert get_table_key("2024-01-01", "t") == "latest/2024-01-01/t.json"
+        assert (
+            get_table_key("2024-01-01", "t", "ndjson") == "latest/2024-01-01/t.ndjson"
+        )
+
+    def test_store_and_get_ndjson_table(self, s3, s3_bucket):
+        dict_table = {"c1": [1, 2], "c2": ["A", "B"]}
+        store_table_in_bucket(
+            S3_MOCK_BUCKET_NAME, dict_table, "mock-table", "2024-01-01", "ndjson"
+        )
+        body = s3.get_object(
+            Bucket=S3_MOCK_BUCKET_NAME, Key="latest/2024-01-01/mock-table.ndjson"
+        )["Body"].read()
+        assert body == b'{"c1": 1, "c2": "A"}\n{"c1": 2, "c2": "B"}\n'
+        assert (
+            get_dict_table_from_bucket(
+                S3_MOCK_BUCKET_NAME, "latest/2024-01-01/mock-table.ndjson", "ndjson"
+            )
+            == dict_table
+        )
+
+    def test_multipart_writer_uploads_parts(self, s3, s3_bucket):
+        part_size = 5 * 1024 * 1024
+        with S3MultipartWriter(S3_MOCK_BUCKET_NAME, "mock-key", part_size) as writer:
+            writer.write(b"a" * part_size)
+            assert len(writer.parts) == 1
+            writer.write(b"b" * 10)
+        assert len(writer.parts) == 2
+        body = s3.get_object(Bucket=S3_MOCK_BUCKET_NAME, Key="mock-key")["Body"]
+        assert body.read() == b"a" * part_size + b"b" * 10
+
+    def test_multipart_writer_aborts_on_error(self, s3, s3_bucket):
+        with pytest.raises(ValueError):
+            with S3MultipartWriter(S3_MOCK_BUCKET_NAME, "mock-key") as writer:
+                writer.write(b"a")
+                raise ValueError("Mock error")
+        uploads = s3.list_multipart_uploads(Bucket=S3_MOCK_BUCKET_NAME)
+        assert "Uploads" not in uploads
+        objects = s3.list_objects_v2(Bucket=S3_MOCK_BUCKET_NAME)
+        assert "Contents" not in objects
+
+    def test_stream_table_to_bucket(self, s3, s3_bucket):
+        conn = MagicMock()
+        batches = iter(
+            [
+                [[1, datetime(2024, 1, 2)], [2, datetime(2024, 1, 1)]],
+                [[3, datetime(2024, 1, 2)]],
+                [],
+            ]
+        )
+        conn.run.side_effect = lambda query: (
+            next(batches) if query.startswith("FETCH") else None
+        )
+        conn.columns = [{"name": "id"}, {"name": "last_updated"}]
+        row_count, watermark = stream_table_to_bucket(
+            conn, S3_MOCK_BUCKET_NAME, "mock-table", "2024-01-01", "id", 2
+        )
+        assert row_count == 3
+        assert watermark == {"last_updated": "2024-01-02 00:00:00", "key": 3}
+        assert "FETCH FORWARD 2 FROM extract_cursor" in [
+            c.args[0] for c in conn.run.call_args_list
+        ]
+        assert conn.run.call_args_list[-1].args == ("COMMIT",)
+        assert get_dict_table_from_bucket(
+            S3_MOCK_BUCKET_NAME, "latest/2024-01-01/mock-table.ndjson", "ndjson"
+        ) == {
+            "id": [1, 2, 3],
+            "last_updated": [
+                "2024-01-02 00:00:00",
+                "2024-01-01 00:00:00",
+                "2024-01-02 00:00:00",
+            ],
+        }
+
+    def test_stream_table_to_bucket_error(self, s3, s3_bucket):
+        conn = MagicMock()
+
+        def run(query):
+            if query.startswith("FETCH"):
+                raise DatabaseError("Mock DB error")
+
+        conn.run.side_effect = run
+        with pytest.raises(IngestError) as e:
+            stream_table_to_bucket(conn, S3_MOCK_BUCKET_NAME, "t", "2024-01-01")
+        assert str(e.value) == "Failed to stream table to bucket. Mock DB error"
+        assert conn.run.call_args_list[-1].args == ("ROLLBACK",)
+
+    def test_stream_table_to_bucket_missing_watermark_column(self, s3, s3_bucket):
+        conn = MagicMock()
+        conn.run.side_effect = lambda query: (
+            [[1]] if query.startswith("FETCH") else None
+        )
+        conn.columns = [{"name": "id"}]
+        with pytest.raises(IngestError) as e:
+            stream_table_to_bucket(conn, S3_MOCK_BUCKET_NAME, "t", "2024-01-01", "id")
+        assert str(e.value).startswith("Failed to stream table to bucket.")
+        assert conn.run.call_args_list[-1].args == ("ROLLBACK",)
+        objects = s3.list_objects_v2(Bucket=S3_MOCK_BUCKET_NAME)
+        assert "Contents" not in objects
+
+
+class TestIngestFormats:
+    dict_table = {
+        "id": [1, 2],
+        "name": ["A", None],
+        "amount": [Decimal("1.50"), Decimal("2.25")],
+        "last_updated": [datetime(2024, 1, 1, 9, 30), datetime(2024, 1, 2)],
+    }
+    stored_table = {
+        "id": [1, 2],
+        "name": ["A", None],
+        "amount": ["1.50", "2.25"],
+        "last_updated": ["2024-01-01 09:30:00", "2024-01-02 00:00:00"],
+    }
+
+    def test_get_schema_from_columns(self):
+        columns = [
+            {"name": "id", "type_oid": 23},
+            {"name": "last_updated", "type_oid": 1114},
+            {"name": "name", "type_oid": 1043},
+        ]
+        assert get_schema_from_columns(columns) == [
+            {"name": "id", "type": "integer"},
+            {"name": "last_updated", "type": "timestamp"},
+            {"name": "name", "type": "text"},
+        ]
+
+    def test_get_schema_from_dict_table(self):
+        assert get_schema_from_dict_table(self.dict_table) == [
+            {"name": "id", "type": "integer"},
+            {"name": "name", "type": "text"},
+            {"name": "amount", "type": "numeric"},
+            {"name": "last_updated", "type": "timestamp"},
+        ]
+
+    @pytest.mark.parametrize("ingest_format", ["json", "ndjson", "ndjson.gz"])
+    def test_serialise_round_trip(self, ingest_format):
+        body = serialise_dict_table(self.dict_table, ingest_format)
+        assert deserialise_dict_table(body, ingest_format) == self.stored_table
+
+    def test_serialise_round_trip_csv_gz(self):
+        body = serialise_dict_table(self.dict_table, "csv.gz")
+        assert deserialise_dict_table(body, "csv.gz") == {
+            **self.stored_table,
+            "last_updated": self.dict_table["last_updated"],
+        }
+
+    def test_serialise_ndjson_gz_has_schema_line(self):
+        lines = gzip.decompress(
+            serialise_dict_table(self.dict_table, "ndjson.gz")
+        ).splitlines()
+        assert json.loads(lines[0])["schema"][0] == {"name": "id", "type": "integer"}
+        assert json.loads(lines[1]) == [1, "A", "1.50", "2024-01-01 09:30:00"]
+
+    def test_serialise_ndjson_gz_empty_table(self):
+        body = serialise_dict_table({"id": [], "name": []}, "ndjson.gz")
+        assert deserialise_dict_table(body, "ndjson.gz") == {"id": [], "name": []}
+
+    def test_serialise_json_is_compact(self):
+        assert serialise_dict_table({"c1": [1, 2]}) == b'{"c1":[1,2]}'
+
+    def test_serialise_parquet_round_trip(self):
+        body = serialise_dict_table(self.dict_table, "parquet")
+        result = deserialise_dict_table(body, "parquet")
+        assert result["id"] == [1, 2]
+        assert result["amount"] == ["1.50", "2.25"]
+        assert [str(v) for v in result["last_updated"]] == [
+            "2024-01-01 09:30:00",
+            "2024-01-02 00:00:00",
+        ]
+
+    def test_serialise_csv_gz_matches_copy_output(self):
+        lines = gzip.decompress(
+            serialise_dict_table(self.dict_table, "csv.gz")
+        ).splitlines()
+        assert json.loads(lines[0])["schema"][0] == {"name": "id", "type": "integer"}
+        assert lines[1:] == [
+            b"1,A,1.50,2024-01-01 09:30:00",
+            b"2,\\N,2.25,2024-01-02 00:00:00",
+        ]
+
+    def test_csv_values(self):
+        assert [format_csv_value(v) for v in [True, False, None, 'a,"b"']] == [
+            "t",
+            "f",
+            "\\N",
+            'a,"b"',
+        ]
+        assert parse_csv_value("t", "boolean") is True
+        assert parse_csv_value("3", "integer") == 3
+        assert parse_csv_value("1.5", "float") == 1.5
+        assert parse_csv_value("1.50", "numeric") == "1.50"
+        assert parse_csv_value("\\N", "integer") is None
+        assert parse_csv_value("2022-11-03 14:20:49.962", "timestamp") == datetime(
+            2022, 11, 3, 14, 20, 49, 962000
+        )
+
+    def test_csv_timestamps_match_copy(self):
+        assert [
+            format_csv_value(v)
+            for v in [
+                datetime(2022, 11, 3, 14, 20, 49, 962000),
+                datetime(2022, 11, 3, 14, 20, 49),
+                datetime(2022, 11, 3, 14, 20, 49, 962000, tzinfo=timezone.utc),
+                datetime(
+                    2022, 11, 3, 14, 20, tzinfo=timezone(-timedelta(hours=3, minutes=30))
+                ),
+            ]
+        ] == [
+            "2022-11-03 14:20:49.962",
+            "2022-11-03 14:20:49",
+            "2022-11-03 14:20:49.962+00",
+            "2022-11-03 14:20:00-03:30",
+        ]
+
+    def test_update_dict_table_csv_gz_keeps_copy_timestamps(self, s3, s3_bucket):
+        s3.put_object(
+            Body=gzip.compress(
+                encode_schema_line(
+                    [
+                        {"name": "id", "type": "integer"},
+                        {"name": "created_at", "type": "timestamp"},
+                    ]
+                )
+                + b"1,2022-11-03 14:20:49.962\n"
+            ),
+            Bucket=S3_MOCK_BUCKET_NAME,
+            Key="latest/2024-01-01/t.csv.gz",
+        )
+        conn = MagicMock()
+        conn.run.side_effect = [
+            [[None], [None]],
+            [[2, datetime(2022, 11, 3, 14, 25, 1, 500000)]],
+        ]
+        conn.columns = [{"name": "id"}, {"name": "created_at"}]
+        updated, dict_table = update_dict_table(
+            S3_MOCK_BUCKET_NAME, "t", "2024-01-01", conn, "csv.gz"
+        )
+        assert updated
+        lines = gzip.decompress(serialise_dict_table(dict_table, "csv.gz")).splitlines()
+        assert json.loads(lines[0])["schema"][1] == {
+            "name": "created_at",
+            "type": "timestamp",
+        }
+        assert lines[1:] == [
+            b"1,2022-11-03 14:20:49.962",
+            b"2,2022-11-03 14:25:01.5",
+        ]
+
+    def test_copy_table_to_bucket(self, s3, s3_bucket):
+        conn = MagicMock()
+
+        def run(query, stream=None):
+            if query.startswith("COPY"):
+                stream.write(b'1,"A, B",2024-01-01 00:00:00\n')
+                stream.write(b"2,\\N,2024-01-02 00:00:00\n")
+                conn.row_count = 2
+            if query.endswith("LIMIT 1"):
+                return [[datetime(2024, 1, 2), 2]]
+
+        conn.run.side_effect = run
+        conn.columns = [
+            {"name": "id", "type_oid": 23},
+            {"name": "name", "type_oid": 25},
+            {"name": "last_updated", "type_oid": 1114},
+        ]
+        row_count, watermark = copy_table_to_bucket(
+            conn, S3_MOCK_BUCKET_NAME, "t", "2024-01-01", "id"
+        )
+        assert row_count == 2
+        assert watermark == {"last_updated": "2024-01-02 00:00:00", "key": 2}
+        queries = [c.args[0] for c in conn.run.call_args_list]
+        assert queries[0] == (
+            "START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"
+        )
+        assert "COPY t TO STDOUT WITH (FORMAT csv, NULL '\\N')" in queries
+        assert queries[-1] == "COMMIT"
+        assert get_dict_table_from_bucket(
+            S3_MOCK_BUCKET_NAME, "latest/2024-01-01/t.csv.gz", "csv.gz"
+        ) == {
+            "id": [1, 2],
+            "name": ["A, B", None],
+            "last_updated": [datetime(2024, 1, 1), datetime(2024, 1, 2)],
+        }
+
+    def test_copy_table_to_bucket_error(self, s3, s3_bucket):
+        conn = MagicMock()
+
+        def run(query, stream=None):
+            if query.startswith("COPY"):
+                raise DatabaseError("Mock DB error")
+
+        conn.run.side_effect = run
+        with pytest.raises(IngestError) as e:
+            copy_table_to_bucket(conn, S3_MOCK_BUCKET_NAME, "t", "2024-01-01")
+        assert str(e.value) == "Failed to copy table to bucket. Mock DB error"
+        assert conn.run.call_args_list[-1].args == ("ROLLBACK",)
+        objects = s3.list_objects_v2(Bucket=S3_MOCK_BUCKET_NAME)
+        assert "Contents" not in objects
+
+    @patch("src.extract.store_watermark")
+    @patch("src.extract.get_dict_table")
+    @patch("src.extract.copy_table_to_bucket")
+    def test_store_full_table_in_bucket_uses_copy_for_csv(
+        self, mock_copy_table_to_bucket, mock_get_dict_table, mock_store_watermark
+    ):
+        conn = MagicMock()
+        mock_copy_table_to_bucket.return_value = (0, None)
+        store_full_table_in_bucket("b", "t", "d", conn, "rowcount", "csv.gz")
+        mock_copy_table_to_bucket.assert_called_once_with(
+            conn, "b", "t", "d", None, None
+        )
+        mock_get_dict_table.assert_not_called()
+
+    def test_stream_table_to_bucket_ndjson_gz(self, s3, s3_bucket):
+        conn = MagicMock()
+        batches = iter([[[1, "A"], [2, "B"]], []])
+        conn.run.side_effect = lambda query: (
+            next(batches) if query.startswith("FETCH") else None
+        )
+        conn.columns = [
+            {"name": "id", "type_oid": 23},
+            {"name": "name", "type_oid": 25},
+        ]
+        stream_table_to_bucket(
+            conn,
+            S3_MOCK_BUCKET_NAME,
+            "mock-table",
+            "2024-01-01",
+            ingest_format="ndjson.gz",
+        )
+        assert get_dict_table_from_bucket(
+            S3_MOCK_BUCKET_NAME, "latest/2024-01-01/mock-table.ndjson.gz", "ndjson.gz"
+        ) == {"id": [1, 2], "name": ["A", "B"]}
+
+
+def make_range_connection(rows):
+    conn = MagicMock()
+    conn.columns = [
+        {"name": "id", "type_oid": 23},
+        {"name": "last_updated", "type_oid": 1114},
+    ]
+
+    def run(query, stream=None, **kwargs):
+        low = re.search(r"id >= (\d+)", query)
+        high = re.search(r"id < (\d+)", query)
+        selected = [
+            row
+            for row in rows
+            if (low is None or row[0] >= int(low.group(1)))
+            and (high is None or row[0] < int(high.group(1)))
+        ]
+        if query.startswith("COPY"):
+            stream.write(
+                "".join(f"{row[0]},{row[1]}\n" for row in selected).encode()
+            )
+            conn.row_count = len(selected)
+            return None
+        if "LIMIT 0" in query:
+            return []
+        if "LIMIT 1" in query:
+            return [[rows[-1][1], rows[-1][0]]]
+        return selected
+
+    conn.run.side_effect = run
+    return conn
+
+
+class TestKeyRanges:
+    rows = [[i, datetime(2024, 1, i)] for i in range(1, 11)]
+
+    def test_get_extract_range_rows_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_extract_range_rows() == 0
+
+    @pytest.mark.parametrize("value", ["-1", "mock-rows"])
+    def test_get_extract_range_rows_error(self, value):
+        with patch.dict(os.environ, {"EXTRACT_RANGE_ROWS": value}):
+            with pytest.raises(IngestError) as e:
+                get_extract_range_rows()
+        assert str(e.value).startswith("Invalid extract range rows.")
+
+    def test_plan_key_ranges(self):
+        conn = MagicMock()
+        conn.run.side_effect = [[[1000]], [[1, 1000]]]
+        assert plan_key_ranges(conn, "t", "id", 250) == [
+            (None, 251),
+            (251, 501),
+            (501, 751),
+            (751, None),
+        ]
+
+    def test_plan_key_ranges_small_table(self):
+        conn = MagicMock()
+        conn.run.return_value = [[100]]
+        assert plan_key_ranges(conn, "t", "id", 250) is None
+        conn.run.assert_called_once()
+
+    def test_plan_key_ranges_non_integer_key(self):
+        conn = MagicMock()
+        conn.run.side_effect = [[[1000]], [["a", "z"]]]
+        assert plan_key_ranges(conn, "t", "code", 250) is None
+
+    def test_get_key_range_condition(self):
+        assert get_key_range_condition("id", (None, 5)) == " WHERE id < 5"
+        assert get_key_range_condition("id", (5, 9)) == " WHERE id >= 5 AND id < 9"
+        assert get_key_range_condition("id", (None, None)) == ""
+
+    def test_fetch_key_range_csv_gz(self):
+        conn = make_range_connection(self.rows)
+        data, row_count = fetch_key_range(conn, "t", "id", (3, 5), "csv.gz", True)
+        assert row_count == 2
+        lines = gzip.decompress(data).splitlines()
+        assert json.loads(lines[0])["schema"][0] == {"name": "id", "type": "integer"}
+        assert lines[1:] == [b"3,2024-01-03 00:00:00", b"4,2024-01-04 00:00:00"]
+        assert (
+            "COPY (SELECT * FROM t WHERE id >= 3 AND id < 5 ORDER BY id) "
+            "TO STDOUT WITH (FORMAT csv, NULL '\\N')"
+        ) in [c.args[0] for c in conn.run.call_args_list]
+
+    def test_fetch_key_range_ndjson_gz_without_schema(self):
+        conn = make_range_connection(self.rows)
+        data, row_count = fetch_key_range(conn, "t", "id", (9, None), "ndjson.gz", False)
+        assert row_count == 2
+        assert gzip.decompress(data).splitlines() == [
+            b'[9, "2024-01-09 00:00:00"]',
+            b'[10, "2024-01-10 00:00:00"]',
+        ]
+
+    @pytest.mark.parametrize("ingest_format", ["ndjson", "ndjson.gz", "csv.gz"])
+    @patch.dict(os.environ, {"EXTRACT_CONCURRENCY": "3"})
+    @patch("src.extract.get_connection")
+    def test_extract_table_in_ranges(
+        self, mock_get_connection, ingest_format, s3, s3_bucket
+    ):
+        mock_get_connection.side_effect = lambda: make_range_connection(self.rows)
+        row_count, watermark = extract_table_in_ranges(
+            make_range_connection(self.rows),
+            S3_MOCK_BUCKET_NAME,
+            "t",
+            "2024-01-01",
+            "id",
+            "id",
+            [(None, 4), (4, 8), (8, None)],
+            ingest_format,
+        )
+        assert row_count == 10
+        assert watermark == {"last_updated": "2024-01-10 00:00:00", "key": 10}
+        assert 1 <= mock_get_connection.call_count <= 3
+        dict_table = get_dict_table_from_bucket(
+            S3_MOCK_BUCKET_NAME, f"latest/2024-01-01/t.{ingest_format}", ingest_format
+        )
+        assert dict_table["id"] == list(range(1, 11))
+
+    def test_get_extract_range_concurrency(self):
+        with patch.dict(os.environ, {"EXTRACT_CONCURRENCY": "3"}, clear=True):
+            assert get_extract_range_concurrency() == 3
+        with patch.dict(os.environ, {"EXTRACT_RANGE_CONCURRENCY": "8"}):
+            assert get_extract_range_concurrency() == 8
+
+    @pytest.mark.parametrize("value", ["0", "many"])
+    def test_get_extract_range_concurrency_error(self, value):
+        with patch.dict(os.environ, {"EXTRACT_RANGE_CONCURRENCY": value}):
+            with pytest.raises(IngestError) as e:
+                get_extract_range_concurrency()
+        assert str(e.value).startswith("Invalid extract range concurrency.")
+
+    @patch.dict(os.environ, {"EXTRACT_RANGE_CONCURRENCY": "1"})
+    @patch("src.extract.S3MultipartWriter.write", autospec=True)
+    @patch("src.extract.fetch_key_range")
+    @patch("src.extract.get_connection")
+    def test_extract_table_in_ranges_bounds_ranges_in_flight(
+        self, mock_get_connection, mock_fetch_key_range, mock_write, s3, s3_bucket
+    ):
+        events = []
+        mock_fetch_key_range.side_effect = lambda conn, t, k, key_range, *args: (
+            events.append(("fetch", key_range[0])) or (b"", 1)
+        )
+        mock_write.side_effect = lambda writer, data: events.append(("write", None))
+        key_ranges = [(i, i + 1) for i in range(10)]
+        row_count, _ = extract_table_in_ranges(
+            MagicMock(),
+            S3_MOCK_BUCKET_NAME,
+            "t",
+            "2024-01-01",
+            None,
+            "id",
+            key_ranges,
+            "ndjson",
+        )
+        assert row_count == 10
+        written = 0
+        for kind, index in events:
+            if kind == "write":
+                written += 1
+            else:
+                assert index < written + 2
+
+    @patch("src.extract.get_connection")
+    def test_extract_table_in_ranges_error(self, mock_get_connection, s3, s3_bucket):
+        conn = make_range_connection(self.rows)
+        conn.run.side_effect = DatabaseError("Mock DB error")
+        mock_get_connection.return_value = conn
+        with pytest.raises(IngestError) as e:
+            extract_table_in_ranges(
+                MagicMock(),
+                S3_MOCK_BUCKET_NAME,
+                "t",
+                "2024-01-01",
+                None,
+                "id",
+                [(None, 4), (4, None)],
+                "ndjson",
+            )
+        assert str(e.value) == "Failed to extract table in ranges. Mock DB error"
+        objects = s3.list_objects_v2(Bucket=S3_MOCK_BUCKET_NAME)
+        assert "Contents" not in objects
+
+    def test_get_key_ranges_disabled(self):
+        conn = MagicMock()
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_key_ranges(conn, "t", "id", "csv.gz") == ("id", None)
+        with patch.dict(os.environ, {"EXTRACT_RANGE_ROWS": "250"}):
+            assert get_key_ranges(conn, "t", "id", "json") == ("id", None)
+        conn.run.assert_not_called()
+
+    @patch.dict(os.environ, {"EXTRACT_RANGE_ROWS": "250"})
+    def test_get_key_ranges(self):
+        conn = MagicMock()
+        conn.run.side_effect = [[["id"]], [[1000]], [[1, 1000]]]
+        primary_key, key_ranges = get_key_ranges(conn, "t", None, "csv.gz")
+        assert primary_key == "id"
+        assert len(key_ranges) == 4
+
+    @patch.dict(os.environ, {"EXTRACT_RANGE_ROWS": "250"})
+    def test_get_key_ranges_without_primary_key(self):
+        conn = MagicMock()
+        conn.run.return_value = []
+        assert get_key_ranges(conn, "t", None, "csv.gz") == (None, None)
+
+
+class TestConcurrentExtraction:
+    def test_get_extract_concurrency_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_extract_concurrency() == 1
+
+    @patch.dict(os.environ, {"EXTRACT_CONCURRENCY": "4"})
+    def test_get_extract_concurrency(self):
+        assert get_extract_concurrency() == 4
+
+    @pytest.mark.parametrize("value", ["0", "many"])
+    def test_get_extract_concurrency_error(self, value):
+        with patch.dict(os.environ, {"EXTRACT_CONCURRENCY": value}):
+            with pytest.raises(IngestError) as e:
+                get_extract_concurrency()
+        assert str(e.value).startswith("Invalid extract concurrency.")
+
+    def test_extract_tables_serial_uses_given_connection(self):
+        conn = MagicMock()
+        extract_table = MagicMock(side_effect=lambda t, c: t == "t2")
+        assert extract_tables(["t1", "t2"], extract_table, conn) == [False, True]
+        assert all(c.args[1] is conn for c in extract_table.call_args_list)
+
+    @patch("src.extract.get_connection")
+    def test_extract_tables_concurrent(self, mock_get_connection):
+        mock_get_connection.side_effect = lambda: MagicMock()
+        barrier = threading.Barrier(2, timeout=5)
+        used = {}
+
+        def extract_table(table_name, conn):
+            barrier.wait()
+            used[table_name] = conn
+            return table_name
+
+        tables = ["t1", "t2", "t3", "t4"]
+        result = extract_tables(tables, extract_table, MagicMock(), concurrency=2)
+        assert result == tables
+        assert mock_get_connection.call_count == 2
+        assert len({id(conn) for conn in used.values()}) == 2
+        for conn in used.values():
+            conn.close.assert_not_called()
+
+        extract_tables(tables, lambda t, c: t, MagicMock(), concurrency=2)
+        assert mock_get_connection.call_count == 2
+
+    @patch("src.extract.get_connection")
+    def test_extract_tables_concurrent_error(self, mock_get_connection):
+        def extract_table(table_name, conn):
+            if table_name == "t2":
+                raise IngestError("Mock ingest error")
+            return True
+
+        with pytest.raises(IngestError) as e:
+            extract_tables(["t1", "t2", "t3"], extract_table, MagicMock(), 3)
+        assert str(e.value) == "Mock ingest error"
+        mock_get_connection.return_value.close.assert_called()
+
+    @patch("src.extract.store_table_in_bucket")
+    @patch("src.extract.delete_table")
+    @patch("src.extract.update_dict_table")
+    def test_update_table_in_bucket_unchanged(
+        self,
+        mock_update_dict_table,
+        mock_delete_table,
+        mock_store_table_in_bucket,
+    ):
+        mock_update_dict_table.return_value = (False, {})
+        assert not update_table_in_bucket(
+            "b", "t", "d1", "d2", MagicMock(), "rowcount", "json"
+        )
+        mock_delete_table.assert_not_called()
+        mock_store_table_in_bucket.assert_not_called()
+
+    @patch("src.extract.store_watermark")
+    @patch("src.extract.get_dict_table")
+    @patch("src.extract.store_table_in_bucket")
+    @patch("src.extract.get_primary_key")
+    def test_store_full_table_in_bucket(
+        self,
+        mock_get_primary_key,
+        mock_store_table_in_bucket,
+        mock_get_dict_table,
+        mock_store_watermark,
+    ):
+        mock_get_primary_key.return_value = "id"
+        mock_get_dict_table.return_value = {
+            "id": [1],
+            "last_updated": ["2024-01-01 00:00:00"],
+        }
+        assert store_full_table_in_bucket(
+            "b", "t", "d", MagicMock(), "watermark", "json"
+        )
+        mock_store_watermark.assert_called_once_with(
+            "b", "t", {"last_updated": "2024-01-01 00:00:00", "key": 1}
+        )
+
+
+class TestSnapshot:
+    def test_get_extract_consistency_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_extract_consistency() == "none"
+
+    def test_get_extract_consistency_error(self):
+        with patch.dict(os.environ, {"EXTRACT_CONSISTENCY": "serializable"}):
+            with pytest.raises(IngestError) as e:
+                get_extract_consistency()
+        assert str(e.value) == "Unknown extract consistency. serializable"
+
+    def test_exported_snapshot_disabled(self):
+        conn = MagicMock()
+        with exported_snapshot(conn, False) as snapshot_id:
+            assert snapshot_id is None
+        conn.run.assert_not_called()
+
+    def test_exported_snapshot(self):
+        conn = MagicMock()
+        conn.run.side_effect = [None, [["00000003-0000001B-1"]], None]
+        with exported_snapshot(conn) as snapshot_id:
+            assert snapshot_id == "00000003-0000001B-1"
+            assert snapshot_connections[conn] == snapshot_id
+        assert conn not in snapshot_connections
+        statements = [c.args[0] for c in conn.run.call_args_list]
+        assert statements == [
+            "START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY",
+            "SELECT pg_export_snapshot()",
+            "ROLLBACK",
+        ]
+
+    def test_exported_snapshot_error(self):
+        conn = MagicMock()
+        conn.run.side_effect = [None, DatabaseError("Mock DB error"), None]
+        with pytest.raises(IngestError) as e:
+            with exported_snapshot(conn):
+                pass
+        assert str(e.value) == "Failed to export snapshot. Mock DB error"
+        assert conn not in snapshot_connections
+
+    def test_attached_snapshot(self):
+        conn = MagicMock()
+        with attached_snapshot(conn, "00000003-0000001B-1"):
+            assert snapshot_connections[conn] == "00000003-0000001B-1"
+        assert conn not in snapshot_connections
+        statements = [c.args[0] for c in conn.run.call_args_list]
+        assert statements == [
+            "START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY",
+            "SET TRANSACTION SNAPSHOT '00000003-0000001B-1'",
+            "ROLLBACK",
+        ]
+
+    def test_attached_snapshot_error(self):
+        conn = MagicMock()
+        conn.run.side_effect = [None, DatabaseError("Mock DB error"), None]
+        with pytest.raises(IngestError) as e:
+            with attached_snapshot(conn, "00000003-0000001B-1"):
+                pass
+        assert str(e.value) == "Failed to attach to snapshot. Mock DB error"
+
+    def test_copy_table_to_bucket_in_snapshot_skips_transaction(self, s3, s3_bucket):
+        conn = MagicMock()
+        conn.columns = [{"name": "id", "type_oid": 23}]
+        conn.row_count = 0
+        snapshot_connections[conn] = "00000003-0000001B-1"
+        try:
+            copy_table_to_bucket(conn, S3_MOCK_BUCKET_NAME, "t", "2024-01-01")
+        finally:
+            snapshot_connections.pop(conn, None)
+        statements = [c.args[0] for c in conn.run.call_args_list]
+        assert not any(
+            s.startswith(("START", "COMMIT", "ROLLBACK")) for s in statements
+        )
+
+    @patch("src.extract.get_connection")
+    def test_extract_tables_attach_workers_to_snapshot(self, mock_get_connection):
+        mock_get_connection.side_effect = lambda: MagicMock()
+        attached = {}
+
+        def extract_table(table_name, conn):
+            attached[table_name] = snapshot_connections.get(conn)
+            return True
+
+        tables = ["t1", "t2", "t3"]
+        extract_tables(tables, extract_table, MagicMock(), 2, "00000003-0000001B-1")
+        assert attached == {t: "00000003-0000001B-1" for t in tables}
+
+
+class TestChangeProbe:
+    def test_get_change_probe_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_change_probe() == "none"
+
+    @patch.dict(os.environ, {"CHANGE_PROBE": "mock-probe"})
+    def test_get_change_probe_error(self):
+        with pytest.raises(IngestError) as e:
+            get_change_probe()
+        assert str(e.value) == "Unknown change probe. mock-probe"
+
+    def test_get_table_probes_none(self):
+        conn = MagicMock()
+        assert get_table_probes(conn, ["t1"], "none") == {}
+        conn.run.assert_not_called()
+
+    def test_get_table_probes_stats(self):
+        conn = MagicMock()
+        conn.run.return_value = [["t1", 3, 1, 0], ["_hidden", 1, 0, 0]]
+        assert get_table_probes(conn, ["t1", "t2"], "stats") == {"t1": [3, 1, 0]}
+        conn.run.assert_called_once()
+        assert "pg_stat_user_tables" in conn.run.call_args.args[0]
+
+    def test_get_table_probes_aggregate(self):
+        conn = MagicMock()
+        conn.run.side_effect = [[[2, datetime(2024, 1, 2)]], [[0, None]]]
+        assert get_table_probes(conn, ["t1", "t2"], "aggregate") == {
+            "t1": [2, "2024-01-02 00:00:00"],
+            "t2": [0, "None"],
+        }
+        assert conn.run.call_args_list[0].args == (
+            "SELECT count(*), max(last_updated) FROM t1",
+        )
+
+    def test_get_table_probes_error(self):
+        conn = MagicMock()
+        conn.run.side_effect = DatabaseError("Mock DB error")
+        with pytest.raises(IngestError) as e:
+            get_table_probes(conn, ["t1"], "stats")
+        assert str(e.value) == "Failed to probe tables. Mock DB error"
+
+    def test_get_changed_tables(self):
+        probes = {"t1": [1, 0, 0], "t2": [2, 0, 0]}
+        stored_probes = {"t1": [1, 0, 0], "t2": [1, 0, 0]}
+        assert get_changed_tables(["t1", "t2", "t3"], probes, stored_probes) == [
+            "t2",
+            "t3",
+        ]
+
+    def test_store_and_get_probes(self, s3, s3_bucket):
+        assert get_stored_probes(S3_MOCK_BUCKET_NAME) == {}
+        store_probes(S3_MOCK_BUCKET_NAME, {"t1": [1, 0, 0]})
+        assert get_stored_probes(S3_MOCK_BUCKET_NAME) == {"t1": [1, 0, 0]}
+
+    def test_get_stored_probes_error(self, s3, s3_bucket):
+        with pytest.raises(IngestError) as e:
+            get_stored_probes(S3_MOCK_BUCKET_WRONG_NAME)
+        assert str(e.value).startswith("Failed to get probes from bucket.")
+
+    @patch.dict(
+        "os.environ",
+        {"S3_INGEST_BUCKET": S3_MOCK_BUCKET_NAME, "CHANGE_PROBE": "stats"},
+    )
+    @patch("src.extract.update_table_in_bucket")
+    @patch("src.extract.store_full_table_in_bucket")
+    @patch("src.extract.get_table_names")
+    @patch("src.extract.get_connection")
+    def test_lambda_handler_skips_unchanged_tables(
+        self,
+        mock_get_connection,
+        mock_get_table_names,
+        mock_store_full_table_in_bucket,
+        mock_update_table_in_bucket,
+        s3_bucket,
+    ):
+        mock_get_table_names.return_value = ["t1", "t2"]
+        mock_store_full_table_in_bucket.return_value = True
+        mock_update_table_in_bucket.return_value = True
+        conn = mock_get_connection.return_value
+        conn.run.return_value = [["t1", 1, 0, 0], ["t2", 1, 0, 0]]
+        assert lambda_handler({}, {})["tables"] == ["t1", "t2"]
+        assert get_stored_probes(S3_MOCK_BUCKET_NAME) == {
+            "t1": [1, 0, 0],
+            "t2": [1, 0, 0],
+        }
+
+        s3 = boto3.client("s3", region_name="eu-west-2")
+        keys = [
+            c["Key"] for c in s3.list_objects_v2(Bucket=S3_MOCK_BUCKET_NAME)["Contents"]
+        ]
+        assert lambda_handler({}, {})["tables"] == []
+        mock_update_table_in_bucket.assert_not_called()
+        listed = s3.list_objects_v2(Bucket=S3_MOCK_BUCKET_NAME)["Contents"]
+        assert [c["Key"] for c in listed] == keys
+
+        conn.run.return_value = [["t1", 1, 0, 0], ["t2", 1, 1, 0]]
+        assert lambda_handler({}, {})["tables"] == ["t2"]
+        assert [c.args[1] for c in mock_update_table_in_bucket.call_args_list] == [
+            "t2"
+        ]
+        assert get_stored_probes(S3_MOCK_BUCKET_NAME)["t2"] == [1, 1, 0]
+
+    @patch.dict(
+        "os.environ",
+        {
+            "S3_INGEST_BUCKET": S3_MOCK_BUCKET_NAME,
+            "CHANGE_PROBE": "stats",
+            "EXTRACT_CONSISTENCY": "snapshot",
+        },
+    )
+    @patch("src.extract.store_full_table_in_bucket")
+    @patch("src.extract.get_table_names")
+    @patch("src.extract.get_connection")
+    def test_lambda_handler_probes_before_snapshot(
+        self,
+        mock_get_connection,
+        mock_get_table_names,
+        mock_store_full_table_in_bucket,
+        s3_bucket,
+    ):
+        mock_get_table_names.return_value = ["t1"]
+        mock_store_full_table_in_bucket.return_value = True
+        conn = mock_get_connection.return_value
+        conn.run.return_value = [["t1", 1, 0, 0]]
+        assert lambda_handler({}, {})["tables"] == ["t1"]
+        queries = [c.args[0] for c in conn.run.call_args_list]
+        probe = next(i for i, q in enumerate(queries) if "pg_stat_user_tables" in q)
+        assert probe < queries.index(
+            "START TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"
+        )
+
+
+class TestManifest:
+    def test_get_manifest_empty_bucket(self, s3, s3_bucket):
+        assert get_manifest(S3_MOCK_BUCKET_NAME) is None
+
+    def test_store_and_get_manifest(self, s3, s3_bucket):
+        manifest = {"version": 3, "date": "d", "tables": {}}
+        store_manifest(S3_MOCK_BUCKET_NAME, manifest)
+        assert get_manifest(S3_MOCK_BUCKET_NAME) == manifest
+        archived = s3.get_object(
+            Bucket=S3_MOCK_BUCKET_NAME, Key="manifests/00000003.json"
+        )["Body"].read()
+        assert json.loads(archived) == manifest
+
+    def test_get_manifest_error(self, s3, s3_bucket):
+        with pytest.raises(IngestError) as e:
+            get_manifest(S3_MOCK_BUCKET_WRONG_NAME)
+        assert str(e.value).startswith("Failed to get manifest from bucket.")
+
+    def test_get_manifest_from_legacy_layout(self, s3, s3_bucket):
+        s3.put_object(
+            Body=b"2024-01-01", Bucket=S3_MOCK_BUCKET_NAME, Key="latest_date"
+        )
+        store_table_in_bucket(S3_MOCK_BUCKET_NAME, {"id": [1]}, "t1", "2024-01-01")
+        store_table_in_bucket(
+            S3_MOCK_BUCKET_NAME, {"id": [1]}, "t2", "2024-01-01", "ndjson.gz"
+        )
+        assert get_manifest(S3_MOCK_BUCKET_NAME) == {
+            "version": 0,
+            "date": "2024-01-01",
+            "tables": {
+                "t1": {
+                    "key": "latest/2024-01-01/t1.json",
+                    "date": "2024-01-01",
+                    "format": "json",
+                },
+                "t2": {
+                    "key": "latest/2024-01-01/t2.ndjson.gz",
+                    "date": "2024-01-01",
+                    "format": "ndjson.gz",
+                },
+            },
+        }
+
+    def test_get_legacy_manifest_error(self, s3, s3_bucket):
+        with pytest.raises(IngestError) as e:
+            get_legacy_manifest(S3_MOCK_BUCKET_WRONG_NAME, "2024-01-01")
+        assert str(e.value).startswith("Failed to list tables in bucket.")
+
+    def test_get_next_manifest(self):
+        unchanged = {"key": "latest/d1/t1.json", "date": "d1", "format": "json"}
+        manifest = {"version": 1, "date": "d1", "tables": {"t1": unchanged}}
+        assert get_next_manifest(
+            manifest, ["t1", "t2"], [False, True], "d2", "json"
+        ) == {
+            "version": 2,
+            "date": "d2",
+            "tables": {
+                "t1": unchanged,
+                "t2": {"key": "latest/d2/t2.json", "date": "d2", "format": "json"},
+            },
+        }
+        assert get_next_manifest(None, ["t1"], [True], "d1", "json")["version"] == 1
+
+    @patch("src.extract.update_table_in_bucket")
+    @patch("src.extract.store_full_table_in_bucket")
+    def test_update_table_from_manifest(
+        self, mock_store_full_table_in_bucket, mock_update_table_in_bucket
+    ):
+        conn = MagicMock()
+        manifest = {
+            "tables": {
+                "t1": {"key": "latest/d1/t1.json", "date": "d1", "format": "json"}
+            }
+        }
+        update_table_from_manifest("b", "t1", manifest, "d2", conn, "rowcount", "json")
+        mock_update_table_in_bucket.assert_called_once_with(
+            "b", "t1", "d1", "d2", conn, "rowcount", "json"
+        )
+        update_table_from_manifest("b", "t2", manifest, "d2", conn, "rowcount", "json")
+        update_table_from_manifest(
+            "b", "t1", manifest, "d2", conn, "rowcount", "ndjson"
+        )
+        update_table_from_manifest("b", "t1", None, "d2", conn, "rowcount", "json")
+        assert mock_store_full_table_in_bucket.call_count == 3
+
+    @patch.dict("os.environ", {"S3_INGEST_BUCKET": S3_MOCK_BUCKET_NAME})
+    @patch("src.extract.get_dict_table")
+    @patch("src.extract.get_table_names")
+    @patch("src.extract.get_connection")
+    def test_lambda_handler_unchanged_run_writes_nothing(
+        self, mock_get_connection, mock_get_table_names, mock_get_dict_table, s3_bucket
+    ):
+        mock_get_table_names.return_value = ["t1", "t2"]
+        mock_get_dict_table.return_value = {"created_at": ["2024-01-01"]}
+        conn = mock_get_connection.return_value
+        conn.run.return_value = [["2024-01-01"]]
+        assert lambda_handler({}, {})["tables"] == ["t1", "t2"]
+        s3 = boto3.client("s3", region_name="eu-west-2")
+        keys = [
+            c["Key"] for c in s3.list_objects_v2(Bucket=S3_MOCK_BUCKET_NAME)["Contents"]
+        ]
+        manifest = get_manifest(S3_MOCK_BUCKET_NAME)
+        assert manifest["version"] == 1
+        assert sorted(manifest["tables"]) == ["t1", "t2"]
+
+        assert lambda_handler({}, {})["tables"] == []
+        listed = s3.list_objects_v2(Bucket=S3_MOCK_BUCKET_NAME)["Contents"]
+        assert [c["Key"] for c in listed] == keys
+        assert get_manifest(S3_MOCK_BUCKET_NAME) == manifest
+
+
+class TestSegments:
+    def test_get_ingest_layout_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_ingest_layout() == "snapshot"
+
+    @patch.dict(os.environ, {"INGEST_LAYOUT": "mock-layout"})
+    def test_get_ingest_layout_error(self):
+        with pytest.raises(IngestError) as e:
+            get_ingest_layout()
+        assert str(e.value) == "Unknown ingest layout. mock-layout"
+
+    def test_get_segment_key(self):
+        run_id = format_run_id(datetime(2024, 1, 2, 9, 30, 5))
+        assert run_id == "20240102T093005"
+        assert get_segment_key("t", run_id, "ndjson.gz") == (
+            "segments/t/20240102T093005.ndjson.gz"
+        )
+
+    def test_store_and_get_segment_manifest(self, s3, s3_bucket):
+        assert get_segment_manifest(S3_MOCK_BUCKET_NAME, "t") is None
+        manifest = {"table": "t", "primary_key": None, "segments": []}
+        store_segment_manifest(S3_MOCK_BUCKET_NAME, "t", manifest)
+        assert get_segment_manifest(S3_MOCK_BUCKET_NAME, "t") == manifest
+
+    def test_get_segment_manifest_error(self, s3, s3_bucket):
+        with pytest.raises(IngestError) as e:
+            get_segment_manifest(S3_MOCK_BUCKET_WRONG_NAME, "t")
+        assert str(e.value).startswith("Failed to get segment manifest from bucket.")
+
+    def test_get_delta_rows_by_rowcount(self):
+        conn = MagicMock()
+        conn.run.return_value = [[3]]
+        conn.columns = [{"name": "id"}]
+        manifest = {"segments": [{"rows": 2}, {"rows": 1}]}
+        assert get_delta_rows("b", "t", manifest, conn) == (["id"], [[3]], None)
+        conn.run.assert_called_once_with("SELECT * FROM t OFFSET :length", length=3)
+
+    def test_get_delta_rows_error(self):
+        conn = MagicMock()
+        conn.run.side_effect = DatabaseError("Mock DB error")
+        with pytest.raises(IngestError) as e:
+            get_delta_rows("b", "t", {"segments": []}, conn)
+        assert str(e.value) == "Failed to get new rows of table. Mock DB error"
+
+    @patch("src.extract.get_dict_table")
+    def test_append_table_segment_by_rowcount(self, mock_get_dict_table, s3, s3_bucket):
+        mock_get_dict_table.return_value = {"id": [1, 2], "name": ["A", "B"]}
+        conn = MagicMock()
+        assert append_table_segment(
+            S3_MOCK_BUCKET_NAME, "t", "r1", conn, "rowcount", "json"
+        )
+
+        conn.run.return_value = [[3, "C"]]
+        conn.columns = [{"name": "id"}, {"name": "name"}]
+        assert append_table_segment(
+            S3_MOCK_BUCKET_NAME, "t", "r2", conn, "rowcount", "json"
+        )
+        conn.run.assert_called_once_with("SELECT * FROM t OFFSET :length", length=2)
+        assert get_dict_table_from_bucket(
+            S3_MOCK_BUCKET_NAME, "segments/t/r2.json"
+        ) == {"id": [3], "name": ["C"]}
+
+        conn.run.return_value = []
+        assert not append_table_segment(
+            S3_MOCK_BUCKET_NAME, "t", "r3", conn, "rowcount", "json"
+        )
+        assert get_segment_manifest(S3_MOCK_BUCKET_NAME, "t") == {
+            "table": "t",
+            "primary_key": None,
+            "segments": [
+                {"key": "segments/t/r1.json", "format": "json", "rows": 2},
+                {"key": "segments/t/r2.json", "format": "json", "rows": 1},
+            ],
+        }
+        objects = s3.list_objects_v2(Bucket=S3_MOCK_BUCKET_NAME, Prefix="latest/")
+        assert "Contents" not in objects
+
+    def test_append_table_segment_by_watermark(self, s3, s3_bucket):
+        store_segment_manifest(
+            S3_MOCK_BUCKET_NAME,
+            "t",
+            {
+                "table": "t",
+                "primary_key": "id",
+                "segments": [{"key": "segments/t/r1.json", "format": "json", "rows": 2}],
+            },
+        )
+        store_watermark(
+            S3_MOCK_BUCKET_NAME, "t", {"last_updated": "2024-01-02 00:00:00", "key": 2}
+        )
+        conn = MagicMock()
+
+        def run(query, **kwargs):
+            if "pg_index" in query:
+                return [["id"]]
+            assert kwargs == {"last_updated": "2024-01-02 00:00:00", "key": 2}
+            return [[1, datetime(2024, 1, 3)]]
+
+        conn.run.side_effect = run
+        conn.columns = [{"name": "id"}, {"name": "last_updated"}]
+        assert append_table_segment(
+            S3_MOCK_BUCKET_NAME, "t", "r2", conn, "watermark", "ndjson"
+        )
+        assert get_dict_table_from_bucket(
+            S3_MOCK_BUCKET_NAME, "segments/t/r2.ndjson", "ndjson"
+        ) == {"id": [1], "last_updated": ["2024-01-03 00:00:00"]}
+        assert get_watermark(S3_MOCK_BUCKET_NAME, "t") == {
+            "last_updated": "2024-01-03 00:00:00",
+            "key": 1,
+        }
+        manifest = get_segment_manifest(S3_MOCK_BUCKET_NAME, "t")
+        assert [segment["key"] for segment in manifest["segments"]] == [
+            "segments/t/r1.json",
+            "segments/t/r2.ndjson",
+        ]
+
+    def test_append_table_segment_streams_base_segment(self, s3, s3_bucket):
+        conn = MagicMock()
+        batches = iter([[[1, "A"]], []])
+        conn.run.side_effect = lambda query: (
+            next(batches) if query.startswith("FETCH") else None
+        )
+        conn.columns = [
+            {"name": "id", "type_oid": 23},
+            {"name": "name", "type_oid": 25},
+        ]
+        assert append_table_segment(
+            S3_MOCK_BUCKET_NAME, "t", "r1", conn, "rowcount", "ndjson.gz"
+        )
+        assert get_dict_table_from_bucket(
+            S3_MOCK_BUCKET_NAME, "segments/t/r1.ndjson.gz", "ndjson.gz"
+        ) == {"id": [1], "name": ["A"]}
+        assert get_segment_manifest(S3_MOCK_BUCKET_NAME, "t")["segments"] == [
+            {"key": "segments/t/r1.ndjson.gz", "format": "ndjson.gz", "rows": 1}
+        ]
+
+    @patch.dict(
+        os.environ,
+        {"S3_INGEST_BUCKET": S3_MOCK_BUCKET_NAME, "INGEST_LAYOUT": "segments"},
+    )
+    @patch("src.extract.append_table_segment")
+    @patch("src.extract.is_bucket_empty")
+    @patch("src.extract.get_table_names")
+    @patch("src.extract.get_connection")
+    def test_lambda_handler_segments(
+        self,
+        mock_get_connection,
+        mock_get_table_names,
+        mock_is_bucket_empty,
+        mock_append_table_segment,
+    ):
+        mock_get_table_names.return_value = ["t1", "t2"]
+        mock_append_table_segment.side_effect = [True, False]
+        assert lambda_handler({}, {}) == {
+            "msg": "Ingestion successful",
+            "tables": ["t1"],
+        }
+        mock_is_bucket_empty.assert_not_called()
+
+
+class TestCatalog:
+    catalog = {
+        "fingerprint": "abc123",
+        "tables": {
+            "staff": {
+                "columns": [{"name": "staff_id", "type": "integer", "type_oid": 23}],
+                "primary_key": ["staff_id"],
+            },
+            "_prisma_migrations": {"columns": [], "primary_key": ["id"]},
+        },
+    }
+
+    def test_get_schema_catalog_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_schema_catalog() == "query"
+
+    def test_get_schema_catalog_error(self):
+        with patch.dict(os.environ, {"SCHEMA_CATALOG": "mock-catalog"}):
+            with pytest.raises(IngestError) as e:
+                get_schema_catalog()
+        assert str(e.value) == "Unknown schema catalog. mock-catalog"
+
+    @patch("src.extract.read_catalog")
+    @patch("src.extract.read_fingerprint")
+    def test_get_catalog_reads_catalog_once(
+        self, mock_read_fingerprint, mock_read_catalog, s3, s3_bucket
+    ):
+        mock_read_fingerprint.return_value = "abc123"
+        mock_read_catalog.return_value = self.catalog
+        conn = MagicMock()
+        assert get_catalog(conn, S3_MOCK_BUCKET_NAME) == self.catalog
+        assert get_stored_catalog(S3_MOCK_BUCKET_NAME) == self.catalog
+        assert get_catalog(conn, S3_MOCK_BUCKET_NAME) == self.catalog
+        catalog_cache.invalidate()
+        assert get_catalog(conn, S3_MOCK_BUCKET_NAME) == self.catalog
+        mock_read_catalog.assert_called_once_with(conn, "abc123")
+        assert mock_read_fingerprint.call_count == 3
+
+    @patch("src.extract.read_catalog")
+    @patch("src.extract.read_fingerprint")
+    def test_get_catalog_reads_changed_schema(
+        self, mock_read_fingerprint, mock_read_catalog, s3, s3_bucket
+    ):
+        changed = {**self.catalog, "fingerprint": "def456"}
+        mock_read_fingerprint.side_effect = ["abc123", "def456"]
+        mock_read_catalog.side_effect = [self.catalog, changed]
+        get_catalog(MagicMock(), S3_MOCK_BUCKET_NAME)
+        assert get_catalog(MagicMock(), S3_MOCK_BUCKET_NAME) == changed
+        assert get_stored_catalog(S3_MOCK_BUCKET_NAME) == changed
+
+    def test_get_catalog_error(self, s3, s3_bucket):
+        conn = MagicMock()
+        conn.run.side_effect = DatabaseError("Mock DB error")
+        with pytest.raises(IngestError) as e:
+            get_catalog(conn, S3_MOCK_BUCKET_NAME)
+        assert str(e.value) == "Failed to get catalog. Mock DB error"
+
+    def test_get_table_names_from_catalog(self):
+        conn = MagicMock()
+        assert get_table_names(conn, self.catalog) == ["staff"]
+        conn.run.assert_not_called()
+
+    def test_get_primary_key_from_catalog(self):
+        conn = MagicMock()
+        catalog_cache.put(self.catalog)
+        assert get_primary_key(conn, "staff") == "staff_id"
+        conn.run.assert_not_called()
+
+    def test_get_primary_key_from_catalog_error(self):
+        catalog_cache.put(
+            {"fingerprint": "abc123", "tables": {"t": {"primary_key": ["a", "b"]}}}
+        )
+        with pytest.raises(IngestError) as e:
+            get_primary_key(MagicMock(), "t")
+        assert str(e.value) == "Failed to get primary key. t"
+
+
+class TestRunMetrics:
+    def test_get_run_metrics_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_run_metrics() == "none"
+
+    def test_get_run_metrics_error(self):
+        with patch.dict(os.environ, {"RUN_METRICS": "mock-metrics"}):
+            with pytest.raises(IngestError) as e:
+                get_run_metrics()
+        assert str(e.value) == "Unknown run metrics. mock-metrics"
+
+    @pytest.mark.parametrize("concurrency", [1, 2])
+    @patch("src.extract.get_connection")
+    def test_extract_tables_records_metrics_per_table(
+        self, mock_get_connection, concurrency, s3, s3_bucket
+    ):
+        mock_get_connection.side_effect = lambda: MagicMock()
+
+        def extract_table(table_name, conn):
+            store_table_in_bucket(
+                S3_MOCK_BUCKET_NAME, {"id": [1]}, table_name, "2024-01-01"
+            )
+            return True
+
+        metrics = {}
+        extract_tables(
+            ["t1", "t2"], extract_table, MagicMock(), concurrency, None, metrics
+        )
+        assert sorted(metrics) == ["t1", "t2"]
+        for table_metrics in metrics.values():
+            assert table_metrics.bytes == len(b'{"id":[1]}')
+            assert table_metrics.seconds["s3"] > 0
+
+    def test_get_dict_table_records_rows(self):
+        conn = MagicMock()
+        conn.run.return_value = [["A"], ["B"]]
+        conn.columns = [{"name": "c1"}]
+        metrics = {}
+        extract_tables(["t"], lambda t, c: get_dict_table(c, t), conn, metrics=metrics)
+        assert metrics["t"].rows == 2
+
+    def test_get_run_manifest(self):
+        metrics = {"t1": MagicMock()}
+        metrics["t1"].as_dict.return_value = {"rows": 3}
+        run_manifest = get_run_manifest(
+            "20240101T000000", datetime(2024, 1, 1), ["t1", "t2"], [True, False], metrics
+        )
+        assert run_manifest["run_id"] == "20240101T000000"
+        assert run_manifest["started_at"] == "2024-01-01T00:00:00"
+        assert run_manifest["tables"]["t1"] == {"updated": True, "rows": 3}
+        assert run_manifest["tables"]["t2"]["updated"] is False
+        assert run_manifest["tables"]["t2"]["rows"] == 0
+
+    @patch.dict(
+        "os.environ",
+        {"S3_INGEST_BUCKET": S3_MOCK_BUCKET_NAME, "RUN_METRICS": "manifest"},
+    )
+    @patch("src.extract.get_dict_table")
+    @patch("src.extract.get_table_names")
+    @patch("src.extract.get_connection")
+    def test_lambda_handler_stores_run_manifest(
+        self, mock_get_connection, mock_get_table_names, mock_get_dict_table, s3_bucket
+    ):
+        mock_get_table_names.return_value = ["t1"]
+        mock_get_dict_table.return_value = {"created_at": ["2024-01-01"]}
+        response = lambda_handler({}, {})
+        run = response["run"]
+        assert response["tables"] == ["t1"]
+        assert run["tables"]["t1"]["updated"] is True
+        assert run["tables"]["t1"]["bytes"] > 0
+        s3 = boto3.client("s3", region_name="eu-west-2")
+        stored = s3.get_object(
+            Bucket=S3_MOCK_BUCKET_NAME, Key=f"runs/{run['run_id']}.json"
+        )
+        assert json.loads(stored["Body"].read()) == run
+
+
+class TestRefreshPolicies:
+    now = datetime(2024, 1, 1, 12, 0)
+
+    def test_get_refresh_policies_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_refresh_policies() == {}
+
+    def test_get_refresh_policies(self):
+        policies = {"currency": {"interval_minutes": 1440}, "*": {"priority": 1}}
+        with patch.dict(os.environ, {"REFRESH_POLICIES": json.dumps(policies)}):
+            assert get_refresh_policies() == policies
+
+    @pytest.mark.parametrize(
+        "value",
+        [
+            "not json",
+            "[]",
+            '{"t": {"interval": 1}}',
+            '{"t": {"priority": "high"}}',
+            '{"t": 5}',
+        ],
+    )
+    def test_get_refresh_policies_error(self, value):
+        with patch.dict(os.environ, {"REFRESH_POLICIES": value}):
+            with pytest.raises(IngestError) as e:
+                get_refresh_policies()
+        assert str(e.value).startswith("Invalid refresh policies.")
+
+    @pytest.mark.parametrize("value", ["-1", "many"])
+    def test_get_refresh_limit_error(self, value):
+        with patch.dict(os.environ, {"REFRESH_MAX_TABLES": value}):
+            with pytest.raises(IngestError) as e:
+                get_refresh_limit()
+        assert str(e.value) == f"Invalid refresh limit. {value}"
+
+    def test_get_due_tables_skips_tables_within_interval(self):
+        policies = {"currency": {"interval_minutes": 60}}
+        refresh_times = {
+            "currency": "2024-01-01T11:30:00",
+            "sales_order": "2024-01-01T11:50:00",
+        }
+        tables = ["currency", "sales_order"]
+        assert get_due_tables(tables, policies, refresh_times, self.now) == [
+            "sales_order"
+        ]
+        refresh_times["currency"] = "2024-01-01T11:00:00"
+        assert get_due_tables(tables, policies, refresh_times, self.now) == [
+            "currency",
+            "sales_order",
+        ]
+
+    def test_get_due_tables_orders_by_age_limit_then_priority(self):
+        policies = {
+            "*": {"priority": 0},
+            "sales_order": {"priority": 10},
+            "payment": {"priority": 10},
+            "currency": {"max_age_minutes": 120},
+        }
+        refresh_times = {
+            "sales_order": "2024-01-01T11:30:00",
+            "payment": "2024-01-01T11:00:00",
+            "currency": "2024-01-01T09:00:00",
+            "design": "2024-01-01T11:00:00",
+        }
+        tables = ["design", "sales_order", "currency", "payment", "staff"]
+        assert get_due_tables(tables, policies, refresh_times, self.now) == [
+            "staff",
+            "currency",
+            "payment",
+            "sales_order",
+            "design",
+        ]
+        assert get_due_tables(tables, policies, refresh_times, self.now, 2) == [
+            "staff",
+            "currency",
+        ]
+
+    @patch.dict(
+        "os.environ",
+        {
+            "S3_INGEST_BUCKET": S3_MOCK_BUCKET_NAME,
+            "REFRESH_POLICIES": '{"currency": {"interval_minutes": 60}}',
+        },
+    )
+    @patch("src.extract.get_dict_table")
+    @patch("src.extract.get_table_names")
+    @patch("src.extract.get_connection")
+    def test_lambda_handler_extracts_due_tables(
+        self, mock_get_connection, mock_get_table_names, mock_get_dict_table, s3_bucket
+    ):
+        mock_get_table_names.return_value = ["currency", "sales_order"]
+        mock_get_dict_table.return_value = {"created_at": ["2024-01-01"]}
+        conn = mock_get_connection.return_value
+        conn.run.return_value = [["2024-01-01"]]
+        assert lambda_handler({}, {})["tables"] == ["currency", "sales_order"]
+        refresh_times = get_refresh_times(S3_MOCK_BUCKET_NAME)
+        assert sorted(refresh_times) == ["currency", "sales_order"]
+
+        mock_get_dict_table.reset_mock()
+        lambda_handler({}, {})
+        assert [c.args[1] for c in mock_get_dict_table.call_args_list] == []
+        assert get_refresh_times(S3_MOCK_BUCKET_NAME)["currency"] == (
+            refresh_times["currency"]
+        )
+        assert get_refresh_times(S3_MOCK_BUCKET_NAME)["sales_order"] != (
+            refresh_times["sales_order"]
+        )
+
+
+class TestResumableExtraction:
+    rows = [[i, datetime(2024, 1, i)] for i in range(1, 11)]
+
+    def test_get_extract_checkpoint_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_extract_checkpoint() == "none"
+            assert get_extract_time_reserve() == 10
+
+    @patch.dict(os.environ, {"EXTRACT_CHECKPOINT": "mock-checkpoint"})
+    def test_get_extract_checkpoint_error(self):
+        with pytest.raises(IngestError) as e:
+            get_extract_checkpoint()
+        assert str(e.value) == "Unknown extract checkpoint. mock-checkpoint"
+
+    @pytest.mark.parametrize("value", ["-1", "nan", "mock-reserve"])
+    def test_get_extract_time_reserve_error(self, value):
+        with patch.dict(os.environ, {"EXTRACT_TIME_RESERVE": value}):
+            with pytest.raises(IngestError) as e:
+                get_extract_time_reserve()
+        assert str(e.value).startswith("Invalid extract time reserve.")
+
+    def test_multipart_writer_suspend_and_resume(self, s3, s3_bucket):
+        part_size = 5 * 1024 * 1024
+        writer = S3MultipartWriter(S3_MOCK_BUCKET_NAME, "k", part_size=part_size)
+        with writer:
+            writer.write(b"a" * (part_size + 3))
+            upload, buffer = writer.suspend()
+        assert buffer == b"aaa"
+        assert len(upload["parts"]) == 1
+        with S3MultipartWriter(
+            S3_MOCK_BUCKET_NAME, "k", part_size=part_size, **upload
+        ) as writer:
+            writer.write(buffer + b"b")
+        body = s3.get_object(Bucket=S3_MOCK_BUCKET_NAME, Key="k")["Body"].read()
+        assert body == b"a" * (part_size + 3) + b"b"
+
+    @patch.dict(os.environ, {"EXTRACT_CONCURRENCY": "1"})
+    @patch("src.extract.get_connection")
+    def test_extract_table_in_ranges_suspends_and_resumes(
+        self, mock_get_connection, s3, s3_bucket
+    ):
+        mock_get_connection.side_effect = lambda: make_range_connection(self.rows)
+        key_ranges = [(None, 4), (4, 8), (8, None)]
+        checkpoint = RunCheckpoint()
+        checkpoint.deadline = MagicMock()
+        checkpoint.deadline.expired.return_value = True
+        with resuming(checkpoint), pytest.raises(ExtractionPaused):
+            extract_table_in_ranges(
+                make_range_connection(self.rows),
+                S3_MOCK_BUCKET_NAME,
+                "t",
+                "2024-01-01",
+                "id",
+                "id",
+                key_ranges,
+                "ndjson.gz",
+            )
+        chunk = checkpoint.get_chunk("t")
+        assert chunk["next_range"] == 1
+        assert chunk["rows"] == 3
+        assert chunk["buffer_key"] == (
+            "checkpoints/latest/2024-01-01/t.ndjson.gz.1.buffer"
+        )
+
+        checkpoint.deadline.expired.return_value = False
+        with resuming(checkpoint):
+            row_count, watermark = extract_table_in_ranges(
+                make_range_connection(self.rows),
+                S3_MOCK_BUCKET_NAME,
+                "t",
+                "2024-01-01",
+                "id",
+                "id",
+                key_ranges,
+                "ndjson.gz",
+            )
+        assert row_count == 10
+        assert watermark == chunk["watermark"]
+        dict_table = get_dict_table_from_bucket(
+            S3_MOCK_BUCKET_NAME, "latest/2024-01-01/t.ndjson.gz", "ndjson.gz"
+        )
+        assert dict_table["id"] == list(range(1, 11))
+        objects = s3.list_objects_v2(Bucket=S3_MOCK_BUCKET_NAME, Prefix="checkpoints/")
+        assert "Contents" not in objects
+
+    @patch("src.extract.get_connection")
+    def test_extract_table_in_ranges_restarts_finished_upload(
+        self, mock_get_connection, s3, s3_bucket
+    ):
+        mock_get_connection.side_effect = lambda: make_range_connection(self.rows)
+        checkpoint = RunCheckpoint()
+        checkpoint.put_chunk(
+            "t",
+            {
+                "key": "latest/2024-01-01/t.ndjson",
+                "upload_id": "mock-upload",
+                "parts": [],
+            },
+        )
+        with resuming(checkpoint):
+            row_count, _ = extract_table_in_ranges(
+                make_range_connection(self.rows),
+                S3_MOCK_BUCKET_NAME,
+                "t",
+                "2024-01-01",
+                "id",
+                "id",
+                [(None, 6), (6, None)],
+                "ndjson",
+            )
+        assert row_count == 10
+
+    @patch.dict(
+        "os.environ",
+        {"S3_INGEST_BUCKET": S3_MOCK_BUCKET_NAME, "EXTRACT_CHECKPOINT": "resume"},
+    )
+    @patch("src.extract.Deadline.expired")
+    @patch("src.extract.get_dict_table")
+    @patch("src.extract.get_table_names")
+    @patch("src.extract.get_connection")
+    def test_lambda_handler_resumes_run(
+        self,
+        mock_get_connection,
+        mock_get_table_names,
+        mock_get_dict_table,
+        mock_expired,
+        s3,
+        s3_bucket,
+    ):
+        mock_get_table_names.return_value = ["currency", "sales_order"]
+        mock_get_dict_table.return_value = {"created_at": ["2024-01-01"]}
+        mock_expired.side_effect = [False, True]
+        response = lambda_handler({}, {})
+        assert response == {
+            "msg": "Ingestion paused",
+            "status": "continue",
+            "tables": ["currency"],
+        }
+        checkpoint = get_run_checkpoint(S3_MOCK_BUCKET_NAME)
+        assert checkpoint["done"] == {"currency": True}
+
+        mock_expired.side_effect = None
+        mock_expired.return_value = False
+        response = lambda_handler({}, {})
+        assert response == {
+            "msg": "Ingestion successful",
+            "tables": ["currency", "sales_order"],
+        }
+        assert [c.args[1] for c in mock_get_dict_table.call_args_list] == [
+            "currency",
+            "sales_order",
+        ]
+        date = format_date(datetime.fromisoformat(checkpoint["started_at"]))
+        assert get_manifest(S3_MOCK_BUCKET_NAME)["tables"]["sales_order"]["date"] == (
+            date
+        )
+        assert get_run_checkpoint(S3_MOCK_BUCKET_NAME) is None
+
+    @patch.dict(
+        "os.environ",
+        {"S3_INGEST_BUCKET": S3_MOCK_BUCKET_NAME, "EXTRACT_CHECKPOINT": "resume"},
+    )
+    @patch("src.extract.Deadline.expired")
+    @patch("src.extract.get_dict_table")
+    @patch("src.extract.get_table_names")
+    @patch("src.extract.get_connection")
+    def test_lambda_handler_resumes_run_after_hard_kill(
+        self,
+        mock_get_connection,
+        mock_get_table_names,
+        mock_get_dict_table,
+        mock_expired,
+        s3,
+        s3_bucket,
+    ):
+        mock_get_table_names.return_value = ["currency", "sales_order"]
+        mock_get_dict_table.return_value = {"created_at": ["2024-01-01"]}
+        mock_expired.side_effect = [False, True]
+        lambda_handler({}, {})
+        s3.put_object(
+            Body=json.dumps({"version": 1, "tables": {}}).encode(),
+            Bucket=S3_MOCK_BUCKET_NAME,
+            Key="manifest.json",
+        )
+        assert get_run_checkpoint(S3_MOCK_BUCKET_NAME)["done"] == {"currency": True}
+
+        mock_expired.side_effect = None
+        mock_expired.return_value = False
+        response = lambda_handler({}, {})
+        assert response["tables"] == ["currency", "sales_order"]
+        assert sorted(get_manifest(S3_MOCK_BUCKET_NAME)["tables"]) == [
+            "currency",
+            "sales_order",
+        ]
+
+    @patch.dict(
+        "os.environ",
+        {"S3_INGEST_BUCKET": S3_MOCK_BUCKET_NAME, "EXTRACT_CHECKPOINT": "resume"},
+    )
+    @patch("src.extract.Deadline.expired")
+    @patch("src.extract.get_table_names")
+    @patch("src.extract.get_connection")
+    def test_lambda_handler_without_progress(
+        self, mock_get_connection, mock_get_table_names, mock_expired, s3, s3_bucket
+    ):
+        mock_get_table_names.return_value = ["currency"]
+        mock_expired.return_value = True
+        response = lambda_handler({}, {})
+        assert response == {
+            "msg": "Failed to ingest data",
+            "err": "Failed to extract tables. No progress was made.",
+        }
+
+
+class TestChangeDataCapture:
+    changes = [
+        ("0/10", "BEGIN"),
+        ("0/11", "table public.t1: INSERT: id[integer]:3 name[text]:'c'"),
+        ("0/12", "COMMIT"),
+        ("0/20", "BEGIN"),
+        ("0/21", "table public.t1: DELETE: id[integer]:1"),
+        ("0/22", "table public.other: DELETE: id[integer]:1"),
+        ("0/23", "COMMIT"),
+    ]
+
+    def test_get_ingest_engine_default(self):
+        with patch.dict(os.environ, {}, clear=True):
+            assert get_ingest_engine() == "poll"
+
+    def test_get_ingest_engine_error(self):
+        with patch.dict(os.environ, {"INGEST_ENGINE": "mock-engine"}):
+            with pytest.raises(IngestError) as e:
+                get_ingest_engine()
+        assert str(e.value) == "Unknown ingest engine. mock-engine"
+
+    def test_store_and_get_cdc_checkpoint(self, s3, s3_bucket):
+        assert get_cdc_checkpoint(S3_MOCK_BUCKET_NAME) is None
+        store_cdc_checkpoint(S3_MOCK_BUCKET_NAME, {"slot": "s", "lsn": "0/12"})
+        assert get_cdc_checkpoint(S3_MOCK_BUCKET_NAME) == {"slot": "s", "lsn": "0/12"}
+
+    def put_base_segment(self):
+        store_table_in_bucket(
+            S3_MOCK_BUCKET_NAME,
+            {"id": [1, 2], "name": ["a", "b"]},
+            "t1",
+            "base",
+            "ndjson",
+            "segments/t1/base.ndjson",
+        )
+        store_segment_manifest(
+            S3_MOCK_BUCKET_NAME,
+            "t1",
+            {
+                "table": "t1",
+                "primary_key": "id",
+                "segments": [
+                    {"key": "segments/t1/base.ndjson", "format": "ndjson", "rows": 2}
+                ],
+            },
+        )
+
+    @patch("src.extract.advance_slot")
+    @patch("src.extract.peek_changes")
+    @patch("src.extract.create_slot_if_missing")
+    def test_ingest_changes(
+        self, mock_create_slot, mock_peek_changes, mock_advance_slot, s3, s3_bucket
+    ):
+        self.put_base_segment()
+        mock_peek_changes.return_value = self.changes
+        conn = MagicMock()
+        updated = ingest_changes(S3_MOCK_BUCKET_NAME, conn, ["t1"], "run", "ndjson")
+        assert updated == ["t1"]
+        manifest = get_segment_manifest(S3_MOCK_BUCKET_NAME, "t1")
+        assert manifest["segments"][-1] == {
+            "key": "segments/t1/run.changes.ndjson",
+            "format": "ndjson",
+            "rows": 2,
+            "kind": "changes",
+            "lsn": "0/23",
+        }
+        dict_table = get_dict_table_from_bucket(
+            S3_MOCK_BUCKET_NAME, "segments/t1/run.changes.ndjson", "ndjson"
+        )
+        assert dict_table == {
+            "id": [3, 1],
+            "name": ["c", None],
+            "cdc_op": ["I", "D"],
+        }
+        assert get_cdc_checkpoint(S3_MOCK_BUCKET_NAME) == {
+            "slot": "totesys_ingest",
+            "lsn": "0/23",
+        }
+        mock_advance_slot.assert_called_once_with(conn, "totesys_ingest", "0/23")
+
+    @patch("src.extract.advance_slot")
+    @patch("src.extract.peek_changes")
+    @patch("src.extract.create_slot_if_missing")
+    def test_ingest_changes_skips_checkpointed_transactions(
+        self, mock_create_slot, mock_peek_changes, mock_advance_slot, s3, s3_bucket
+    ):
+        self.put_base_segment()
+        store_cdc_checkpoint(
+            S3_MOCK_BUCKET_NAME, {"slot": "totesys_ingest", "lsn": "0/23"}
+        )
+        mock_peek_changes.return_value = self.changes
+        updated = ingest_changes(
+            S3_MOCK_BUCKET_NAME, MagicMock(), ["t1"], "run", "ndjson"
+        )
+        assert updated == []
+        assert len(get_segment_manifest(S3_MOCK_BUCKET_NAME, "t1")["segments"]) == 1
+        mock_advance_slot.assert_not_called()
+
+    @patch("src.extract.append_table_segment")
+    @patch("src.extract.advance_slot")
+    @patch("src.extract.peek_changes")
+    @patch("src.extract.create_slot_if_missing")
+    def test_ingest_changes_extracts_base_segments_after_creating_slot(
+        self,
+        mock_create_slot,
+        mock_peek_changes,
+        mock_advance_slot,
+        mock_append_table_segment,
+        s3,
+        s3_bucket,
+    ):
+        order = []
+        mock_create_slot.side_effect = lambda *args: order.append("slot")
+
+        def append_table_segment(bucket, table_name, *args):
+            order.append(table_name)
+            return True
+
+        mock_append_table_segment.side_effect = append_table_segment
+        mock_peek_changes.return_value = []
+        conn = MagicMock()
+        updated = ingest_changes(S3_MOCK_BUCKET_NAME, conn, ["t1", "t2"], "run", "json")
+        assert updated == ["t1", "t2"]
+        assert order == ["slot", "t1", "t2"]
+        mock_append_table_segment.assert_called_with(
+            S3_MOCK_BUCKET_NAME, "t2", "run", conn, "watermark", "json"
+        )
+
+    @patch("src.extract.advance_slot")
+    @patch("src.extract.peek_changes")
+    @patch("src.extract.create_slot_if_missing")
+    def test_ingest_changes_error(
+        self, mock_create_slot, mock_peek_changes, mock_advance_slot, s3, s3_bucket
+    ):
+        self.put_base_segment()
+        mock_peek_changes.side_effect = DatabaseError("Mock DB error")
+        with pytest.raises(IngestError) as e:
+            ingest_changes(S3_MOCK_BUCKET_NAME, MagicMock(), ["t1"], "run", "json")
+        assert str(e.value) == "Failed to read replication slot. Mock DB error"
+
+    @patch.dict(
+        "os.environ",
+        {
+            "S3_INGEST_BUCKET": S3_MOCK_BUCKET_NAME,
+            "INGEST_ENGINE": "cdc",
+            "INGEST_LAYOUT": "segments",
+            "INGEST_FORMAT": "ndjson",
+            "RUN_METRICS": "manifest",
+        },
+    )
+    @patch("src.extract.advance_slot")
+    @patch("src.extract.peek_changes")
+    @patch("src.extract.create_slot_if_missing")
+    @patch("src.extract.get_table_names")
+    @patch("src.extract.get_connection")
+    def test_lambda_handler_cdc_records_metrics(
+        self,
+        mock_get_connection,
+        mock_get_table_names,
+        mock_create_slot,
+        mock_peek_changes,
+        mock_advance_slot,
+        s3,
+        s3_bucket,
+    ):
+        self.put_base_segment()
+        mock_get_table_names.return_value = ["t1"]
+        mock_peek_changes.return_value = self.changes
+        response = lambda_handler({}, {})
+        assert response["tables"] == ["t1"]
+        assert response["run"]["tables"]["t1"]["rows"] == 2
+        assert response["run"]["tables"]["t1"]["bytes"] > 0
+
+    @patch.dict(
+        "os.environ",
+        {"S3_INGEST_BUCKET": S3_MOCK_BUCKET_NAME, "INGEST_ENGINE": "cdc"},
+    )
+    @patch("src.extract.get_connection")
+    def test_lambda_handler_cdc_needs_segments_layout(self, mock_get_connection):
+        response = lambda_handler({}, {})
+        assert response == {
+            "msg": "Failed to ingest data",
+            "err": "Failed to ingest changes. Needs segments layout.",
+        }
+
+
 @patch("logging.critical")
 @patch("src.extract.get_dict_table")
-@patch("src.extract.store_date_in_bucket")
-@patch("src.extract.delete_table")
+@patch("src.extract.store_manifest")
 @patch("src.extract.store_table_in_bucket")
 @patch("src.extract.update_dict_table")
-@patch("src.extract.copy_table")
-@patch("src.extract.get_date")
 @patch("src.extract.get_table_names")
-@patch("src.extract.is_bucket_empty")
+@patch("src.extract.get_manifest")
 @patch("src.extract.get_connection")
 @patch.dict("os.environ", {"S3_INGEST_BUCKET": S3_MOCK_BUCKET_NAME})
 def test_lambda_handler(
     mock_conn,
-    mock_is_bucket_empty,
+    mock_get_manifest,
     mock_get_table_names,
-    mock_get_date,
-    mock_copy_table,
     mock_update_dict_table,
     mock_store_table_in_bucket,
-    mock_delete_table,
-    mock_store_date_in_bucket,
+    mock_store_manifest,
     mock_get_dict_table,
     mock_logging,
     aws_credentials,
 ):
-    mock_is_bucket_empty.return_value = True
+    mock_get_manifest.return_value = None
     assert lambda_handler("", "") == {"msg": "Ingestion successful", 'tables': []}
-    mock_is_bucket_empty.return_value = False
+    mock_store_manifest.assert_called_once()
+    mock_get_manifest.return_value = {"version": 1, "tables": {}}
     assert lambda_handler("", "") == {"msg": "Ingestion successful", 'tables': []}
+    assert mock_store_manifest.call_count == 1
     mock_conn.side_effect = IngestError("Connection mocked exception")
+    db_connection.close()
     error_response = lambda_handler("", "")
     assert error_response == {
         "msg": "Failed to ingest data",
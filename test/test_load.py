@@ -4,6 +4,7 @@ import boto3
 import pytest
 import unittest
 from unittest.mock import patch, MagicMock
+from pg8000.exceptions import DatabaseError
 from src.load import (
     lambda_handler,
     LoadError,
@@ -123,6 +124,29 @@ class TestConnection:
         )
 
 
+class TestConnectionSecrets:
+    @patch("pg8000.dbapi.connect")
+    @patch("src.load.get_secrets")
+    def test_get_connection_caches_secrets(self, mock_get_secrets, mock_pg_conn):
+        mock_get_secrets.return_value = {"database": "wh_db"}
+        get_connection()
+        get_connection()
+        mock_get_secrets.assert_called_once()
+
+    @patch("pg8000.dbapi.connect")
+    @patch("src.load.get_secrets")
+    def test_get_connection_refreshes_secrets_on_auth_failure(
+        self, mock_get_secrets, mock_pg_conn
+    ):
+        mock_get_secrets.side_effect = [{"password": "old"}, {"password": "new"}]
+        mock_pg_conn.side_effect = [
+            DatabaseError({"C": "28P01", "M": "password authentication failed"}),
+            MagicMock(),
+        ]
+        get_connection()
+        assert mock_pg_conn.call_args_list[-1].kwargs == {"password": "new"}
+
+
 class TestLambdaHandler:
     @patch("src.load.get_connection")
     @patch("src.load.get_table_df_from_parquet")
@@ -0,0 +1,80 @@
+import threading
+from unittest.mock import MagicMock, patch
+from src.metrics import (
+    TableMetrics,
+    MeteredConnection,
+    measuring,
+    current_metrics,
+    timing,
+)
+
+
+class TestTableMetrics:
+    def test_add(self):
+        metrics = TableMetrics()
+        metrics.add(rows=2)
+        metrics.add(rows=3, written=100)
+        metrics.watermark = {"offset": 2}
+        assert metrics.as_dict() == {
+            "rows": 5,
+            "bytes": 100,
+            "query_seconds": 0.0,
+            "s3_seconds": 0.0,
+            "watermark": {"offset": 2},
+        }
+
+    def test_from_dict(self):
+        metrics = TableMetrics()
+        metrics.add(rows=5, written=100)
+        metrics.add_time("s3", 0.5)
+        assert TableMetrics.from_dict(metrics.as_dict()).as_dict() == (
+            metrics.as_dict()
+        )
+
+    def test_current_metrics(self):
+        metrics = TableMetrics()
+        assert current_metrics() is not metrics
+        with measuring(metrics):
+            assert current_metrics() is metrics
+            with measuring(None):
+                assert current_metrics() is not metrics
+            assert current_metrics() is metrics
+
+    def test_measuring_is_per_thread(self):
+        metrics = TableMetrics()
+        seen = []
+        with measuring(metrics):
+            thread = threading.Thread(target=lambda: seen.append(current_metrics()))
+            thread.start()
+            thread.join()
+        assert seen[0] is not metrics
+
+
+class TestTiming:
+    @patch("src.metrics.time.perf_counter")
+    def test_nested_timers_are_exclusive(self, mock_perf_counter):
+        mock_perf_counter.side_effect = [0.0, 1.0, 3.0, 4.0]
+        metrics = TableMetrics()
+        with measuring(metrics):
+            with timing("query"):
+                with timing("s3"):
+                    pass
+        assert metrics.seconds == {"query": 2.0, "s3": 2.0}
+
+    def test_timing_without_metrics(self):
+        with timing("query"):
+            pass
+
+    @patch("src.metrics.time.perf_counter")
+    def test_metered_connection(self, mock_perf_counter):
+        mock_perf_counter.side_effect = [0.0, 0.5]
+        conn = MagicMock()
+        conn.run.return_value = [[1]]
+        conn.columns = [{"name": "id"}]
+        metered = MeteredConnection(conn)
+        metrics = TableMetrics()
+        with measuring(metrics):
+            assert metered.run("SELECT :a", a=1) == [[1]]
+        conn.run.assert_called_once_with("SELECT :a", a=1)
+        assert metered.columns == [{"name": "id"}]
+        assert metrics.seconds["query"] == 0.5
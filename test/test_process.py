@@ -2,6 +2,7 @@ import pytest
 import os
 import io
 import json
+import gzip
 import pandas as pd
 from botocore.exceptions import ClientError
 from unittest.mock import patch, MagicMock
@@ -9,6 +10,12 @@ from moto import mock_aws
 import boto3
 from src.process import (
     get_dataframe_from_table_json,
+    get_dataframe_from_bytes,
+    get_dataframe_from_segments,
+    get_table_location,
+    segment_cache,
+    read_cache,
+    expire_read_cache,
     ProcessError,
     get_dim_staff,
     get_dim_location,
@@ -18,16 +25,23 @@ from src.process import (
     get_dim_counterparty,
     get_dim_payment_type,
     get_dim_transaction,
+    split_timestamps,
     get_fact_payment,
     get_fact_purchase_order,
     get_fact_sales_order,
     get_bucket_name,
     get_date,
     get_dim_date,
+    get_dim_date_index,
+    store_dim_date_index,
     df_to_parquet,
     store_parquet_file,
     lambda_handler,
+    get_process_concurrency,
+    get_transforms_to_run,
+    run_transforms,
 )
+from src.load import get_dataframe_values
 
 S3_MOCK_BUCKET_NAME = "mock-bucket-1"
 MOCK_TABLE_NAME = "mock_table"
@@ -82,6 +96,16 @@ def test_get_date(s3, s3_bucket_latest_date):
     assert get_date(S3_MOCK_BUCKET_NAME) == "2024-8-22"
 
 
+def test_get_date_is_read_once_per_invocation(s3, s3_bucket_latest_date):
+    assert get_date(S3_MOCK_BUCKET_NAME) == "2024-8-22"
+    s3.put_object(
+        Body="2024-8-23".encode(), Bucket=S3_MOCK_BUCKET_NAME, Key="latest_date"
+    )
+    assert get_date(S3_MOCK_BUCKET_NAME) == "2024-8-22"
+    expire_read_cache()
+    assert get_date(S3_MOCK_BUCKET_NAME) == "2024-8-23"
+
+
 def test_get_date_error(s3, s3_bucket):
     with pytest.raises(ProcessError) as e:
         get_date(S3_MOCK_BUCKET_NAME)
@@ -102,6 +126,117 @@ def test_table_json_to_dataframe_success(s3, s3_bucket_latest_date):
     assert df.equals(pd.DataFrame(MOCK_JSON_TABLE))
 
 
+@patch.dict(os.environ, {"INGEST_FORMAT": "ndjson"})
+def test_table_ndjson_to_dataframe_success(s3, s3_bucket_latest_date):
+    s3.put_object(
+        Body=b'{"column1": "data1", "column2": "data3"}\n'
+        b'{"column1": "data2", "column2": "data4"}\n',
+        Bucket=S3_MOCK_BUCKET_NAME,
+        Key=f"latest/2024-8-22/{MOCK_TABLE_NAME}.ndjson",
+    )
+    df = get_dataframe_from_table_json(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    assert df.equals(pd.DataFrame(MOCK_JSON_TABLE))
+
+
+def test_get_dataframe_from_bytes_ndjson_gz():
+    body = gzip.compress(
+        b'{"schema": [{"name": "column1", "type": "text"},'
+        b' {"name": "column2", "type": "text"}]}\n'
+        b'["data1", "data3"]\n["data2", "data4"]\n'
+    )
+    df = get_dataframe_from_bytes(body, "ndjson.gz")
+    assert df.equals(pd.DataFrame(MOCK_JSON_TABLE))
+
+
+def test_get_dataframe_from_bytes_ndjson_gz_empty_table():
+    body = gzip.compress(b'{"schema": [{"name": "column1", "type": "text"}]}\n')
+    df = get_dataframe_from_bytes(body, "ndjson.gz")
+    assert list(df.columns) == ["column1"]
+    assert len(df) == 0
+
+
+def test_get_dataframe_from_bytes_csv_gz():
+    body = gzip.compress(
+        b'{"schema": [{"name": "id", "type": "integer"},'
+        b' {"name": "name", "type": "text"},'
+        b' {"name": "paid", "type": "boolean"},'
+        b' {"name": "amount", "type": "numeric"}]}\n'
+        b'1,"A, B",t,1.50\n'
+        b"2,\\N,f,2.25\n"
+        b'3,"",t,3.00\n'
+    )
+    df = get_dataframe_from_bytes(body, "csv.gz")
+    assert list(df["id"]) == [1, 2, 3]
+    assert df["name"][0] == "A, B"
+    assert pd.isna(df["name"][1])
+    assert df["name"][2] == ""
+    assert list(df["paid"]) == [True, False, True]
+    assert list(df["amount"]) == ["1.50", "2.25", "3.00"]
+
+
+def test_get_dataframe_from_bytes_csv_gz_empty_table():
+    body = gzip.compress(b'{"schema": [{"name": "id", "type": "integer"}]}\n')
+    df = get_dataframe_from_bytes(body, "csv.gz")
+    assert list(df.columns) == ["id"]
+    assert len(df) == 0
+
+
+def test_get_dataframe_from_bytes_parquet():
+    buffer = io.BytesIO()
+    pd.DataFrame(
+        {
+            "column1": ["data1", "data2"],
+            "created_at": pd.to_datetime(["2024-01-01 09:30:00", "2024-01-02 00:00:00"]),
+        }
+    ).to_parquet(buffer)
+    df = get_dataframe_from_bytes(buffer.getvalue(), "parquet")
+    assert list(df["created_at"]) == ["2024-01-01 09:30:00", "2024-01-02 00:00:00"]
+
+
+@patch("src.process.get_dataframe_from_bytes", wraps=get_dataframe_from_bytes)
+def test_table_json_is_parsed_once(
+    mock_get_dataframe_from_bytes, s3, s3_bucket_latest_date
+):
+    s3.put_object(
+        Body=json.dumps(MOCK_JSON_TABLE).encode(),
+        Bucket=S3_MOCK_BUCKET_NAME,
+        Key=f"latest/2024-8-22/{MOCK_TABLE_NAME}.json",
+    )
+    df = get_dataframe_from_table_json(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    df["column1"] = ["changed", "changed"]
+    expire_read_cache()
+    df = get_dataframe_from_table_json(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    assert df.equals(pd.DataFrame(MOCK_JSON_TABLE))
+    assert mock_get_dataframe_from_bytes.call_count == 1
+    s3.put_object(
+        Body=json.dumps({"column1": ["data5"]}).encode(),
+        Bucket=S3_MOCK_BUCKET_NAME,
+        Key=f"latest/2024-8-22/{MOCK_TABLE_NAME}.json",
+    )
+    expire_read_cache()
+    df = get_dataframe_from_table_json(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    assert list(df["column1"]) == ["data5"]
+    assert mock_get_dataframe_from_bytes.call_count == 2
+
+
+def test_table_json_cache_keeps_current_key_only(s3, s3_bucket_latest_date):
+    for date in ("2024-8-22", "2024-8-23"):
+        s3.put_object(
+            Body=json.dumps(MOCK_JSON_TABLE).encode(),
+            Bucket=S3_MOCK_BUCKET_NAME,
+            Key=f"latest/{date}/{MOCK_TABLE_NAME}.json",
+        )
+    get_dataframe_from_table_json(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    s3.put_object(
+        Body="2024-8-23".encode(), Bucket=S3_MOCK_BUCKET_NAME, Key="latest_date"
+    )
+    expire_read_cache()
+    get_dataframe_from_table_json(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    assert [key for _, key in read_cache if key.startswith("latest/")] == [
+        f"latest/2024-8-23/{MOCK_TABLE_NAME}.json"
+    ]
+
+
 def test_table_json_to_dataframe_error(s3_bucket_latest_date):
     with pytest.raises(ProcessError) as e:
         get_dataframe_from_table_json(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
@@ -112,6 +247,166 @@ def test_table_json_to_dataframe_error(s3_bucket_latest_date):
     )
 
 
+def test_table_json_to_dataframe_from_manifest(s3, s3_bucket):
+    key = f"latest/2024-8-21/{MOCK_TABLE_NAME}.ndjson"
+    s3.put_object(
+        Body=b'{"column1": "data1", "column2": "data3"}\n'
+        b'{"column1": "data2", "column2": "data4"}\n',
+        Bucket=S3_MOCK_BUCKET_NAME,
+        Key=key,
+    )
+    s3.put_object(
+        Body=json.dumps(
+            {
+                "version": 2,
+                "date": "2024-8-22",
+                "tables": {
+                    MOCK_TABLE_NAME: {
+                        "key": key,
+                        "date": "2024-8-21",
+                        "format": "ndjson",
+                    }
+                },
+            }
+        ).encode(),
+        Bucket=S3_MOCK_BUCKET_NAME,
+        Key="manifest.json",
+    )
+    df = get_dataframe_from_table_json(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    assert df.equals(pd.DataFrame(MOCK_JSON_TABLE))
+
+
+def test_get_table_location_missing_table(s3, s3_bucket):
+    s3.put_object(
+        Body=json.dumps({"version": 1, "tables": {}}).encode(),
+        Bucket=S3_MOCK_BUCKET_NAME,
+        Key="manifest.json",
+    )
+    with pytest.raises(ProcessError) as e:
+        get_table_location(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    assert str(e.value) == "Failed to find table in manifest. 'mock_table'"
+
+
+def put_segments(s3, segments, primary_key=None):
+    manifest = {"table": MOCK_TABLE_NAME, "primary_key": primary_key, "segments": []}
+    for i, rows in enumerate(segments):
+        key = f"segments/{MOCK_TABLE_NAME}/2024010{i}T000000.ndjson"
+        s3.put_object(
+            Body="".join(json.dumps(row) + "\n" for row in rows).encode(),
+            Bucket=S3_MOCK_BUCKET_NAME,
+            Key=key,
+        )
+        manifest["segments"].append({"key": key, "format": "ndjson", "rows": len(rows)})
+    s3.put_object(
+        Body=json.dumps(manifest).encode(),
+        Bucket=S3_MOCK_BUCKET_NAME,
+        Key=f"segments/{MOCK_TABLE_NAME}/manifest.json",
+    )
+
+
+@patch.dict(os.environ, {"INGEST_LAYOUT": "segments"})
+def test_table_segments_to_dataframe_success(s3, s3_bucket):
+    put_segments(
+        s3,
+        [
+            [{"id": 1, "name": "A"}, {"id": 2, "name": "B"}],
+            [{"id": 2, "name": "B2"}, {"id": 3, "name": "C"}],
+        ],
+        primary_key="id",
+    )
+    df = get_dataframe_from_table_json(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    assert df.equals(pd.DataFrame({"id": [1, 2, 3], "name": ["A", "B2", "C"]}))
+
+
+def test_get_dataframe_from_segments_applies_changes(s3, s3_bucket):
+    put_segments(
+        s3,
+        [
+            [{"id": 1, "dept": 10}, {"id": 2, "dept": 20}, {"id": 3, "dept": 30}],
+            [
+                {"id": 2, "dept": None, "cdc_op": "D"},
+                {"id": 3, "dept": 31, "cdc_op": "U"},
+                {"id": 4, "dept": 40, "cdc_op": "I"},
+                {"id": 1, "dept": None, "cdc_op": "D"},
+                {"id": 1, "dept": 11, "cdc_op": "I"},
+            ],
+        ],
+        primary_key="id",
+    )
+    df = get_dataframe_from_segments(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    assert df.equals(pd.DataFrame({"id": [1, 3, 4], "dept": [11, 31, 40]}))
+
+
+def test_get_dataframe_from_segments_keeps_updated_rows_in_place(s3, s3_bucket):
+    put_segments(
+        s3,
+        [
+            [{"id": 1, "dept": 10}, {"id": 2, "dept": 20}],
+            [{"id": 1, "dept": 11, "cdc_op": "U"}, {"id": 3, "dept": 30, "cdc_op": "I"}],
+        ],
+        primary_key="id",
+    )
+    df = get_dataframe_from_segments(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    assert df.equals(pd.DataFrame({"id": [1, 2, 3], "dept": [11, 20, 30]}))
+    conn = MagicMock()
+    conn.cursor.return_value.fetchone.return_value = [2]
+    assert get_dataframe_values(df, conn, "dim_mock") == [[3, 30]]
+
+
+def test_get_dataframe_from_segments_reads_only_new_segments(s3, s3_bucket):
+    put_segments(s3, [[{"id": 1}]])
+    get_dataframe_from_segments(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    first_key = f"segments/{MOCK_TABLE_NAME}/20240100T000000.ndjson"
+    assert list(segment_cache) == [first_key]
+    put_segments(s3, [[{"id": 1}], [{"id": 2}]])
+    s3.delete_object(Bucket=S3_MOCK_BUCKET_NAME, Key=first_key)
+    expire_read_cache()
+    df = get_dataframe_from_segments(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    assert list(df["id"]) == [1, 2]
+    assert len(segment_cache) == 2
+
+
+def test_get_dataframe_from_segments_drops_unlisted_segments(s3, s3_bucket):
+    put_segments(s3, [[{"id": 1}], [{"id": 2}]])
+    get_dataframe_from_segments(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    assert len(segment_cache) == 2
+    s3.put_object(
+        Body=json.dumps(
+            {
+                "table": MOCK_TABLE_NAME,
+                "primary_key": None,
+                "segments": [
+                    {
+                        "key": f"segments/{MOCK_TABLE_NAME}/20240101T000000.ndjson",
+                        "format": "ndjson",
+                        "rows": 1,
+                    }
+                ],
+            }
+        ).encode(),
+        Bucket=S3_MOCK_BUCKET_NAME,
+        Key=f"segments/{MOCK_TABLE_NAME}/manifest.json",
+    )
+    expire_read_cache()
+    df = get_dataframe_from_segments(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    assert list(df["id"]) == [2]
+    assert list(segment_cache) == [f"segments/{MOCK_TABLE_NAME}/20240101T000000.ndjson"]
+
+
+def test_get_dataframe_from_segments_does_not_share_cached_frames(s3, s3_bucket):
+    put_segments(s3, [[{"id": 1}]])
+    df = get_dataframe_from_segments(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    df["id"] = [10]
+    df = get_dataframe_from_segments(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    assert list(df["id"]) == [1]
+
+
+def test_get_dataframe_from_segments_error(s3, s3_bucket):
+    with pytest.raises(ProcessError) as e:
+        get_dataframe_from_segments(S3_MOCK_BUCKET_NAME, MOCK_TABLE_NAME)
+    assert str(e.value).startswith("Failed to get segment manifest.")
+
+
 @pytest.fixture
 def sample_staff():
     return pd.DataFrame(
@@ -524,6 +819,34 @@ def test_get_dim_transaction_type_error(mock_df_drop, sample_transaction):
     assert str(e.value) == "Failed to get dim_transaction. Mock exception"
 
 
+def test_split_timestamps():
+    df = pd.DataFrame(
+        {
+            "created_at": ["2022-11-03 14:20:52.187000", "2023-01-01 00:00:00"],
+            "last_updated": ["2022-11-04 09:00:00", "2023-01-02 23:59:59.5"],
+        },
+        index=[5, 6],
+    )
+    result = split_timestamps(df)
+    assert list(result["created_date"]) == ["2022-11-03", "2023-01-01"]
+    assert list(result["created_time"]) == ["14:20:52.187000", "00:00:00"]
+    assert list(result["last_updated_date"]) == ["2022-11-04", "2023-01-02"]
+    assert list(result["last_updated_time"]) == ["09:00:00", "23:59:59.5"]
+
+
+def test_split_timestamps_empty_table():
+    df = pd.DataFrame({"created_at": [], "last_updated": []}, dtype=object)
+    result = split_timestamps(df)
+    assert len(result) == 0
+    assert "last_updated_time" in result.columns
+
+
+def test_split_timestamps_error():
+    df = pd.DataFrame({"created_at": ["2022-11-03"], "last_updated": ["x y"]})
+    with pytest.raises(ValueError):
+        split_timestamps(df)
+
+
 @pytest.fixture(scope="function")
 def sample_payment():
     return pd.DataFrame(
@@ -765,6 +1088,120 @@ def test_get_dim_date(s3_bucket, sample_sales_order):
     assert expected.sort_values(by="date_id", ignore_index=True).equals(result)
 
 
+def test_get_dim_date_adds_only_new_dates(s3, s3_bucket, sample_sales_order):
+    fact_sales_order = get_fact_sales_order(sample_sales_order)
+    dim_date = get_dim_date(S3_MOCK_BUCKET_NAME, fact_sales_order, None, None)
+    store_parquet_file(S3_MOCK_BUCKET_NAME, df_to_parquet(dim_date), "dim_date")
+    store_dim_date_index(S3_MOCK_BUCKET_NAME, dim_date)
+    expire_read_cache()
+    assert get_dim_date(S3_MOCK_BUCKET_NAME, fact_sales_order, None, None) is None
+    fact_payment = pd.DataFrame(
+        {
+            "created_date": ["2023-01-01", "2022-12-31"],
+            "last_updated_date": ["2023-01-01", "2023-01-01"],
+            "payment_date": ["2024-02-29", "2023-01-02"],
+        }
+    )
+    expire_read_cache()
+    result = get_dim_date(S3_MOCK_BUCKET_NAME, None, fact_payment, None)
+    pd.testing.assert_frame_equal(
+        result.head(len(dim_date)), dim_date, check_dtype=False
+    )
+    new_rows = result.tail(2)
+    assert list(new_rows["date_id"].dt.strftime("%Y-%m-%d")) == [
+        "2022-12-31",
+        "2024-02-29",
+    ]
+    assert list(new_rows["day_name"]) == ["Saturday", "Thursday"]
+    assert list(new_rows["quarter"]) == [4, 1]
+
+
+def test_get_dim_date_with_stale_index(s3, s3_bucket, sample_sales_order):
+    fact_sales_order = get_fact_sales_order(sample_sales_order)
+    dim_date = get_dim_date(S3_MOCK_BUCKET_NAME, fact_sales_order, None, None)
+    store_parquet_file(S3_MOCK_BUCKET_NAME, df_to_parquet(dim_date), "dim_date")
+    store_dim_date_index(S3_MOCK_BUCKET_NAME, dim_date)
+    fact_payment = pd.DataFrame(
+        {
+            "created_date": ["2023-01-01"],
+            "last_updated_date": ["2023-01-01"],
+            "payment_date": ["2024-02-29"],
+        }
+    )
+    expire_read_cache()
+    stored = get_dim_date(S3_MOCK_BUCKET_NAME, None, fact_payment, None)
+    store_parquet_file(S3_MOCK_BUCKET_NAME, df_to_parquet(stored), "dim_date")
+    expire_read_cache()
+    result = get_dim_date(S3_MOCK_BUCKET_NAME, None, fact_payment, None)
+    assert result["date_id"].is_unique
+    pd.testing.assert_frame_equal(result, stored, check_dtype=False)
+
+
+def test_get_dim_date_index_from_stored_dim_date(s3, s3_bucket, sample_sales_order):
+    dim_date = get_dim_date(
+        S3_MOCK_BUCKET_NAME, get_fact_sales_order(sample_sales_order), None, None
+    )
+    store_parquet_file(S3_MOCK_BUCKET_NAME, df_to_parquet(dim_date), "dim_date")
+    index = get_dim_date_index(S3_MOCK_BUCKET_NAME)
+    assert index.dtype == "datetime64[D]"
+    assert list(index.astype(str)) == list(dim_date["date_id"].dt.strftime("%Y-%m-%d"))
+
+
+@patch.dict(os.environ, {"DIM_DATE_MODE": "spine", "DIM_DATE_SPINE": "2022-2023"})
+def test_get_dim_date_spine(s3, s3_bucket, sample_sales_order):
+    fact_sales_order = get_fact_sales_order(sample_sales_order)
+    dim_date = get_dim_date(S3_MOCK_BUCKET_NAME, fact_sales_order, None, None)
+    assert len(dim_date) == 730
+    assert str(dim_date["date_id"].iloc[0].date()) == "2022-01-01"
+    assert str(dim_date["date_id"].iloc[-1].date()) == "2023-12-31"
+    store_parquet_file(S3_MOCK_BUCKET_NAME, df_to_parquet(dim_date), "dim_date")
+    store_dim_date_index(S3_MOCK_BUCKET_NAME, dim_date)
+    expire_read_cache()
+    assert get_dim_date(S3_MOCK_BUCKET_NAME, fact_sales_order, None, None) is None
+    fact_payment = pd.DataFrame(
+        {
+            "created_date": ["2023-06-01"],
+            "last_updated_date": ["2023-06-01"],
+            "payment_date": ["2024-02-29"],
+        }
+    )
+    result = get_dim_date(S3_MOCK_BUCKET_NAME, None, fact_payment, None)
+    assert len(result) == 730 + 366
+    assert str(result["date_id"].iloc[-1].date()) == "2024-12-31"
+
+
+@patch.dict(os.environ, {"DIM_DATE_MODE": "spine"})
+def test_get_dim_date_spine_fills_gaps(s3, s3_bucket):
+    dim_date = pd.DataFrame({"date_id": pd.to_datetime(["2020-01-01", "2035-12-31"])})
+    store_dim_date_index(S3_MOCK_BUCKET_NAME, dim_date)
+    fact_payment = pd.DataFrame(
+        {
+            "created_date": ["2023-06-01"],
+            "last_updated_date": ["2023-06-01"],
+            "payment_date": ["2023-06-02"],
+        }
+    )
+    result = get_dim_date(S3_MOCK_BUCKET_NAME, None, fact_payment, None)
+    assert len(result) == 16 * 365 + 4 - 2
+
+
+@pytest.mark.parametrize(
+    "env, message",
+    [
+        ({"DIM_DATE_MODE": "calendar"}, "Unknown dim_date mode. calendar"),
+        (
+            {"DIM_DATE_MODE": "spine", "DIM_DATE_SPINE": "2035-2020"},
+            "Invalid dim_date spine. 2035-2020",
+        ),
+    ],
+)
+def test_get_dim_date_mode_error(s3, s3_bucket, env, message):
+    with patch.dict(os.environ, env):
+        with pytest.raises(ProcessError) as e:
+            get_dim_date(S3_MOCK_BUCKET_NAME, None, None, None)
+    assert str(e.value) == f"Failed to get dim_date. {message}"
+
+
 @patch("pandas.concat")
 def test_get_dim_date_error(mock_concat, sample_sales_order):
     mock_concat.side_effect = Exception("Mock exception")
@@ -812,6 +1249,7 @@ def test_store_parquet_file_error(s3):
     )
 
 
+@patch("src.process.store_dim_date_index")
 @patch("src.process.store_parquet_file")
 @patch("src.process.df_to_parquet")
 @patch("src.process.get_dim_date")
@@ -848,6 +1286,7 @@ def test_lambda_handler(
     mock_get_dim_date,
     mock_df_to_parquet,
     mock_store_parquet_file,
+    mock_store_dim_date_index,
 ):
     event = {
         "tables": [
@@ -880,3 +1319,102 @@ def test_lambda_handler(
             "fact_sales_order",
         ],
     }
+
+
+def test_get_transforms_to_run():
+    assert get_transforms_to_run([]) == []
+    assert get_transforms_to_run(["department"]) == ["dim_staff"]
+    assert get_transforms_to_run(["address"]) == ["dim_location", "dim_counterparty"]
+    assert get_transforms_to_run(["payment"]) == ["fact_payment", "dim_date"]
+
+
+def test_get_process_concurrency():
+    with patch.dict(os.environ):
+        os.environ.pop("PROCESS_CONCURRENCY", None)
+        assert get_process_concurrency() == 1
+    with patch.dict(os.environ, {"PROCESS_CONCURRENCY": "4"}):
+        assert get_process_concurrency() == 4
+
+
+@patch.dict(os.environ, {"PROCESS_CONCURRENCY": "0"})
+def test_get_process_concurrency_error():
+    with pytest.raises(ProcessError):
+        get_process_concurrency()
+    with patch.dict(os.environ, {"PROCESS_CONCURRENCY": "many"}):
+        with pytest.raises(ProcessError):
+            get_process_concurrency()
+
+
+@patch("src.process.get_dataframe_from_bytes", wraps=get_dataframe_from_bytes)
+@patch("src.process.store_parquet_file")
+@patch("src.process.get_dim_counterparty")
+@patch("src.process.get_dim_location")
+def test_run_transforms_loads_shared_inputs_once(
+    mock_get_dim_location,
+    mock_get_dim_counterparty,
+    mock_store_parquet_file,
+    mock_get_dataframe_from_bytes,
+    s3,
+    s3_bucket_latest_date,
+):
+    for table_name in ("address", "counterparty"):
+        s3.put_object(
+            Body=json.dumps({"name": [table_name]}).encode(),
+            Bucket=S3_MOCK_BUCKET_NAME,
+            Key=f"latest/2024-8-22/{table_name}.json",
+        )
+
+    def get_dim_location(df):
+        df["name"] = ["changed"]
+        return df
+
+    mock_get_dim_location.side_effect = get_dim_location
+    mock_get_dim_counterparty.side_effect = lambda df, df_address: df_address
+    outputs = ["dim_location", "dim_counterparty"]
+    assert run_transforms(S3_MOCK_BUCKET_NAME, "process", outputs, 2) == outputs
+    assert mock_get_dataframe_from_bytes.call_count == 2
+    df_counterparty, df_address = mock_get_dim_counterparty.call_args.args
+    assert list(df_counterparty["name"]) == ["counterparty"]
+    assert list(df_address["name"]) == ["address"]
+    assert mock_store_parquet_file.call_count == 2
+
+
+@patch("src.process.store_dim_date_index")
+@patch("src.process.store_parquet_file")
+@patch("src.process.get_dim_date")
+@patch("src.process.get_fact_payment")
+@patch("src.process.get_dataframe_from_table_json")
+def test_run_transforms_passes_facts_to_dim_date(
+    mock_get_dataframe,
+    mock_get_fact_payment,
+    mock_get_dim_date,
+    mock_store_parquet_file,
+    mock_store_dim_date_index,
+):
+    fact_payment = pd.DataFrame({"payment_id": [1]})
+    dim_date = pd.DataFrame({"date_id": []})
+    mock_get_fact_payment.return_value = fact_payment
+    mock_get_dim_date.return_value = dim_date
+    run_transforms("ingest", "process", ["fact_payment", "dim_date"], 4)
+    mock_get_dim_date.assert_called_once_with("process", None, fact_payment, None)
+    mock_store_dim_date_index.assert_called_once_with("process", dim_date)
+
+
+@patch("src.process.store_dim_date_index")
+@patch("src.process.store_parquet_file")
+@patch("src.process.get_dim_date")
+@patch("src.process.get_fact_payment")
+@patch("src.process.get_dataframe_from_table_json")
+def test_run_transforms_skips_unchanged_tables(
+    mock_get_dataframe,
+    mock_get_fact_payment,
+    mock_get_dim_date,
+    mock_store_parquet_file,
+    mock_store_dim_date_index,
+):
+    mock_get_fact_payment.return_value = pd.DataFrame({"payment_id": [1]})
+    mock_get_dim_date.return_value = None
+    outputs = run_transforms("ingest", "process", ["fact_payment", "dim_date"])
+    assert outputs == ["fact_payment"]
+    assert mock_store_parquet_file.call_count == 1
+    mock_store_dim_date_index.assert_not_called()